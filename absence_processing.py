@@ -2,51 +2,24 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function
+import argparse
+import csv
 import json
-import questionary
-import pandas as pd
 from pathlib import Path
-import tempfile
-from thefuzz import fuzz
 import os
-import pickle
-import sys
-sys.setrecursionlimit(10000) # required for making pickling work TODO: remove this later
+import os.path
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from enum import Enum
 
-
-# Google Sheets related imports
-import os.path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
-
-#Canvas API related imports
-from canvasapi import Canvas
-
-# Gradescope related imports
-from gradescope_api.pyscope import *
-GRADESCOPE_USERNAME = os.environ.get("GRADESCOPE_USERNAME")
-GRADESCOPE_PASSWORD = os.environ.get("GRADESCOPE_PASSWORD")
-if not GRADESCOPE_USERNAME or not GRADESCOPE_PASSWORD:
-    # prompt the user to enter the Gradescope username and password
-    try:
-        GRADESCOPE_USERNAME = questionary.text("Enter your Gradescope username:").ask()
-        GRADESCOPE_PASSWORD = questionary.password("Enter your Gradescope password:").ask()
-        print("For future convenience, I am saving your username and password in your shellrc files. " \
-              "Next time you run the script, first reload your shell by closing and re-opening the terminal")
-        # save the username and password in the shellrc files
-        with open(os.path.expanduser('~/.bashrc'), 'a') as f:
-            f.write(f"export GRADESCOPE_USERNAME='{GRADESCOPE_USERNAME}'\n")
-            f.write(f"export GRADESCOPE_PASSWORD='{GRADESCOPE_PASSWORD}'\n")
-        with open(os.path.expanduser('~/.zshrc'), 'a') as f:
-            f.write(f"export GRADESCOPE_USERNAME='{GRADESCOPE_USERNAME}'\n")
-            f.write(f"export GRADESCOPE_PASSWORD='{GRADESCOPE_PASSWORD}'\n")
-    except KeyboardInterrupt:
-        print("Skipping saving the username and password in your shellrc files.")
+# The heavy dependencies (pandas, questionary, the Google, Canvas and Gradescope clients) are imported in the
+# functions that use them, so that the commands which don't need them (status, plan) start quickly.
+# benchmarks/check_importtime.py keeps an eye on it
+from metadata_store import MetadataStore, METADATA_DB
+from responses import ALREADY_PROCESSED, PROCESSED_STATUSES
+from sheets import RESPONSES_CSV, ROW_COLUMN
 
 
 # Globals
@@ -58,6 +31,25 @@ DESIRED_ROW_RANGES = [[79, 80], [620, 669], [1015, 1049], [1340, 1374], [1685, 1
                       ] #These rows are allocated to me
 GOOGLE_SHEET_ID = "1_m7eO_dYJjXwajyGFqEwn7GB4LmbDOMk0Ru6ALLpBfY"
 GOOGLE_SHEET_RANGE = "Form Responses 1!A:T"
+LATE_DAY_POOL = 10 # late days of a student for the whole semester
+MAX_LATE_DAYS_PER_HW = 4
+BATCH_WORKERS = 4 # students processed in parallel in batch mode
+GRADESCOPE_RATE_LIMIT = 10 # requests per second to Gradescope (None: no limit)
+ARCHIVE_CACHE = None # downloaded submission zips, see archive_cache()
+ARCHIVE_CACHE_LOCK = threading.Lock()
+
+
+def archive_cache():
+    '''
+    Returns the local store of downloaded submission zips (see gradescope_api/archive_cache.py)
+    '''
+    global ARCHIVE_CACHE
+    with ARCHIVE_CACHE_LOCK:
+        if ARCHIVE_CACHE is None:
+            from gradescope_api.archive_cache import SubmissionArchiveCache
+            ARCHIVE_CACHE = SubmissionArchiveCache()
+    return ARCHIVE_CACHE
+
 
 def questionary_select(objs: dict, prompt="Make a choice:"):
     '''
@@ -67,6 +59,7 @@ def questionary_select(objs: dict, prompt="Make a choice:"):
           Values are actual objects to be selected
     prompt: str: The prompt string
     '''
+    import questionary
     keys = list(objs.keys())
     choices = [str(index)+"___"+choice for index, choice in enumerate(keys)]
     selected = questionary.select(
@@ -76,10 +69,13 @@ def questionary_select(objs: dict, prompt="Make a choice:"):
     return objs[keys[selected]]
 
 
-def gsheets(sheetID, sheetRange) -> list:
+def gsheets(sheetID, sheetRange, row_ranges, full=False) -> bool:
     '''
-    Gets the Google Sheet
+    Downloads the rows of the Google Sheet that we process into absence.csv (only what changed since the last
+    download, see sheets.py, unless full)
     '''
+    from googleapiclient.errors import HttpError
+    from sheets import sheets_service, ResponsesSheet
     # check if google_credentials.json exists. If it does, exit the program
     if not os.path.exists('google_credentials.json'):
         print("You gotta get the google_credentials.json file from the Google API Console. \
@@ -87,46 +83,29 @@ def gsheets(sheetID, sheetRange) -> list:
         print("Download the file and place it in the current folder, and name it google_credentials.json")
         raise SystemExit(101)
 
-    creds = None
-    # The file google_token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first time
-    if os.path.exists('google_token.json'):
-        creds = Credentials.from_authorized_user_file('google_token.json', SCOPES)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'google_credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open('google_token.json', 'w') as token:
-            token.write(creds.to_json())
-
     try:
-        service = build('sheets', 'v4', credentials=creds)
-
-        sheet = service.spreadsheets()
-        result = sheet.values().get(spreadsheetId=sheetID, range=sheetRange).execute()
-        values = result.get('values', [])
-
-        df = pd.DataFrame(values[1:], columns=values[0])
-        return df
+        new_rows = ResponsesSheet(sheets_service(), sheetID, sheetRange, RESPONSES_CSV).load(row_ranges, full)
+        print(f"Downloaded {new_rows} new rows")
+        return True
 
     except HttpError as err:
         print(err)
-        return None
+        return False
 
 
-def canvas_init():
+def canvas_connect(interactive=True):
     '''
-    Initializes the canvas object and returns the course object, and the userdb
+    Initializes and returns the canvas object
     '''
+    import questionary
+    from canvasapi import Canvas
 
     if os.path.exists('canvas_token.json'):
         with open('canvas_token.json', 'r') as f:
             API_KEY = json.load(f)['API_KEY']
+    elif not interactive:
+        print("The Canvas API key is missing. Run the script interactively once to save it in canvas_token.json")
+        raise SystemExit(101)
     else:
         API_KEY = questionary.password("Enter your Canvas API key:").ask()
         print("This key is being saved for future use in the current folder inside canvas_token.json file. Make sure it stays safe.")
@@ -134,8 +113,13 @@ def canvas_init():
             json.dump({"API_KEY": API_KEY}, f)
 
     API_URL = "https://canvas.tamu.edu"
-    canvas = Canvas(API_URL, API_KEY)
+    return Canvas(API_URL, API_KEY)
 
+def canvas_select_course(canvas):
+    '''
+    Prompts the user for the Canvas course and returns it
+    '''
+    import questionary
     # select course given a fixed ID
     course = canvas.get_course(258305) #CSCE 120/121 at TAMU
 
@@ -152,19 +136,27 @@ def canvas_init():
         selected = int(selected.split('___')[0])
         course = courses[selected]
 
-    #Preparing the USER-DB, a dict of the form: {id: {'name': name, 'email': email}}
+    return course
+
+def canvas_load_userdb(course):
+    '''
+    Loads the users of a Canvas course
+    '''
+    #Preparing the USER-DB, a dict of the form: {id: {'name': name, 'email': email, 'uin': uin}}
     users = course.get_users()
     userdb = {}
     for user in users:
         userdb[user.id] = {'name': user.short_name, 
-                           'email': user.email}
+                           'email': user.email,
+                           'uin': getattr(user, 'sis_user_id', None)}
 
-    return course, userdb
+    return userdb
 
-def canvas_get_assignment_submissions(course, prompt="Select assignment:") -> list:
+def canvas_get_assignment_submissions(course, prompt="Select assignment:") -> tuple:
     '''
-    Returns submissions for an assignment for a course
+    Returns an assignment of a course, and its submissions
     '''
+    import questionary
     #Getting asses and selecting one of them
 
     ass = course.get_assignment(1796405) #HW late tracker assignment
@@ -172,7 +164,7 @@ def canvas_get_assignment_submissions(course, prompt="Select assignment:") -> li
         print("Alrighty then. Loading the submissions for this HW. Give me a few seconds.")
         subs = [] #Submissions
         subs += ass.get_submissions(include="submission_comments")
-        return subs
+        return ass, subs
 
     print("Alright then. Loading the Canvas assignments for you. This may take a few seconds.")
     asses = list(course.get_assignments())
@@ -187,16 +179,59 @@ def canvas_get_assignment_submissions(course, prompt="Select assignment:") -> li
     for ass in asses:
         subs += ass.get_submissions(include="submission_comments")
 
-    return subs
+    return asses[0], subs
 
 
-def gradescope_init():
+def gradescope_credentials():
+    '''
+    Returns the Gradescope username and password, from the environment or (the first time) from a prompt
+    '''
+    username = os.environ.get("GRADESCOPE_USERNAME")
+    password = os.environ.get("GRADESCOPE_PASSWORD")
+    if not username or not password:
+        import questionary
+        # prompt the user to enter the Gradescope username and password
+        try:
+            username = questionary.text("Enter your Gradescope username:").ask()
+            password = questionary.password("Enter your Gradescope password:").ask()
+            print("For future convenience, I am saving your username and password in your shellrc files. " \
+                  "Next time you run the script, first reload your shell by closing and re-opening the terminal")
+            # save the username and password in the shellrc files
+            with open(os.path.expanduser('~/.bashrc'), 'a') as f:
+                f.write(f"export GRADESCOPE_USERNAME='{username}'\n")
+                f.write(f"export GRADESCOPE_PASSWORD='{password}'\n")
+            with open(os.path.expanduser('~/.zshrc'), 'a') as f:
+                f.write(f"export GRADESCOPE_USERNAME='{username}'\n")
+                f.write(f"export GRADESCOPE_PASSWORD='{password}'\n")
+        except KeyboardInterrupt:
+            print("Skipping saving the username and password in your shellrc files.")
+    return username, password
+
+
+def gradescope_connect(workers=1, rate_limit=GRADESCOPE_RATE_LIMIT, http_cache=None):
+    '''
+    workers: the number of threads that will use the connection, to size its connection pool
+    http_cache: the path of the HTTP cache of the Gradescope pages (default: $GRADESCOPE_HTTP_CACHE, no cache if unset)
+    '''
+    from gradescope_api.pyscope import GSConnection
+    from gradescope_api.http_transport import POOL_SIZE
+
+    username, password = gradescope_credentials()
+    http_cache = http_cache or os.environ.get('GRADESCOPE_HTTP_CACHE')
+    cache = None
+    if http_cache:
+        from gradescope_api.http_cache import HTTPCache
+        cache = HTTPCache(http_cache)
+    conn = GSConnection(pool_size=max(POOL_SIZE, workers), rate_limit=rate_limit, cache=cache)
+    # reuses the session of a previous run when it is still alive, logs in otherwise
+    if not conn.resume(username, password):
+        print("Could not log in to Gradescope. Check your username and password.")
+        raise SystemExit(102)
+    print(conn.state)
+    return conn
 
-    conn = GSConnection()
-    conn.login(GRADESCOPE_USERNAME, GRADESCOPE_PASSWORD)
 
-    print(conn.state)
-    conn.get_account()
+def gradescope_select_course(conn):
 
     courses = []
     #conn.account.instructor_courses is a dict. Iterate over its key and value
@@ -208,31 +243,15 @@ def gradescope_init():
     course = questionary_select(choices, "Select the Gradescope course:")
 
     # course = conn.account.instructor_courses['569119']
-    course._lazy_load_assignments()
-
-    # ass = course.assignments['[HW Redemption] Image Scaling']
     return course
 
 
-# Function to find the best match using fuzzywuzzy
-def find_best_match(variant, originals) -> (str, int):
-    '''
-    variant: The variant string
-    originals: The list of original strings to compare against
-    '''
-    best_match, highest_score = None, 0
-    for original in originals:
-        if original.lower() in variant.lower():
-            return original, 100
-        score = fuzz.ratio(original, variant)
-        if score > highest_score:
-            best_match, highest_score = original, score
-    return best_match, highest_score
-
-
-def gsheets_init(gs_ass_mapping):
+def gsheets_init(gs_ass_mapping, download=None, row_ranges=DESIRED_ROW_RANGES, full=False):
     '''
     Loads the data from GSheets and returns the dataframe containing unprocessed absences
+    download: whether to download the latest data from Google Sheets (asked if None)
+    row_ranges: the rows of the sheet to process
+    full: download every row again instead of only what changed
     '''
     '''
     df.columns
@@ -249,17 +268,23 @@ def gsheets_init(gs_ass_mapping):
     '''
     # types of requests:
     #  ['Homework Late Day Pool' 'Excused Absence' 'Labwork Free Absence']
-    get = questionary.confirm("Do you want to download the latest data from Google Sheets? " \
-                              "You will need to have the google_credentials.json file in the current folder.").ask()
+    import pandas as pd
+    import questionary
+    from matching import NameMatcher
+    from responses import clean_responses
+    from sheets import read_response_keys
+
+    get = download
+    if get is None:
+        get = questionary.confirm("Do you want to download the latest data from Google Sheets? " \
+                                  "You will need to have the google_credentials.json file in the current folder.").ask()
     if get:
         # Get the latest data from Google Sheets
         print("Getting the latest data from Google Sheets...")
         # Get the latest data from Google Sheets
         sheetID = GOOGLE_SHEET_ID
         sheetRange = GOOGLE_SHEET_RANGE
-        df = gsheets(sheetID, sheetRange)
-        if df is not None:
-            df.to_csv("absence.csv", index=False)
+        if gsheets(sheetID, sheetRange, row_ranges, full):
             print("Data saved to absence.csv")
         else:
             print("Error getting data from Google Sheets")
@@ -272,42 +297,21 @@ def gsheets_init(gs_ass_mapping):
         print("Using existing data in absence.csv")
 
     df = pd.read_csv("absence.csv")
-    df.index = df.index + 2 # to make sure that the index matches the row number in Google Sheets
+    if ROW_COLUMN in df.columns:
+        df = df.set_index(ROW_COLUMN) # the row numbers in Google Sheets
+    else:
+        df.index = df.index + 2 # to make sure that the index matches the row number in Google Sheets
     df.fillna('', inplace=True)
 
     # First, required clean-up  of the Google Sheets data because students have added varying names for same Homeworks
-    # these intermediary names help in mapping HW names in Google Sheet to HW names in Gradescope
-    # If the mapping fails, then it won't process that HW
-    # NOTE: How these tokens work is that each token name is a unique substring of the actual HW name. 
-    #       This helps in mapping the HW names in Google Sheet (in which students may have used partial HW names) 
-    # TODO: Make this data cleaning more robust
-    homework_name_tokens = [ "Scaling", "Stitching", "String", "Grade", "Dungeon", "Crawler", 
-                            "CPPeers", "CPPers", "Rover", "Temperature", "Paris", "Debugging", "Mountain", "Valley" ]
-    # refine the column Homework Name using intermediary tokens and mapping
-    def refine_homework_name(x):
-        for token in homework_name_tokens:
-            if token.lower() in x.lower():
-                best_match, _ = find_best_match(token, gs_ass_mapping.keys())
-                return best_match
-        return x
-    df["Homework Name"] = df["Homework Name"].apply(lambda x: refine_homework_name(x))
-
-    # getting the rows which are to be processed
-    dfs = []
-    for row_range in DESIRED_ROW_RANGES:
-        dfs.append(df.loc[row_range[0]:row_range[1]])
-    newdf = pd.concat(dfs)
-    newdf = newdf[newdf["Type of request"] == "Homework Late Day Pool"]
-    newdf = newdf[newdf["Request Processed"] != "Yes"]
-    newdf = newdf[newdf["Request Processed"] != "Pending"]
-    newdf = newdf[newdf["Request Processed"] != "No"]
-
-    # remove rows if there are more than one row with the same email and homework name
-    df = df.drop_duplicates(subset=["Email Address", "Homework Name"], keep=False)
-
-    # getting the rows which are already processed
-    donedf = df[df["Request Processed"].isin(["Yes", "Pending", "No"])]
-    #  donedf = donedf[donedf["Type of request"] == "Homework Late Day Pool"]
+    # (see responses.py). Each homework name token is resolved to the Gradescope HW name once
+    # The requests processed in the other rows of the sheet (by other TAs) are looked up in absence_keys.csv
+    keys = read_response_keys()
+    if keys is None:
+        print("absence_keys.csv is missing: only the downloaded rows are checked for requests already processed. "
+              "Download the latest data to check the whole sheet.")
+    matcher = NameMatcher(gs_ass_mapping.keys())
+    newdf, donedf = clean_responses(df, lambda token: matcher.match(token)[0], row_ranges, keys=keys)
 
     # reporting the rows in df, donedf, and newdf
     print(f"Total requests: {df.shape[0]}")
@@ -319,28 +323,65 @@ def gsheets_init(gs_ass_mapping):
 
 
 
-def process_late_hw(row, gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping, 
-                    canvas_late_submissions, userdb):
+class Status(Enum):
+    PROCESSED = 'processed'
+    SKIPPED = 'skipped'          # already processed according to the sheet
+    INELIGIBLE = 'ineligible'    # no redemption submission in time, or no late days left
+    REVIEW = 'review'            # needs a human decision
+    FAILED = 'failed'
+
+
+class Outcome():
+    '''
+    The outcome of processing one row of the sheet. Truthy only when the row was processed.
+    '''
+    def __init__(self, status, reason='', row=None, **details):
+        self.status = status
+        self.reason = reason
+        self.row = row
+        self.details = details
+
+    def __bool__(self):
+        return self.status == Status.PROCESSED
+
+    def to_dict(self):
+        return {'row': int(self.row) if self.row is not None else None, 'status': self.status.value, 'reason': self.reason, **self.details}
+
+
+def process_late_hw(row, gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping, ledger,
+                    interactive=True, late_day_pool=LATE_DAY_POOL, max_late_days=MAX_LATE_DAYS_PER_HW) -> Outcome:
     '''
     Process late homework
+    interactive: if False, never prompt; cases that need a human decision are returned with Status.REVIEW
+    late_day_pool: the number of late days a student has for the whole semester
+    max_late_days: the maximum number of late days for one homework
     '''
+    import questionary
+    from matching import NameMatcher
+
     # get the assignment name
+    index = row.name
     hw_name = row['Homework Name']
     email = row['Email Address']
 
+    def outcome(status, reason='', **details):
+        if reason:
+            print(reason)
+        return Outcome(status, reason, row=index, email=email, name=row['Name'], homework=hw_name, **details)
+
     # get the Gradescope HW name using intermediary tokens
     while True:
         if hw_name not in gs_assignments_actual.keys():
             print(f"Can't process Homework Late Day Pool for {row['Name']}. \
                      Because I can't understand this HW name: {hw_name} ")
-            if questionary.confirm("Can you tell me the HW name they intended?").ask():
+            if interactive and questionary.confirm("Can you tell me the HW name they intended?").ask():
                 token = questionary.text("Tell me then: ").ask()
-                token, _ = find_best_match(token, gs_assignments_actual.keys())
+                token, _ = NameMatcher(gs_assignments_actual.keys()).match(token)
                 if questionary.confirm(f"Is this the HW name you intended: {token} ").ask():
                     hw_name = token
                     break
             else:
-                return False
+                return outcome(Status.REVIEW, f"Unknown homework name: {hw_name}")
         else:
             break
 
@@ -348,19 +389,18 @@ def process_late_hw(row, gs_assignments_actual, gs_assignments_redemption, gs_as
     hw_actual = gs_assignments_actual[hw_name]
     hw_redemption = gs_assignments_redemption[gs_ass_mapping[hw_name]]
 
-    # get the late days from canvas by matching user email
-    canvas_sub = next(sub for sub in canvas_late_submissions if email == userdb[sub.user_id]['email'])
-    if not canvas_sub.score:
-        late_score = 0
+    # get the late days from canvas by matching user email (or UIN)
+    canvas_sub = ledger.find(email=email, uin=row.get('UIN'))
+    if canvas_sub is None:
+        return outcome(Status.REVIEW, f"Can't find {email} in the Canvas late day tracker.")
+    late_score = ledger.used(canvas_sub)
+    late_remaining = late_day_pool - late_score
+    if late_remaining >= max_late_days:
+        maxdate = hw_actual.due_date + timedelta(days=max_late_days)
+        print(f"This user has total {late_remaining} late days remaining out of {late_day_pool}."\
+              f"Hence I will search for redemption for upto {max_late_days} late days")
     else:
-        late_score = int(canvas_sub.score)
-    late_remaining = 10 - late_score
-    if late_remaining >=4:
-        maxdate = hw_actual.due_date + timedelta(days=4)
-        print(f"This user has total {late_remaining} late days remaining out of 10."\
-              f"Hence I will search for redemption for upto 4 late days")
-    else:
-        print(f"This user has total {late_remaining} late days remaining out of 10."\
+        print(f"This user has total {late_remaining} late days remaining out of {late_day_pool}."\
               f"Hence I will search for redemption for upto {late_remaining} late days")
         maxdate = hw_actual.due_date + timedelta(days=late_remaining)
 
@@ -370,39 +410,32 @@ def process_late_hw(row, gs_assignments_actual, gs_assignments_redemption, gs_as
         # Make this better and more "functional".
         submission_redemption = hw_redemption.get_submission(email=email, maxdate=maxdate)
         if not submission_redemption:
-            print(f"This student: {email} either did not submit a redemption homework, or submitted it too late!")
-            return False
+            return outcome(Status.INELIGIBLE,
+                           f"This student: {email} either did not submit a redemption homework, or submitted it too late!")
         submission_actual = hw_actual.get_submission(email=email)
         if submission_actual:
             if submission_actual.score >= submission_redemption.score:
-                print("This homework has probably been processed." \
-                      "I see that there is a submission already uploaded on the original homework," \
-                      "which has a score greater than or equal to the redemption HW")
                 print(f"Check the Original (old) Submission here: {submission_actual.url}")
                 print(f"Check Redemption Submission here: {submission_redemption.url}")
-                return False
-        print("Downloading the submission ZIP from Redemption HW")
-        submission_zip_resp = course_gs.session.get('https://www.gradescope.com/courses/'+
-                                                    course_gs.cid+'/assignments/'+hw_redemption.aid+
-                                                    '/submissions/'+submission_redemption.subid+'.zip')
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_file:
-            temp_file.write(submission_zip_resp.content)
-            temp_file_path = temp_file.name  # Store the temporary file path
+                return outcome(Status.REVIEW, "This homework has probably been processed." \
+                               "I see that there is a submission already uploaded on the original homework," \
+                               "which has a score greater than or equal to the redemption HW",
+                               actual_url=submission_actual.url, redemption_url=submission_redemption.url)
 
         # Compare the submission time of the submission with the due date of actual homework
-        # if the submission is within the 4 days after due date, then we can post the submission
+        # if the submission is within max_late_days after due date, then we can post the submission
         time_diff = submission_redemption.time - hw_actual.due_date
         late_days = time_diff.days + 1
-        if late_days > 4:
-            print(f"Submission for {row['Name']} that I fetched with the highest score is not within 4 days of due date")
+        if late_days > max_late_days:
+            print(f"Submission for {row['Name']} that I fetched with the highest score is not within {max_late_days} days of due date")
             if submission_actual:
                 print(f"Check the Original (old) Submission here: {submission_actual.url}")
             print(f"Check Redemption Submission here: {submission_redemption.url}")
-            if questionary.confirm("Do you want to try again with an older, possibly lower scoring submission from the Redemption HW?").ask():
-                maxdate = hw_actual.due_date + timedelta(days=4)
+            if interactive and questionary.confirm("Do you want to try again with an older, possibly lower scoring submission from the Redemption HW?").ask():
+                maxdate = hw_actual.due_date + timedelta(days=max_late_days)
                 continue
-            os.remove(temp_file_path)
-            return False
+            return outcome(Status.REVIEW, f"The highest scoring redemption submission is {late_days} days late",
+                           redemption_url=submission_redemption.url)
         break
 
     if submission_actual:
@@ -411,103 +444,360 @@ def process_late_hw(row, gs_assignments_actual, gs_assignments_redemption, gs_as
         print("No existing submission found for this student in the actual HW.")
     print(f"Check Redemption Submission here: {submission_redemption.url}")
 
-    # get the late days from canvas by matching user email
-    canvas_sub = next(sub for sub in canvas_late_submissions if email == userdb[sub.user_id]['email'])
-    if not canvas_sub.score:
-        late_score = 0
-    else:
-        late_score = int(canvas_sub.score)
-    if late_score + late_days > 10:
-        print(f"Can't process Homework Late Day Pool for {row['Name']}. They have used up all of their late days.\
-                Late days requested: {late_days}, Total Late days already used: {late_score}")
-        os.remove(temp_file_path)
-        return False
+    if late_score + late_days > late_day_pool:
+        return outcome(Status.INELIGIBLE, f"Can't process Homework Late Day Pool for {row['Name']}. They have used up all of their late days.\
+                Late days requested: {late_days}, Total Late days already used: {late_score}", late_days=late_days)
 
     print(f"Processing Homework Late Day Pool for {row['Name']}. \
             Late days requested: {late_days}, Total Late days already used: {late_score}")
     
-    # Now we have the zip file from Redemption HW. We gotta transfer it to Actual
-    print("Uploading the submission ZIP to actual HW")
-    new_submission = hw_actual.post_submission(temp_file_path, submission_redemption.student_id)
+    # Now we transfer the zip file from Redemption HW to Actual. The zip is kept in the local archive store,
+    # so retries and reruns do not download it again, and it is streamed straight into the upload
+    print("Getting the submission ZIP from Redemption HW")
+    with hw_redemption.get_submission_archive(submission_redemption.subid, archive_cache()) as submission_zip:
+        print("Uploading the submission ZIP to actual HW")
+        new_submission = hw_actual.post_submission(submission_zip, submission_redemption.student_id)
     if new_submission:
         print(f"Successfully posted submission for {row['Name']} with rowNum: {index} at url: {new_submission.url}")
     else:
-        print(f"Failed to post submission for {row['Name']} with rowNum: {index}")
-        os.remove(temp_file_path)
-        return False
+        return outcome(Status.FAILED, f"Failed to post submission for {row['Name']} with rowNum: {index}",
+                       late_days=late_days)
 
     # compare the scores of the two submissions; if they aren't equal, then something went wrong
     if new_submission.score != submission_redemption.score:
-        print(f"Score of new submission ({new_submission.score}) is not equal to score of old submission ({submission_redemption.score}). Exiting.")
-        os.remove(temp_file_path)
-        return False
+        return outcome(Status.REVIEW, f"Score of new submission ({new_submission.score}) is not equal to score of old submission ({submission_redemption.score}).",
+                       late_days=late_days, submission_url=new_submission.url, redemption_url=submission_redemption.url)
     
-    # Now we update the late days score in Canvas, along with the comments
+    # Now we queue the late days score update for Canvas, along with the comments. All the updates of a run
+    # are posted together at the end (see flush_late_days)
     comments = f"{hw_name}: late by {late_days} days."
-    if canvas_sub.edit(submission={'posted_grade': late_score+late_days}, comment={'text_comment':comments}):
-    # if canvas_sub.edit(submission={'posted_grade': late_score+late_days, 'comment[text_comment]': comments}):
-        print(f"Successfully updated Canvas submission for {row['Name']} with rowNum: {index}")
-        print("Everything has been done for this one. You may now update the Google Sheet entry for this one.")
-        os.remove(temp_file_path)
-        return True
-    else:
-        print(f"Failed to update Canvas submission for {row['Name']} with rowNum: {index}")
-        return False
+    ledger.stage(canvas_sub, late_score+late_days, comments, row=index)
+    print(f"Queued the Canvas late days update for {row['Name']} with rowNum: {index}")
+    return outcome(Status.PROCESSED, late_days=late_days, submission_url=new_submission.url)
+
+
+# What is written to the "Request Processed" column for each outcome (the others are left alone)
+SHEET_STATUS = {Status.PROCESSED: 'Yes', Status.INELIGIBLE: 'No', Status.REVIEW: 'Pending'}
+
+def write_back_statuses(outcomes, service=None):
+    '''
+    Writes the status of the processed rows back to the Google Sheet, in one batch
+    service (optional): the Google Sheets service to use, instead of one with write access to the real sheet
+    Returns the rows written, and the rows skipped because someone else changed them
+    '''
+    from sheets import sheets_service, StatusWriter, StatusWriteError, WRITE_SCOPES, WRITE_TOKEN_PATH
+
+    if service is None:
+        service = sheets_service(WRITE_SCOPES, WRITE_TOKEN_PATH)
+    writer = StatusWriter(service, GOOGLE_SHEET_ID, GOOGLE_SHEET_RANGE, RESPONSES_CSV)
+    for outcome in outcomes:
+        if outcome.status not in SHEET_STATUS:
+            continue
+        if outcome.status == Status.PROCESSED:
+            details = f"{outcome.details['late_days']} late days used"
+        else:
+            details = outcome.reason
+        writer.update(outcome.row, {'Request Processed': SHEET_STATUS[outcome.status], 'Post Request Details': details})
+    try:
+        written, conflicts = writer.flush()
+    except StatusWriteError as e:
+        print(f"Did not update the Google Sheet: {e}")
+        return [], {}
+    print(f"Updated {len(written)} rows in the Google Sheet")
+    for row, values in conflicts.items():
+        print(f"Did not update row {row}: it was changed in the Google Sheet in the meantime ({values})")
+    return written, conflicts
+
+
+def flush_late_days(ledger, outcomes=()):
+    '''
+    Posts the queued late days updates to Canvas
+    outcomes: the outcomes of the run; those whose update failed are marked as failed, and those whose update
+              timed out without showing up in Canvas yet are sent to review (posting them again could count
+              the late days twice)
+    Returns a dict of row -> reason for the rows whose update failed
+    '''
+    if not ledger.pending:
+        return {}
+    print(f"Posting the late days of {len(ledger.pending)} students to Canvas...")
+    failures = ledger.flush()
+    for row, reason in failures.items():
+        print(f"Failed to update Canvas submission for rowNum: {row}: {reason}")
+    for row, reason in ledger.unconfirmed.items():
+        print(f"Check the Canvas late days of rowNum: {row} before processing it again: {reason}")
+    for outcome in outcomes:
+        if outcome.row in failures:
+            outcome.status = Status.FAILED
+            outcome.reason = f"Canvas update failed: {failures[outcome.row]}"
+        elif outcome.row in ledger.unconfirmed:
+            outcome.status = Status.REVIEW
+            outcome.reason = f"Canvas update not confirmed: {ledger.unconfirmed[outcome.row]}"
+    if not failures and not ledger.unconfirmed:
+        print("Successfully updated the Canvas late days. You may now update the Google Sheet entries.")
+    return failures
+
+
+def map_redemption_assignments(assignments):
+    '''
+    Returns the Actual -> Redemption assignment name mapping of a Gradescope course's assignments
+    '''
+    from matching import NameMatcher
+
+    redemption = [ass_name for ass_name in assignments.keys() if "Redemption" in ass_name]
+    remaining = [ass_name for ass_name in assignments.keys() if "Redemption" not in ass_name]
+    matcher = NameMatcher(remaining)
+    gs_ass_mapping = {}
+    for redemption_ass in redemption:
+        ass_name, _ = matcher.match(redemption_ass)
+        gs_ass_mapping[ass_name] = redemption_ass
+    return gs_ass_mapping
 
 
 def init():
     '''
     The main init
+    Course metadata is kept in the local metadata store (see metadata_store.py), so only what is
+    missing or stale is loaded from Gradescope and Canvas.
     '''
-    pickle_use = False
-    # check if data.pkl exists. If it does, load it. If not, initialize everything
-    if Path('data.pkl').is_file():
-        pickle_use = questionary.confirm("Do you want to load the data from an existing data.pkl?").ask()
-        if pickle_use:
-            with open('data.pkl', 'rb') as f:
-                course_gs, gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping, course_canvas, userdb = pickle.load(f)
-
-    if not pickle_use:
-        # Gradescope Init Stuff
-        while True:
-            course_gs = gradescope_init()
-            print(f'You selected "{course_gs.shortname}" for the semester {course_gs.year}')
-            if questionary.confirm("Is this the correct Gradescope course?").ask():
-                break
-            else:
-                print("Please select the correct course.")
-                continue
-        gs_assignments_redemption = {ass_name : ass for ass_name, ass in course_gs.assignments.items() if "Redemption" in ass_name}
-        gs_assignments_remaining = {ass_name : ass  for ass_name, ass in course_gs.assignments.items()  if "Redemption" not in ass_name}
-        gs_assignments_actual = {}
-        gs_ass_mapping = {} # Actual -> Redemption Assignment mapping
-        for redemption_ass in gs_assignments_redemption.keys():
-            ass_name, _ = find_best_match(redemption_ass, gs_assignments_remaining.keys())
-            gs_assignments_actual[ass_name] = gs_assignments_remaining[ass_name]
-            gs_ass_mapping[ass_name] = redemption_ass
-
-        # Canvas Init Stuff
-        course_canvas, userdb = canvas_init()
-
-    with open('data.pkl', 'wb') as f:
-        pickle.dump([course_gs, gs_assignments_actual, gs_assignments_redemption, 
-                     gs_ass_mapping, course_canvas, userdb], f)
+    import questionary
+
+    store = MetadataStore()
+
+    # Gradescope Init Stuff
+    conn = gradescope_connect()
+    course_gs = conn.account.instructor_courses.get(store.get_setting('gs_course_id'))
+    if course_gs is not None and not questionary.confirm(
+            f'Continue with the Gradescope course "{course_gs.shortname}" for the semester {course_gs.year}?').ask():
+        course_gs = None
+    while course_gs is None:
+        course_gs = gradescope_select_course(conn)
+        print(f'You selected "{course_gs.shortname}" for the semester {course_gs.year}')
+        if not questionary.confirm("Is this the correct Gradescope course?").ask():
+            print("Please select the correct course.")
+            course_gs = None
+    store.set_setting('gs_course_id', course_gs.cid)
+    gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping = gradescope_load_assignments(store, course_gs)
+
+    # Canvas Init Stuff
+    canvas = canvas_connect()
+    canvas_course_id = store.get_setting('canvas_course_id')
+    stored_course = store.get_canvas_course(int(canvas_course_id)) if canvas_course_id else None
+    if stored_course and questionary.confirm(f'Continue with the Canvas course "{stored_course[1]}"?').ask():
+        course_canvas = canvas.get_course(stored_course[0])
+    else:
+        course_canvas = canvas_select_course(canvas)
+    store.set_setting('canvas_course_id', course_canvas.id)
+    userdb = canvas_userdb(store, course_canvas)
 
+    store.close()
     return course_gs, gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping, course_canvas, userdb
 
 
-if __name__ == '__main__':
+def gradescope_load_assignments(store, course_gs, assignment_ids=None):
+    '''
+    Loads the assignments of a Gradescope course (from the metadata store while they are fresh)
+    assignment_ids (optional): dict of Actual -> Redemption assignment ids, instead of matching them by name
+    Returns the actual assignments, the redemption assignments and the Actual -> Redemption name mapping
+    '''
+    assignments = store.get_gs_assignments(course_gs.cid)
+    if assignments is None:
+        print("Loading the Gradescope assignments...")
+        course_gs._lazy_load_assignments()
+        store.save_gs_course(course_gs)
+    else:
+        course_gs._load_assignments_from(assignments)
+
+    if assignment_ids:
+        by_aid = {ass.aid: ass for ass in course_gs.assignments.values()}
+        unknown = [str(aid) for pair in assignment_ids.items() for aid in pair if str(aid) not in by_aid]
+        if unknown and assignments is not None:
+            # the stored assignments may predate them
+            print("Reloading the Gradescope assignments...")
+            course_gs.assignments = {}
+            course_gs._lazy_load_assignments()
+            store.save_gs_course(course_gs)
+            by_aid = {ass.aid: ass for ass in course_gs.assignments.values()}
+            unknown = [aid for aid in unknown if aid not in by_aid]
+        if unknown:
+            print(f"The assignment_ids of the batch config name assignments that are not in the Gradescope course "
+                  f"{course_gs.cid}: {', '.join(unknown)}")
+            raise SystemExit(103)
+        gs_ass_mapping = {by_aid[str(actual)].name: by_aid[str(redemption)].name
+                          for actual, redemption in assignment_ids.items()}
+    else:
+        gs_ass_mapping = store.get_assignment_mapping(course_gs.cid) # Actual -> Redemption Assignment mapping
+    if gs_ass_mapping is None or \
+            any(name not in course_gs.assignments for pair in gs_ass_mapping.items() for name in pair):
+        gs_ass_mapping = map_redemption_assignments(course_gs.assignments)
+        store.save_assignment_mapping(course_gs.cid, gs_ass_mapping)
+    gs_assignments_redemption = {ass_name : course_gs.assignments[ass_name] for ass_name in gs_ass_mapping.values()}
+    gs_assignments_actual = {ass_name : course_gs.assignments[ass_name] for ass_name in gs_ass_mapping.keys()}
+    return gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping
+
+
+def canvas_userdb(store, course_canvas):
+    '''
+    Returns the userdb of a Canvas course (from the metadata store while it is fresh)
+    '''
+    userdb = store.get_canvas_userdb(course_canvas.id)
+    if userdb is None:
+        print("Loading the Canvas users...")
+        userdb = canvas_load_userdb(course_canvas)
+        store.save_canvas_course(course_canvas.id, course_canvas.name, userdb)
+    return userdb
+
+
+HTTP_METRICS_PATH = 'http_metrics.json' # every Gradescope request of the last run
+
+BATCH_DEFAULTS = {
+    'row_ranges': DESIRED_ROW_RANGES,
+    'late_day_pool': LATE_DAY_POOL,
+    'max_late_days_per_hw': MAX_LATE_DAYS_PER_HW,
+    'workers': BATCH_WORKERS,
+    'rate_limit': GRADESCOPE_RATE_LIMIT,
+    'http_cache': None,
+    'refresh_sheet': True,
+    'report': 'batch_report.json',
+    'review_queue': 'review_queue.json',
+    'write_back': False,
+    'http_metrics': HTTP_METRICS_PATH,
+}
+BATCH_REQUIRED = ['gradescope_course_id', 'canvas_course_id', 'canvas_late_assignment_id']
+
+
+def load_batch_config(path):
+    '''
+    Loads a batch mode config file (see batch_config.example.json)
+    '''
+    with open(path) as f:
+        config = json.load(f)
+    missing = [key for key in BATCH_REQUIRED if key not in config]
+    if missing:
+        print(f"The batch config {path} is missing: {', '.join(missing)}")
+        raise SystemExit(103)
+    return {**BATCH_DEFAULTS, **config}
 
+
+def write_batch_report(outcomes, report_path, review_path):
+    '''
+    Writes the outcome of every row to report_path, and the rows that need a human decision to review_path
+    '''
+    summary = {status.value: 0 for status in Status}
+    for outcome in outcomes:
+        summary[outcome.status.value] += 1
+    report = {'generated_at': datetime.now().isoformat(), 'summary': summary,
+              'outcomes': [outcome.to_dict() for outcome in outcomes]}
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    with open(review_path, 'w') as f:
+        json.dump([outcome.to_dict() for outcome in outcomes if outcome.status == Status.REVIEW], f,
+                  indent=2, default=str)
+    print(f"Batch done: {summary}")
+    print(f"Report saved to {report_path}, review queue saved to {review_path}")
+
+
+def run_batch(config_path, full=False):
+    '''
+    Processes every eligible row without prompting, as configured in config_path (full: download the
+    whole sheet again).
+    The rows of one student are processed in order (they share the late day pool), different students in parallel.
+    '''
+    from late_day_ledger import LateDayLedger
+
+    config = load_batch_config(config_path)
+    store = MetadataStore()
+
+    conn = gradescope_connect(workers=config['workers'], rate_limit=config['rate_limit'],
+                              http_cache=config['http_cache'])
+    course_gs = conn.account.instructor_courses.get(str(config['gradescope_course_id']))
+    if course_gs is None:
+        print(f"The Gradescope course {config['gradescope_course_id']} is not one of your instructor courses")
+        raise SystemExit(103)
+    gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping = \
+        gradescope_load_assignments(store, course_gs, config.get('assignment_ids'))
+
+    course_canvas = canvas_connect(interactive=False).get_course(config['canvas_course_id'])
+    userdb = canvas_userdb(store, course_canvas)
+    store.close()
+    late_tracker = course_canvas.get_assignment(config['canvas_late_assignment_id'])
+    ledger = LateDayLedger(late_tracker.get_submissions(include="submission_comments"), userdb, late_tracker)
+
+    newdf, donedf = gsheets_init(gs_ass_mapping, download=config['refresh_sheet'] or full,
+                                  row_ranges=config['row_ranges'], full=full)
+
+    outcomes = []
+    rows_by_student = {}
+    for index, row in newdf.iterrows():
+        email, hw = row['Email Address'], row['Homework Name']
+        details = {'email': email, 'name': row['Name'], 'homework': hw}
+        if row[ALREADY_PROCESSED]:
+            outcomes.append(Outcome(Status.SKIPPED, "Already processed", row=index, **details))
+        elif row["Type of request"] != "Homework Late Day Pool":
+            outcomes.append(Outcome(Status.SKIPPED, f"Can't process {row['Type of request']}", row=index, **details))
+        else:
+            rows_by_student.setdefault(email.strip().lower(), []).append(row)
+
+    def process_student(rows):
+        results = []
+        for row in rows:
+            try:
+                results.append(process_late_hw(row, gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping,
+                                               ledger, interactive=False, late_day_pool=config['late_day_pool'],
+                                               max_late_days=config['max_late_days_per_hw']))
+            except Exception as err:
+                results.append(Outcome(Status.FAILED, repr(err), row=row.name, email=row['Email Address'],
+                                       name=row['Name'], homework=row['Homework Name']))
+        return results
+
+    with ThreadPoolExecutor(max_workers=config['workers']) as executor:
+        for results in executor.map(process_student, rows_by_student.values()):
+            outcomes.extend(results)
+
+    flush_late_days(ledger, outcomes)
+
+    outcomes.sort(key=lambda outcome: outcome.row)
+    if config['write_back']:
+        write_back_statuses(outcomes)
+    write_batch_report(outcomes, config['report'], config['review_queue'])
+    report_http_metrics(conn.metrics, config['http_metrics'])
+    return outcomes
+
+
+def report_http_metrics(metrics, path=None):
+    '''
+    Prints the time spent on each Gradescope endpoint during the run, and saves every request to path (if given)
+    '''
+    if metrics is None or not metrics.records:
+        return
+    print("Gradescope requests:")
+    print(metrics.format_summary())
+    if path:
+        metrics.dump(path)
+        print(f"Request metrics saved to {path}")
+
+
+def run_interactive(full=False):
+    '''
+    Processes the rows one at a time, asking before each one (full: download the whole sheet again)
+    '''
+    import questionary
+    from late_day_ledger import LateDayLedger
+    from gradescope_api.http_metrics import http_metrics
+
+    ledger = None
+    course_gs = None
+    outcomes = [] # the last outcome of each row we tried
     try:
         # The main init initializing Canvas and Gradescope stuff
         course_gs, gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping, course_canvas, userdb = init()
 
-        # This should not be pickled
-        canvas_late_submissions = canvas_get_assignment_submissions(course_canvas,
+        # Submissions change during a run, so they are never cached
+        canvas_late_tracker, canvas_late_submissions = canvas_get_assignment_submissions(course_canvas,
                                              prompt="Select the Canvas Assignment which records the late days for HW:")
+        ledger = LateDayLedger(canvas_late_submissions, userdb, canvas_late_tracker)
 
         # Google Sheets Init Stuff
-        newdf, donedf = gsheets_init(gs_ass_mapping)
+        newdf, donedf = gsheets_init(gs_ass_mapping, full=full)
         # newdf contains the rows which have NOT been processed
         # donedf contains the rows which have already been processed
 
@@ -517,7 +807,7 @@ if __name__ == '__main__':
             print("---------------------------------------------------")
 
             # if same email and hw exist in a row in donedf, it means it has already been processed
-            if donedf[(donedf["Email Address"] == email) & (donedf["Homework Name"] == hw)].shape[0] > 0:
+            if row[ALREADY_PROCESSED]:
                 print(f"This user {email} has already been processed for this homework {hw}. Skipping this one for now.")
                 print("---------------------------------------------------")
                 continue
@@ -530,8 +820,8 @@ if __name__ == '__main__':
                     continue
 
                 while True:
-                    if process_late_hw(row, gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping, 
-                        canvas_late_submissions, userdb):
+                    outcome = process_late_hw(row, gs_assignments_actual, gs_assignments_redemption, gs_ass_mapping, ledger)
+                    if outcome:
                         print(f"Operation successful for {row['Name']} with index {index}")
                         break
                     else:
@@ -543,6 +833,7 @@ if __name__ == '__main__':
                             print(f"Skipping this one for now.")
                             break
                     print("---------------------------------------------------")
+                outcomes.append(outcome)
 
             else:
                 print("---------------------------------------------------")
@@ -552,9 +843,112 @@ if __name__ == '__main__':
 
     except KeyboardInterrupt:
         print("Exiting...")
-        raise SystemExit(0)
+    finally:
+        # the submissions are already on Gradescope, so the queued late days are posted even after a Ctrl-C or an error
+        if ledger is not None:
+            flush_late_days(ledger, outcomes)
+        if course_gs is not None:
+            report_http_metrics(http_metrics(course_gs.session), HTTP_METRICS_PATH)
+
+    if any(outcome.status in SHEET_STATUS for outcome in outcomes) and \
+            questionary.confirm("Do you want to write the status of these rows back to the Google Sheet? " \
+                                "This needs write access to the sheet.").ask():
+        write_back_statuses(outcomes)
+
+
+def show_status():
+    '''
+    Prints what is stored locally (metadata, Gradescope session, downloaded responses and submissions), offline
+    '''
+    from gradescope_api.session_store import stored_session_info
+    from gradescope_api.archive_cache import ARCHIVE_CACHE_DIR, stored_archives_info
+
+    def age(timestamp):
+        return str(timedelta(seconds=int(time.time() - timestamp)))
+
+    if os.path.exists(METADATA_DB):
+        store = MetadataStore()
+        print(f"Gradescope course: {store.get_setting('gs_course_id') or '-'}, " \
+              f"Canvas course: {store.get_setting('canvas_course_id') or '-'}")
+        for table, (count, oldest) in store.summary().items():
+            print(f"  {table}: {count} cached" + (f", the oldest fetched {age(oldest)} ago" if oldest else ""))
+        store.close()
+    else:
+        print(f"No metadata cached yet ({METADATA_DB})")
 
+    session = stored_session_info()
+    if session:
+        print(f"Gradescope session of {session[0]}, saved {age(session[1])} ago")
+    else:
+        print("No Gradescope session saved")
+
+    responses = read_responses_csv()
+    if responses:
+        print(f"absence.csv: {len(responses)} rows (up to row {max(responses)}), " \
+              f"downloaded {age(os.path.getmtime(RESPONSES_CSV))} ago")
+    else:
+        print("No responses downloaded yet (absence.csv)")
+
+    archives = stored_archives_info()
+    if archives:
+        print(f"Submission archives: {archives[0]} ({archives[1] / 1024 ** 2:.1f} MB) in {ARCHIVE_CACHE_DIR}")
+    else:
+        print("No submission archives downloaded yet")
+
+
+def read_responses_csv(path=RESPONSES_CSV):
+    '''
+    Returns {sheet row number: row (a dict)} of the downloaded responses, without pandas; empty if there are none
+    '''
+    if not Path(path).is_file():
+        return {}
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        if ROW_COLUMN in (reader.fieldnames or []):
+            return {int(row[ROW_COLUMN]): row for row in reader}
+        return {index + 2: row for index, row in enumerate(reader)}
 
 
+def show_plan(row_ranges):
+    '''
+    Lists the Homework Late Day Pool requests of row_ranges that a run would process, from the downloaded
+    absence.csv (the homework names are shown as the students wrote them)
+    '''
+    responses = read_responses_csv()
+    if not responses:
+        print("No responses downloaded yet (absence.csv). Run the script once to download them.")
+        raise SystemExit(101)
+    rows = sorted({row for first, last in row_ranges for row in range(first, last + 1)} & responses.keys())
+    pending = [row for row in rows if responses[row].get("Type of request") == "Homework Late Day Pool" and
+               responses[row].get("Request Processed") not in PROCESSED_STATUSES]
+    for row in pending:
+        print(f"{row:>6}  {responses[row].get('Email Address', '')}  {responses[row].get('Homework Name', '')}")
+    print(f"{len(pending)} requests to process, out of {len(rows)} downloaded rows in the row ranges")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process the Homework Late Day Pool requests")
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    run = commands.add_parser('run', help="process the rows one at a time, asking before each one (the default)")
+    batch = commands.add_parser('batch', help="process every eligible row without prompting")
+    batch.add_argument('config', help="the batch config, a JSON file (see batch_config.example.json)")
+    for command in (run, batch):
+        command.add_argument('--full', action='store_true',
+                             help="download every row of the sheet again, not only the new rows and the statuses")
+    commands.add_parser('status', help="show what is cached locally, without connecting to anything")
+    plan = commands.add_parser('plan', help="list the requests a run would process, from the downloaded responses")
+    plan.add_argument('--config', help="take the row ranges from this batch config")
+    args = parser.parse_args(argv)
+
+    if args.command == 'batch':
+        run_batch(args.config, args.full)
+    elif args.command == 'status':
+        show_status()
+    elif args.command == 'plan':
+        show_plan(load_batch_config(args.config)['row_ranges'] if args.config else DESIRED_ROW_RANGES)
+    else:
+        run_interactive(getattr(args, 'full', False))
 
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+End-to-end throughput benchmark of the Gradescope clients against the local emulator
+(benchmarks/gradescope_emulator.py), without touching the live site:
+
+    python benchmarks/bench_gradescope.py [--students 300] [--assignments 2] [--transfers 20] [--latency 0.02]
+                                          [--error-rate 0.0] [--workers 8] [--paths sync threaded async]
+
+Every path runs the same scenario against a fresh emulator: log in, load the account, the assignments and
+the roster, fetch every submission of each actual assignment (review_grades and a past_submissions request
+per student), then move the redemption submission of --transfers students to the actual assignment
+(download the zip, upload it and wait for it to be graded), as absence_processing.py does.
+  - sync: one request at a time (get_submissions with max_workers=1, transfers one after another)
+  - threaded: GSConnection with --workers threads
+  - async: AsyncGSConnection with at most --workers requests in flight
+Every path retries the failed GETs (--retries, 0 to see the raw errors) and can be rate limited (--rate-limit),
+see gradescope_api/http_transport.py and async_transport.py; the injected errors honour --retry-after. When the
+retries run out, a failed review_grades load counts as one failed operation, and an error on a page of the set-up
+(login, account, assignments, roster) aborts the path, which is then reported as aborted instead of timed.
+With --metrics, the requests of each path are also summarized per endpoint (conn.metrics).
+'''
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gradescope_api.pyscope import GSConnection
+from gradescope_api.http_transport import MAX_RETRIES
+from gradescope_emulator import GradescopeEmulator, EMAIL, PASSWORD
+
+PATHS = ['sync', 'threaded', 'async']
+
+
+def assignment_pairs(assignments):
+    '''[(actual, redemption)] of the emulated assignments'''
+    return [(assignment, assignments[name + ' Redemption']) for name, assignment in assignments.items()
+            if name + ' Redemption' in assignments]
+
+def transfer_candidates(review_grades, transfers):
+    return [email for email, entry in review_grades.items() if entry['subid']][:transfers]
+
+
+def run_blocking(emulator, workers, transfers, transport, metrics=None):
+    '''
+    The sync (workers=1) and threaded paths, with the transport options of GSConnection. Returns the number of
+    failed operations.
+    '''
+    conn = GSConnection(**transport)
+    emulator.attach(conn.session, pool_size=workers)
+    conn.login(EMAIL, PASSWORD)
+    conn.get_account()
+    course = next(iter(conn.account.instructor_courses.values()))
+    course._lazy_load_assignments()
+    course._lazy_load_roster()
+
+    failures = 0
+    for actual, redemption in assignment_pairs(course.assignments):
+        try:
+            failures += len(actual.get_submissions(max_workers=workers))
+            candidates = transfer_candidates(redemption._lazy_load_review_grades(), transfers)
+        except Exception:
+            failures += 1
+            continue
+
+        def transfer(email):
+            submission = redemption.get_submission(email)
+            with redemption.get_submission_archive(submission.subid) as submission_zip:
+                return actual.post_submission(submission_zip, submission.student_id)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(transfer, email) for email in candidates]
+            for future in futures:
+                try:
+                    failures += not future.result()
+                except Exception:
+                    failures += 1
+    if metrics is not None:
+        metrics.append(conn.metrics.format_summary())
+    return failures
+
+
+async def run_async(emulator, workers, transfers, transport, metrics=None):
+    '''The async path, with the transport options of AsyncGSConnection. Returns the number of failed operations.'''
+    from gradescope_api.async_client import AsyncGSConnection
+
+    async with AsyncGSConnection(transport=emulator.async_transport(workers), max_connections=workers,
+                                 **transport) as conn:
+        await conn.login(EMAIL, PASSWORD)
+        await conn.get_account()
+        course = next(iter(conn.account.instructor_courses.values()))
+        await asyncio.gather(course.load_assignments(), course.load_roster())
+
+        failures = 0
+        semaphore = asyncio.Semaphore(workers)
+        for actual, redemption in assignment_pairs(course.assignments):
+            try:
+                failures += len(await actual.get_submissions(max_workers=workers))
+                candidates = transfer_candidates(await redemption.load_review_grades(), transfers)
+            except Exception:
+                failures += 1
+                continue
+
+            async def transfer(email):
+                async with semaphore:
+                    submission = await redemption.get_submission(email)
+                    return await actual.post_submission(await submission.download(), submission.student_id)
+
+            results = await asyncio.gather(*(transfer(email) for email in candidates), return_exceptions=True)
+            failures += sum(1 for result in results if isinstance(result, Exception) or not result)
+        if metrics is not None:
+            metrics.append(conn.metrics.format_summary())
+    return failures
+
+
+def run(path, args, metrics=None):
+    '''
+    Returns (wall time, requests served, injected errors, failed operations) of a path on a fresh emulator; the
+    summary of the requests is appended to metrics (a list), if given
+    '''
+    with GradescopeEmulator(students=args.students, assignments=args.assignments, seed=args.seed,
+                            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            error_pattern=args.error_pattern, retry_after=args.retry_after) as emulator:
+        start = perf_counter()
+        transport = {'retries': args.retries, 'rate_limit': args.rate_limit}
+        with contextlib.redirect_stdout(io.StringIO()): # the clients print a line per submission
+            if path == 'async':
+                failures = asyncio.run(run_async(emulator, args.workers, args.transfers, transport, metrics))
+            else:
+                failures = run_blocking(emulator, 1 if path == 'sync' else args.workers, args.transfers,
+                                        transport, metrics)
+        wall = perf_counter() - start
+        stats = emulator.stats()
+    return wall, sum(count for count, _, _ in stats.values()), sum(errors for _, errors, _ in stats.values()), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=300)
+    parser.add_argument('--assignments', type=int, default=2, help="(actual, redemption) pairs")
+    parser.add_argument('--transfers', type=int, default=20, help="submissions moved per pair")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-pattern', default=r'/submissions/\d+\.json$',
+                        help="regex of the paths that get the injected errors (default: past_submissions)")
+    parser.add_argument('--retry-after', type=int, default=None, help="Retry-After of the injected errors")
+    parser.add_argument('--retries', type=int, default=MAX_RETRIES)
+    parser.add_argument('--rate-limit', type=float, default=None, help="requests per second")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--paths', nargs='+', choices=PATHS, default=PATHS)
+    parser.add_argument('--metrics', action='store_true', help="print the requests per endpoint of each path")
+    args = parser.parse_args()
+
+    print(f"{args.students} students, {args.assignments} assignment pairs, {args.transfers} transfers per pair, "
+          f"{args.latency * 1000:.0f} ms latency, {args.error_rate:.0%} errors, {args.workers} workers")
+    print(f"{'path':<10}{'wall (s)':>10}{'requests':>10}{'req/s':>10}{'errors':>8}{'failed':>8}")
+    tables = []
+    for path in args.paths:
+        metrics = [] if args.metrics else None
+        try:
+            wall, requests, errors, failures = run(path, args, metrics)
+        except Exception as e:
+            print(f"{path:<10} aborted: {type(e).__name__}: {e}")
+            continue
+        print(f"{path:<10}{wall:>10.2f}{requests:>10}{requests / wall:>10.1f}{errors:>8}{failures:>8}")
+        tables += [(path, table) for table in metrics or []]
+    for path, table in tables:
+        print(f"\n{path}:\n{table}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the clean-up of the absence requests (responses.clean_responses) against the row-by-row
+version it replaced, on a synthetic response sheet:
+
+    python benchmarks/bench_gsheets_init.py [--rows 50000] [--repeat 3]
+'''
+import argparse
+import os
+import random
+import sys
+from time import perf_counter
+
+import pandas as pd
+from thefuzz import fuzz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from responses import clean_responses, HOMEWORK_NAME_TOKENS, ALREADY_PROCESSED
+
+ASSIGNMENTS = ["Image Scaling", "Image Stitching", "String Calculator", "Grade Calculator", "Dungeon Crawler",
+               "CPPeers", "Mars Rover", "Temperature Converter", "Paris Metro", "Debugging", "Mountain Paths"]
+ROW_RANGES = [[2, 5000], [12000, 14000], [30000, 30500], [40000, 50001], [4000, 4100]]
+
+
+def find_best_match(variant, originals):
+    '''The same matching as absence_processing.find_best_match'''
+    best_match, highest_score = None, 0
+    for original in originals:
+        if original.lower() in variant.lower():
+            return original, 100
+        score = fuzz.ratio(original, variant)
+        if score > highest_score:
+            best_match, highest_score = original, score
+    return best_match, highest_score
+
+
+def synthetic_responses(rows, seed=0):
+    random.seed(seed)
+    names = [random.choice([name, name.lower(), 'HW ' + name, name.split()[-1] + ' hw', 'the ' + name + ' one'])
+             for name in random.choices(ASSIGNMENTS, k=rows)] # students' spelling of the homework names
+    emails = [f'student{random.randrange(rows // 3)}@tamu.edu' for _ in range(rows)]
+    df = pd.DataFrame({
+        'Email Address': emails,
+        'Name': [email.split('@')[0] for email in emails],
+        'Type of request': random.choices(['Homework Late Day Pool', 'Excused Absence', 'Labwork Free Absence'],
+                                          weights=[6, 3, 1], k=rows),
+        'Homework Name': names,
+        'Request Processed': random.choices(['', 'Yes', 'No', 'Pending'], weights=[5, 3, 1, 1], k=rows),
+    })
+    df.index = df.index + 2
+    return df
+
+
+def legacy_clean_responses(df, gs_ass_mapping, row_ranges):
+    '''The row-by-row clean-up that gsheets_init used to do, and its "already processed" check per row'''
+    df = df.copy()
+    def refine_homework_name(x):
+        for token in HOMEWORK_NAME_TOKENS:
+            if token.lower() in x.lower():
+                best_match, _ = find_best_match(token, gs_ass_mapping.keys())
+                return best_match
+        return x
+    df["Homework Name"] = df["Homework Name"].apply(lambda x: refine_homework_name(x))
+    newdf = pd.concat([df.loc[first:last] for first, last in row_ranges])
+    newdf = newdf[newdf["Type of request"] == "Homework Late Day Pool"]
+    for status in ["Yes", "Pending", "No"]:
+        newdf = newdf[newdf["Request Processed"] != status]
+    donedf = df[df["Request Processed"].isin(["Yes", "Pending", "No"])]
+    already = [donedf[(donedf["Email Address"] == row["Email Address"]) &
+                      (donedf["Homework Name"] == row["Homework Name"])].shape[0] > 0
+               for _, row in newdf.iterrows()]
+    return newdf, donedf, already
+
+
+def best_of(repeat, function, *args):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        result = function(*args)
+        times.append(perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_responses(args.rows)
+    gs_ass_mapping = {name: '[HW Redemption] ' + name for name in ASSIGNMENTS}
+    resolved = {}
+    def resolve(token):
+        if token not in resolved:
+            resolved[token], _ = find_best_match(token, gs_ass_mapping.keys())
+        return resolved[token]
+
+    new_time, (newdf, donedf) = best_of(args.repeat, clean_responses, df, resolve, ROW_RANGES)
+    old_time, (old_newdf, old_donedf, old_already) = best_of(1, legacy_clean_responses, df, gs_ass_mapping, ROW_RANGES)
+
+    # the old version processed the rows of overlapping ranges twice
+    old_newdf = old_newdf[~old_newdf.index.duplicated()]
+    old_already = pd.Series(old_already, index=pd.concat([df.loc[first:last] for first, last in ROW_RANGES])
+                            .loc[lambda d: d["Type of request"] == "Homework Late Day Pool"]
+                            .loc[lambda d: ~d["Request Processed"].isin(["Yes", "Pending", "No"])].index)
+    old_already = old_already[~old_already.index.duplicated()]
+    assert newdf["Homework Name"].equals(old_newdf["Homework Name"].loc[newdf.index])
+    assert list(newdf.index) == sorted(old_newdf.index)
+    assert newdf[ALREADY_PROCESSED].equals(old_already.loc[newdf.index])
+    assert donedf.equals(old_donedf)
+
+    print(f"{args.rows} responses, {newdf.shape[0]} requests to process, {int(newdf[ALREADY_PROCESSED].sum())} already processed")
+    print(f"row by row: {old_time * 1000:10.1f} ms")
+    print(f"vectorized: {new_time * 1000:10.1f} ms  ({old_time / new_time:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
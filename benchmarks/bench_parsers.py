@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Micro-benchmarks of the page loads that parse Gradescope pages, on generated fixtures (the pages of
+benchmarks/gradescope_emulator.py) of 100 to 5,000 students, served from memory so that only the parsing
+and the object building are measured:
+
+    python benchmarks/bench_parsers.py [--sizes 100 500 1000 5000] [--repeat 5] [--update-baselines]
+
+This is a tool to run by hand around a change of the parsers, not a regression gate. For every function and
+size it prints the best time of --repeat runs (or more, for the fast ones) and the peak memory of one run
+(tracemalloc). Only the peaks are compared with benchmarks/parser_baselines.json, as they hardly depend on the
+machine (but on the Python version and the HTML backend): it exits with 1 when a peak is more than
+--memory-tolerance above its baseline. The times are not stored, as they mean nothing on other hardware:
+compare them with a run on the same machine before the change. Record the peaks again with --update-baselines
+after a deliberate change.
+
+What grows with the size n:
+  - GSCourse._lazy_load_roster, GSAssignment.get_submission (review_grades, then past_submissions): n students
+  - GSCourse._lazy_load_assignments: n / 50 pairs of assignments
+  - GSAssignment._lazy_load_questions: n / 50 questions of 2 parts
+  - GSConnection.get_account: n / 50 courses
+'''
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gradescope_api.pyscope import GSConnection, ConnState
+from gradescope_api.account import GSAccount
+from gradescope_api.course import GSCourse
+from gradescope_api.assignment import GSAssignment
+from gradescope_api.scraping import HTML_BACKEND
+from gradescope_emulator import (generate_courses, render_account, render_assignments, render_roster,
+                                 render_review_grades, render_outline, GRADESCOPE_URL, EMAIL)
+
+SIZES = [100, 500, 1000, 5000]
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_baselines.json')
+MEMORY_TOLERANCE = 0.2
+MIN_MEASURED = 0.2 # fast functions are run until this many seconds have been measured
+PEAK_RUNS = 3 # the smallest peak of this many runs is kept, one-off allocations (buffers, caches) aside
+
+
+class FixtureResponse():
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FixtureSession():
+    '''Serves the fixture pages by path, in place of a requests.Session'''
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get(self, url, **kwargs):
+        return FixtureResponse(self.pages[url[len(GRADESCOPE_URL):].split('?')[0]])
+
+
+def fixtures(size):
+    '''Returns {function name: a function that runs it once on fresh objects} for the fixtures of size n'''
+    course = next(iter(generate_courses(assignments=1, students=size, max_submissions=3).values()))
+    aid = next(iter(course.assignments))
+    listing = next(iter(generate_courses(assignments=max(1, size // 50), students=0).values()))
+    accounts = generate_courses(courses=max(1, size // 50), assignments=0, students=0).values()
+
+    # a student with a submission, for get_submission
+    student = next(s for s in course.students if course.assignments[aid]['submissions'][s['id']])
+    subid = course.assignments[aid]['submissions'][student['id']][-1]['id']
+    prefix = f'/courses/{course.cid}'
+    session = FixtureSession({
+        '/account': render_account(accounts),
+        prefix + '/assignments': render_assignments(listing),
+        prefix + '/memberships': render_roster(course),
+        f'{prefix}/assignments/{aid}/review_grades': render_review_grades(course, aid),
+        f'{prefix}/assignments/{aid}/submissions/{subid}.json':
+            json.dumps({'past_submissions': course.assignments[aid]['submissions'][student['id']]}),
+        f'{prefix}/assignments/{aid}/outline/edit': render_outline(questions=max(1, size // 50), parts=2),
+    })
+
+    def new_course():
+        return GSCourse(course.cid, course.name, course.shortname, course.term, session)
+
+    def new_assignment():
+        return GSAssignment('Homework 1', aid, 100.0, 100, True, False, new_course(), None)
+
+    conn = GSConnection()
+    conn.session = session
+    conn.state = ConnState.LOGGED_IN
+
+    def get_account():
+        conn.account = GSAccount(EMAIL, session)
+        conn.get_account()
+        return conn.account.instructor_courses
+
+    return {
+        'GSCourse._lazy_load_assignments': lambda: new_course()._lazy_load_assignments(),
+        'GSCourse._lazy_load_roster': lambda: new_course()._lazy_load_roster(),
+        'GSAssignment.get_submission': lambda: new_assignment().get_submission(student['email']),
+        'GSAssignment._lazy_load_questions': lambda: new_assignment()._lazy_load_questions(),
+        'GSConnection.get_account': get_account,
+    }
+
+
+def measure(function, repeat):
+    '''
+    Returns (best time in seconds, smallest peak traced memory in bytes) of function, run at least repeat times
+    (more when it is fast, see MIN_MEASURED)
+    '''
+    with contextlib.redirect_stdout(io.StringIO()): # get_account prints every course
+        start = perf_counter()
+        function() # warm-up
+        runs = max(repeat, min(1000, int(MIN_MEASURED / max(perf_counter() - start, 1e-6))))
+        best = float('inf')
+        gc.collect() # the garbage collector stays on: the parse trees are cyclic and would pile up otherwise
+        for _ in range(runs):
+            start = perf_counter()
+            function()
+            best = min(best, perf_counter() - start)
+        peak = float('inf')
+        for _ in range(PEAK_RUNS):
+            gc.collect()
+            tracemalloc.start()
+            function()
+            peak = min(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    return best, peak
+
+
+def environment():
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'html_backend': HTML_BACKEND}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baselines', default=BASELINES_PATH)
+    parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE,
+                        help="allowed relative increase of the peak memory over its baseline")
+    parser.add_argument('--update-baselines', action='store_true', help="store the results as the new baselines")
+    args = parser.parse_args()
+
+    stored = {'environment': None, 'results': {}}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            stored = json.load(f)
+    baselines = stored['results']
+    if stored['environment'] not in (None, environment()):
+        print(f"The baselines were recorded on {stored['environment']}, not {environment()}: expect differences")
+
+    results, regressions = {}, []
+    print(f"{'function':<36}{'students':>9}{'time (ms)':>11}{'peak (KB)':>11}{'baseline':>10}")
+    for size in args.sizes:
+        for name, function in fixtures(size).items():
+            key = f'{name}@{size}'
+            seconds, peak = measure(function, args.repeat)
+            results[key] = {'peak_bytes': peak}
+            baseline = baselines.get(key)
+            flag = ''
+            if baseline and not args.update_baselines and \
+                    peak > baseline['peak_bytes'] * (1 + args.memory_tolerance):
+                flag = ' BIGGER'
+                regressions.append(key + flag)
+            print(f"{name:<36}{size:>9}{seconds * 1000:>11.2f}{peak / 1024:>11.0f}" +
+                  (f"{baseline['peak_bytes'] / 1024:>10.0f}" if baseline else f"{'-':>10}") + flag)
+
+    if args.update_baselines:
+        with open(args.baselines, 'w') as f:
+            json.dump({'environment': environment(), 'results': {**baselines, **results}}, f, indent=2, sort_keys=True)
+        print(f"Baselines saved to {args.baselines}")
+        return
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
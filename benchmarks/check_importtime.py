@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Regression check of the start-up time of absence_processing.py. It imports the script under
+python -X importtime, fails if any of the heavy dependencies gets loaded at import or if the import
+takes longer than its budget, and times the offline commands (status, plan) end to end:
+
+    python benchmarks/check_importtime.py [--import-budget 0.25] [--command-budget 1.0]
+
+The commands run in a scratch directory holding a small absence.csv (RESPONSES_FIXTURE), so they see no
+other local caches but the ones in ~/.cache, and fail the check if they exit with another code than expected.
+'''
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'absence_processing.py')
+# only the code paths that use them may import these
+HEAVY_MODULES = ['pandas', 'numpy', 'questionary', 'prompt_toolkit', 'canvasapi', 'googleapiclient', 'google.auth',
+                 'google_auth_oauthlib', 'thefuzz', 'rapidfuzz', 'requests', 'bs4', 'lxml', 'gradescope_api.pyscope']
+COMMANDS = [(['status'], 0), (['plan'], 0)] # (arguments, expected exit code)
+# the downloaded responses the commands run against, in DESIRED_ROW_RANGES
+RESPONSES_FIXTURE = [
+    {'Row': 620 + i, 'Timestamp': f'1/{i + 1}/2024 10:00:00', 'Email Address': f'student{i}@example.edu',
+     'Name': f'Student {i}', 'Type of request': 'Homework Late Day Pool' if i % 4 else 'Extension',
+     'Homework Name': f'HW{i % 5 + 1}', 'Request Processed': 'Yes' if i % 3 == 0 else ''}
+    for i in range(40)
+]
+
+
+def import_times(module):
+    '''
+    Returns {module: cumulative import time in seconds} of module and of everything its import loaded, from
+    python -X importtime (the modules loaded by the interpreter start-up are left out)
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                            capture_output=True, text=True, env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'})
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr}")
+    imports = [] # (name, depth, cumulative), each module after the ones it imported
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), (len(name) - len(name.lstrip()) - 1) // 2, int(cumulative) / 1e6))
+    end = max(i for i, (name, depth, _) in enumerate(imports) if name == module and depth == 0)
+    start = end
+    while start > 0 and imports[start - 1][1] > 0:
+        start -= 1
+    return {name: cumulative for name, _, cumulative in imports[start:end + 1]}
+
+
+def write_fixture(directory):
+    with open(os.path.join(directory, 'absence.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(RESPONSES_FIXTURE[0]))
+        writer.writeheader()
+        writer.writerows(RESPONSES_FIXTURE)
+
+
+def run_command(args):
+    '''Returns the wall time and the result of the script running a command in a scratch directory'''
+    with tempfile.TemporaryDirectory() as scratch:
+        write_fixture(scratch)
+        start = perf_counter()
+        result = subprocess.run([sys.executable, SCRIPT, *args], cwd=scratch, capture_output=True, text=True)
+        return perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--import-budget', type=float, default=0.25, help="seconds for importing the script")
+    parser.add_argument('--command-budget', type=float, default=1.0, help="seconds for a status or plan command")
+    args = parser.parse_args()
+
+    failures = []
+    times = import_times('absence_processing')
+    heavy = [name for name in HEAVY_MODULES if name in times]
+    if heavy:
+        failures.append(f"importing the script loads {', '.join(heavy)}")
+    slowest = sorted(((t, name) for name, t in times.items() if name != 'absence_processing'), reverse=True)[:5]
+    print(f"import absence_processing: {times['absence_processing'] * 1000:8.1f} ms")
+    for t, name in slowest:
+        print(f"    {name:<30} {t * 1000:8.1f} ms")
+    if times['absence_processing'] > args.import_budget:
+        failures.append(f"importing the script takes more than {args.import_budget} s")
+
+    for command, expected in COMMANDS:
+        wall, result = run_command(command)
+        print(f"absence_processing.py {' '.join(command):<14} {wall * 1000:8.1f} ms")
+        if result.returncode != expected:
+            failures.append(f"{' '.join(command)} exited with {result.returncode} instead of {expected}:\n"
+                            f"{result.stdout}{result.stderr}")
+        if wall > args.command_budget:
+            failures.append(f"{' '.join(command)} takes more than {args.command_budget} s")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,544 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+A local stand-in for the parts of www.gradescope.com that gradescope_api scrapes, serving synthetic
+courses of any size, so the clients can be benchmarked (and regression-tested) without the live site:
+
+    with GradescopeEmulator(students=500, latency=0.02) as emulator:
+        conn = GSConnection()
+        emulator.attach(conn.session)     # requests.Session: www.gradescope.com now goes to the emulator
+        conn.login(EMAIL, PASSWORD)
+        ...
+        conn = AsyncGSConnection(transport=emulator.async_transport())
+
+Served: the login form and login, the account page, the course page (csrf token), the assignments table,
+the memberships roster, review_grades, the outline, the past_submissions and submission JSON, the
+submission zips, the upload form, uploads and status.json. The GET answers carry an ETag and conditional
+requests get a 304 when the page did not change, as with Rails. Every response can be delayed (latency, jitter)
+and a fraction of them replaced by errors (error_rate, error_status, error_pattern, retry_after).
+
+The page builders (render_*) are also used on their own as parser fixtures.
+'''
+import hashlib
+import html
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import zipfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gradescope_api.http_transport import ResilientAdapter, transport_options
+
+GRADESCOPE_URL = 'https://www.gradescope.com'
+EMAIL = 'instructor@example.edu'
+PASSWORD = 'password'
+SESSION_COOKIE = '_gradescope_session'
+CSRF_TOKEN = 'emulated-csrf-token'
+CENTRAL = timezone(timedelta(hours=-6))
+FIRST_DUE_DATE = datetime(2024, 9, 6, 23, 59, tzinfo=CENTRAL)
+SOURCE_BYTES = 4 * 1024 # size of the source file in each submission zip
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~SYNTHETIC DATA~~~~~~~~~~~~~~~~~~~~~~~~
+
+class EmulatedCourse():
+    '''
+    A course with students, pairs of assignments ("Homework k" and "Homework k Redemption") and a history
+    of submissions for each student, generated from a seed.
+    '''
+
+    def __init__(self, cid, assignments, students, max_submissions, rng, ids):
+        self.cid = str(cid)
+        self.name = f'Programming Course {cid}'
+        self.shortname = f'CSCE {cid}'
+        self.term = 'Fall 2024'
+        self.students = [{'id': str(next(ids)), 'membership_id': str(next(ids)), 'name': f'Student {i:05d}',
+                          'email': f'student{i:05d}.{cid}@example.edu'} for i in range(students)]
+        self.assignments = {} # aid -> {id, title, due_date, points, submissions: {student id: [history]}}
+        for k in range(assignments):
+            due_date = FIRST_DUE_DATE + timedelta(weeks=k)
+            for title, window in ((f'Homework {k + 1}', (-10, 0)), (f'Homework {k + 1} Redemption', (0, 6))):
+                aid = str(next(ids))
+                submissions = {}
+                for student in self.students:
+                    count = rng.randint(0, max_submissions) if max_submissions else 0
+                    times = sorted(due_date + timedelta(days=rng.uniform(*window)) for _ in range(count))
+                    submissions[student['id']] = [{'id': next(ids), 'created_at': time.isoformat(),
+                                                   'score': float(rng.randint(0, 100)),
+                                                   'owners': [{'id': int(student['id']), 'name': student['name']}]}
+                                                  for time in times]
+                self.assignments[aid] = {'id': aid, 'title': title, 'due_date': due_date, 'points': 100.0,
+                                         'submissions': submissions}
+
+
+def generate_courses(courses=1, assignments=4, students=100, max_submissions=3, seed=0):
+    '''Returns {cid: EmulatedCourse} of synthetic courses; the same arguments always give the same courses.'''
+    rng = random.Random(seed)
+    ids = iter(range(1000000, 1000000000))
+    generated = [EmulatedCourse(500000 + i, assignments, students, max_submissions, rng, ids) for i in range(courses)]
+    return {course.cid: course for course in generated}
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~PAGES~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def page(body, title='Gradescope'):
+    return ('<!DOCTYPE html><html><head><title>' + title + '</title>'
+            '<meta name="csrf-param" content="authenticity_token" />'
+            f'<meta name="csrf-token" content="{CSRF_TOKEN}" /></head><body>' + body + '</body></html>')
+
+def react_component(name, props):
+    return f'<div data-react-class="{name}" data-react-props="{html.escape(json.dumps(props), quote=True)}"></div>'
+
+def render_home():
+    return page('<form class="loginForm" action="/login" accept-charset="UTF-8" method="post">'
+                '<input name="utf8" type="hidden" value="&#x2713;" />'
+                f'<input type="hidden" name="authenticity_token" value="{CSRF_TOKEN}" />'
+                '<input type="email" name="session[email]" /><input type="password" name="session[password]" />'
+                '</form>')
+
+def render_account(courses):
+    '''The account page, with courses (EmulatedCourse) as the instructor courses'''
+    terms = {}
+    for course in courses:
+        terms.setdefault(course.term, []).append(course)
+    body = '<h1 class="pageHeading">Instructor Courses</h1><div class="courseList">'
+    for term, term_courses in terms.items():
+        body += f'<div class="courseList--term pageSubheading">{term}</div><div class="courseList--coursesForTerm">'
+        for course in term_courses:
+            body += (f'<a class="courseBox" href="/courses/{course.cid}"><h3 class="courseBox--shortname">'
+                     f'{html.escape(course.shortname)}</h3><div class="courseBox--name">{html.escape(course.name)}'
+                     f'</div><div class="courseBox--assignments">{len(course.assignments)} assignments</div></a>')
+        body += '</div>'
+    return page(body + '</div>', 'Your Courses')
+
+def render_course(course):
+    return page(f'<h1 class="courseHeader--title">{html.escape(course.shortname)}</h1>')
+
+def render_assignments(course):
+    '''The assignments page: its AssignmentsTable react component'''
+    rows = [{'id': 'assignment_' + aid, 'title': assignment['title'], 'className': 'js-assignmentTableAssignmentRow',
+             'url': f"/courses/{course.cid}/assignments/{aid}",
+             'submission_window': {'release_date': None,
+                                   'due_date': assignment['due_date'].strftime('%Y-%m-%dT%H:%M')},
+             'total_points': assignment['points'], 'num_active_submissions': len(assignment['submissions']),
+             'grading_progress': 100, 'regrade_requests_open': False}
+            for aid, assignment in course.assignments.items()]
+    return page(react_component('AssignmentsTable', {'table_data': rows}))
+
+def render_roster(course):
+    '''The memberships page'''
+    rows = ''.join(f'<tr class="rosterRow"><td>{html.escape(student["name"])} <button class="rosterCell--editIcon" '
+                   f'data-id="{student["membership_id"]}"></button></td><td>{student["email"]}</td>'
+                   '<td><select><option value="0" selected="selected">Student</option><option value="1">Instructor'
+                   f'</option></select></td><td>{len(course.assignments)}</td>'
+                   '<td><i class="statusIcon statusIcon-active"></i></td><td></td></tr>'
+                   for student in course.students)
+    return page(f'<table class="js-rosterTable"><tbody>{rows}</tbody></table>')
+
+def render_review_grades(course, aid):
+    '''The review_grades page of an assignment: a row per student, linked to the active submission'''
+    assignment = course.assignments[aid]
+    rows = ''
+    for student in course.students:
+        history = assignment['submissions'][student['id']]
+        name = html.escape(student['name'])
+        if history:
+            name = f'<a href="/courses/{course.cid}/assignments/{aid}/submissions/{history[-1]["id"]}">{name}</a>'
+        score = history[-1]['score'] if history else ''
+        rows += f'<tr><td>{name}</td><td>{student["id"]}</td><td>{student["email"]}</td><td>{score}</td></tr>'
+    return page('<table class="js-reviewGradesTable"><thead><tr><th>Name</th><th>SID</th><th>Email</th>'
+                f'<th>Score</th></tr></thead><tbody>{rows}</tbody></table>')
+
+def render_outline(questions=3, parts=2):
+    '''The outline edit page of an assignment, with questions of parts subquestions each'''
+    qid = iter(range(1, 10 ** 6))
+    def question(title, parent_id, children):
+        entry = {'id': next(qid), 'title': title, 'weight': 10.0, 'parent_id': parent_id, 'content': [],
+                 'crop_rect_list': [{'x1': 10, 'x2': 91, 'y1': 10, 'y2': 30, 'page_number': 1}]}
+        entry['children'] = [question(f'{title}.{i + 1}', entry['id'], 0) for i in range(children)]
+        return entry
+    outline = [question(f'Q{i + 1}', None, parts) for i in range(questions)]
+    return page(react_component('AssignmentOutline', {'outline': outline}))
+
+def render_submission_form():
+    return page('<form id="new_submission" action="submissions" method="post"></form>')
+
+def submission_zip(submission):
+    '''The zip of a submission: a source file, and the score for the emulated autograder'''
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as thezip:
+        source = f'// submission {submission["id"]}\n'
+        thezip.writestr('src/main.cpp', source + 'x' * (SOURCE_BYTES - len(source)))
+        thezip.writestr('score.txt', f'score={submission["score"]}\n')
+    return buffer.getvalue()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~SERVER~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+ROUTES = [ # (method, path regex, handler, endpoint template)
+    ('GET', r'/', 'home', '/'),
+    ('POST', r'/login', 'login', '/login'),
+    ('GET', r'/account', 'account', '/account'),
+    ('GET', r'/courses/(?P<cid>\d+)', 'course', '/courses/{cid}'),
+    ('GET', r'/courses/(?P<cid>\d+)/assignments', 'assignments', '/courses/{cid}/assignments'),
+    ('GET', r'/courses/(?P<cid>\d+)/memberships', 'memberships', '/courses/{cid}/memberships'),
+    ('GET', r'/courses/(?P<cid>\d+)/assignments/(?P<aid>\d+)/review_grades', 'review_grades',
+     '/courses/{cid}/assignments/{aid}/review_grades'),
+    ('GET', r'/courses/(?P<cid>\d+)/assignments/(?P<aid>\d+)/outline/edit', 'outline',
+     '/courses/{cid}/assignments/{aid}/outline/edit'),
+    ('GET', r'/courses/(?P<cid>\d+)/assignments/(?P<aid>\d+)/submissions/new', 'submission_form',
+     '/courses/{cid}/assignments/{aid}/submissions/new'),
+    ('POST', r'/courses/(?P<cid>\d+)/assignments/(?P<aid>\d+)/submissions', 'upload',
+     '/courses/{cid}/assignments/{aid}/submissions'),
+    ('GET', r'/courses/(?P<cid>\d+)/assignments/(?P<aid>\d+)/submissions/(?P<subid>\d+)\.json', 'submission_json',
+     '/courses/{cid}/assignments/{aid}/submissions/{subid}.json'),
+    ('GET', r'/courses/(?P<cid>\d+)/assignments/(?P<aid>\d+)/submissions/(?P<subid>\d+)\.zip', 'submission_zip',
+     '/courses/{cid}/assignments/{aid}/submissions/{subid}.zip'),
+    ('GET', r'/courses/(?P<cid>\d+)/assignments/(?P<aid>\d+)/submissions/(?P<subid>\d+)/status\.json', 'status',
+     '/courses/{cid}/assignments/{aid}/submissions/{subid}/status.json'),
+]
+PUBLIC_HANDLERS = {'home', 'login'}
+
+
+class NotFound(Exception):
+    pass
+
+
+class GradescopeEmulator():
+
+    def __init__(self, courses=1, assignments=4, students=100, max_submissions=3, seed=0,
+                 latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, error_pattern=r'.*', retry_after=None,
+                 grading_delay=0.0, port=0):
+        '''
+        courses, assignments, students, max_submissions, seed: the size of the synthetic data (see generate_courses);
+                 assignments is the number of (actual, redemption) pairs per course
+        latency, jitter: seconds added to every response (jitter is uniform on top of latency)
+        error_rate: fraction of the responses replaced by an error_status response; only for the paths matching
+                    the regex error_pattern. retry_after (optional): the Retry-After header of those errors
+        grading_delay: seconds before an uploaded submission is graded (see status.json)
+        port: 0 picks a free port
+        '''
+        self.courses = generate_courses(courses, assignments, students, max_submissions, seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_pattern = re.compile(error_pattern)
+        self.retry_after = retry_after
+        self.grading_delay = grading_delay
+        self.port = port
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.submissions = {} # subid -> (course, aid, student id, submission), see _index
+        self.graded_at = {} # subid of uploaded submissions -> monotonic time it is graded at
+        self.zips = {}
+        self.ids = iter(range(2000000000, 3000000000))
+        self.server = None
+        self.reset_stats()
+        self._index()
+
+    def _index(self):
+        for course in self.courses.values():
+            for aid, assignment in course.assignments.items():
+                for student_id, history in assignment['submissions'].items():
+                    for submission in history:
+                        self.submissions[submission['id']] = (course, aid, student_id, submission)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~LIFECYCLE~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), EmulatorHandler)
+        self.server.daemon_threads = True
+        self.server.emulator = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def attach(self, session, pool_size=None):
+        '''
+        Send the Gradescope requests of a requests.Session to the emulator, with the transport settings (retries,
+        timeouts...) of its current adapter; pool_size overrides its pool size
+        '''
+        options = transport_options(session)
+        if pool_size:
+            options['pool_size'] = pool_size
+        session.mount(GRADESCOPE_URL, EmulatorAdapter(self.url, **options))
+        return session
+
+    def async_transport(self, max_connections=20):
+        '''An httpx transport that sends the Gradescope requests of an httpx.AsyncClient to the emulator'''
+        return EmulatorTransport(self.url, limits=httpx.Limits(max_connections=max_connections,
+                                                               max_keepalive_connections=max_connections))
+
+    # ~~~~~~~~~~~~~~~~~~~~~~STATS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = Counter() # endpoint template -> requests
+            self.errors = Counter() # endpoint template -> injected errors
+            self.bytes_out = Counter()
+
+    def stats(self):
+        '''Returns {endpoint template: (requests, injected errors, bytes sent)}'''
+        with self.lock:
+            return {endpoint: (count, self.errors[endpoint], self.bytes_out[endpoint])
+                    for endpoint, count in self.requests.items()}
+
+    def _record(self, endpoint, size, error=False):
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.bytes_out[endpoint] += size
+            if error:
+                self.errors[endpoint] += 1
+
+    def _delay(self):
+        with self.lock:
+            return self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+
+    def _inject_error(self, path):
+        if not self.error_rate or not self.error_pattern.search(path):
+            return False
+        with self.lock:
+            return self.rng.random() < self.error_rate
+
+    # ~~~~~~~~~~~~~~~~~~~~~~ENDPOINTS~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    # Each returns (status, content type, body) or (status, headers, body) for redirects
+
+    def _course(self, cid):
+        if cid not in self.courses:
+            raise NotFound(cid)
+        return self.courses[cid]
+
+    def _assignment(self, cid, aid):
+        course = self._course(cid)
+        if aid not in course.assignments:
+            raise NotFound(aid)
+        return course, course.assignments[aid]
+
+    def home(self, query, body):
+        return 200, 'text/html', render_home()
+
+    def login(self, query, body):
+        token = f'{next(self.ids):x}'
+        with self.lock:
+            self.sessions.add(token)
+        return 302, {'Location': '/account', 'Set-Cookie': f'{SESSION_COOKIE}={token}; path=/; HttpOnly'}, ''
+
+    def account(self, query, body):
+        return 200, 'text/html', render_account(self.courses.values())
+
+    def course(self, query, body, cid):
+        return 200, 'text/html', render_course(self._course(cid))
+
+    def assignments(self, query, body, cid):
+        return 200, 'text/html', render_assignments(self._course(cid))
+
+    def memberships(self, query, body, cid):
+        return 200, 'text/html', render_roster(self._course(cid))
+
+    def review_grades(self, query, body, cid, aid):
+        course, _ = self._assignment(cid, aid)
+        with self.lock:
+            return 200, 'text/html', render_review_grades(course, aid)
+
+    def outline(self, query, body, cid, aid):
+        self._assignment(cid, aid)
+        return 200, 'text/html', render_outline()
+
+    def submission_form(self, query, body, cid, aid):
+        self._assignment(cid, aid)
+        return 200, 'text/html', render_submission_form()
+
+    def upload(self, query, body, cid, aid):
+        '''Grades the zip with the score it carries (see submission_zip)'''
+        course, assignment = self._assignment(cid, aid)
+        owner = re.search(rb'name="submission\[owner_id\]"\r\n(?:[^\r\n]+\r\n)*\r\n(\d+)', body)
+        score = re.search(rb'score=([\d.]+)', body)
+        student = next((s for s in course.students if owner and s['id'] == owner.group(1).decode()), None)
+        if student is None or score is None:
+            return 200, 'application/json', json.dumps({'success': False, 'errors': ['Invalid submission']})
+        submission = {'id': next(self.ids), 'created_at': datetime.now(CENTRAL).isoformat(),
+                      'score': float(score.group(1)), 'owners': [{'id': int(student['id']), 'name': student['name']}]}
+        with self.lock:
+            assignment['submissions'][student['id']].append(submission)
+            self.submissions[submission['id']] = (course, aid, student['id'], submission)
+            self.graded_at[submission['id']] = monotonic() + self.grading_delay
+        return 200, 'application/json', json.dumps({'success': True,
+                                                    'url': f'/courses/{cid}/assignments/{aid}/submissions/{submission["id"]}'})
+
+    def _submission(self, cid, aid, subid):
+        entry = self.submissions.get(int(subid))
+        if entry is None or entry[0].cid != cid or entry[1] != aid:
+            raise NotFound(subid)
+        return entry
+
+    def submission_json(self, query, body, cid, aid, subid):
+        course, _, student_id, submission = self._submission(cid, aid, subid)
+        if 'past_submissions' in query.get('only_keys[]', []):
+            with self.lock:
+                history = list(course.assignments[aid]['submissions'][student_id])
+            return 200, 'application/json', json.dumps({'past_submissions': history})
+        student = next(s for s in course.students if s['id'] == student_id)
+        return 200, 'application/json', json.dumps({
+            'assignment_submission': {'id': submission['id'], 'score': submission['score'],
+                                      'created_at': submission['created_at']},
+            'course_members': [{'id': int(student_id), 'name': student['name'], 'email': student['email']}]})
+
+    def submission_zip(self, query, body, cid, aid, subid):
+        submission = self._submission(cid, aid, subid)[3]
+        with self.lock:
+            if submission['id'] not in self.zips:
+                self.zips[submission['id']] = submission_zip(submission)
+            return 200, 'application/zip', self.zips[submission['id']]
+
+    def status(self, query, body, cid, aid, subid):
+        submission = self._submission(cid, aid, subid)[3]
+        if monotonic() < self.graded_at.get(submission['id'], 0):
+            return 200, 'application/json', json.dumps({'status': 'processing', 'score': None})
+        return 200, 'application/json', json.dumps({'status': 'processed', 'score': submission['score']})
+
+
+class EmulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, like the real site
+    # headers and body go out in one segment, or delayed ACKs stall every keep-alive response by ~40 ms
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+                if not size:
+                    return body
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def handle_request(self, method):
+        emulator = self.server.emulator
+        body = self.read_body()
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        for route_method, pattern, handler, endpoint in ROUTES:
+            match = re.fullmatch(pattern, url.path.rstrip('/') or '/')
+            if route_method == method and match:
+                break
+        else:
+            return self.respond(404, 'text/plain', 'Not found', 'unknown')
+
+        delay = emulator._delay()
+        if delay:
+            sleep(delay)
+        if emulator._inject_error(url.path):
+            headers = {'Retry-After': str(emulator.retry_after)} if emulator.retry_after is not None else {}
+            return self.respond(emulator.error_status, 'text/html', page('<h1>Emulated error</h1>'), endpoint,
+                                headers, error=True)
+        if handler not in PUBLIC_HANDLERS and not self.logged_in(emulator):
+            return self.respond(302, 'text/html', '', endpoint, {'Location': '/login'})
+        try:
+            status, content_type, content = getattr(emulator, handler)(query, body, **match.groupdict())
+        except NotFound:
+            return self.respond(404, 'text/plain', 'Not found', endpoint)
+        if isinstance(content_type, dict): # a redirect
+            return self.respond(status, 'text/html', content, endpoint, content_type)
+        self.respond(status, content_type, content, endpoint)
+
+    def logged_in(self, emulator):
+        cookies = dict(cookie.strip().split('=', 1) for cookie in self.headers.get('Cookie', '').split(';')
+                       if '=' in cookie)
+        with emulator.lock:
+            return cookies.get(SESSION_COOKIE) in emulator.sessions
+
+    def respond(self, status, content_type, content, endpoint, headers={}, error=False):
+        data = content if isinstance(content, bytes) else content.encode()
+        if status == 200 and self.command == 'GET':
+            # the conditional GETs of Rails (Rack::ETag and Rack::ConditionalGet)
+            etag = f'W/"{hashlib.md5(data).hexdigest()}"'
+            headers = dict(headers, ETag=etag)
+            if self.headers.get('If-None-Match') == etag:
+                status, data = 304, b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.emulator._record(endpoint, len(data), error)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~CLIENT SIDE~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class EmulatorAdapter(ResilientAdapter):
+    '''
+    A requests adapter that sends the requests for www.gradescope.com to the emulator. The responses keep
+    the Gradescope urls, so cookies and redirects behave as they do with the real site.
+    '''
+
+    def __init__(self, base_url, **options):
+        super().__init__(**options)
+        self.base_url = base_url
+
+    def transmit(self, request, **kwargs):
+        forwarded = request.copy()
+        forwarded.url = self.base_url + request.url[len(GRADESCOPE_URL):]
+        resp = super().transmit(forwarded, **kwargs)
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+
+if httpx is not None:
+    class EmulatorTransport(httpx.AsyncHTTPTransport):
+        '''The httpx counterpart of EmulatorAdapter'''
+
+        def __init__(self, base_url, **kwargs):
+            super().__init__(**kwargs)
+            self.base_url = httpx.URL(base_url)
+
+        async def handle_async_request(self, request):
+            url = request.url.copy_with(scheme=self.base_url.scheme, host=self.base_url.host, port=self.base_url.port)
+            forwarded = httpx.Request(request.method, url, headers=request.headers, stream=request.stream,
+                                      extensions=request.extensions)
+            return await super().handle_async_request(forwarded)
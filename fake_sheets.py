@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+An in-memory stand-in for the Google Sheets service, for trying out sheets.py (ResponsesSheet,
+StatusWriter) without touching the real sheet:
+
+    service = FakeSheetsService({'Form Responses 1': [header, row2, row3, ...]})
+    ResponsesSheet(service, 'any id', 'Form Responses 1!A:T').load([[2, 10]])
+
+Only the calls sheets.py makes are implemented: spreadsheets().values().batchGet and batchUpdate. Like the
+real API, trailing empty cells and rows are left out of the returned values. Every call is recorded in
+calls, and edit() changes a cell behind the back of the writer (another TA).
+'''
+import re
+
+A1 = re.compile(r"^'?(?P<sheet>.*?)'?!(?P<c1>[A-Z]+)(?P<r1>\d+)(?::(?P<c2>[A-Z]+)(?P<r2>\d*))?$")
+
+
+def column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+def parse_a1(a1):
+    '''
+    "'Sheet'!B2:D5" -> ("Sheet", first row, last row, first column, last column), 0-based. The last row of
+    an open-ended range ("B2:B") is None.
+    '''
+    match = A1.match(a1)
+    if not match:
+        raise ValueError(f"Unsupported range: {a1}")
+    c2 = match['c2'] or match['c1']
+    r2 = match['r1'] if match['c2'] is None else match['r2']
+    return match['sheet'], int(match['r1']) - 1, int(r2) - 1 if r2 else None, column_index(match['c1']), \
+        column_index(c2)
+
+
+class FakeRequest():
+
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeSheetsService():
+
+    def __init__(self, sheets):
+        '''sheets: dict of sheet name -> list of rows (lists of str), the first row being row 1'''
+        self.sheets = {name: [list(row) for row in rows] for name, rows in sheets.items()}
+        self.calls = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def edit(self, a1, value):
+        sheet, row, _, column, _ = parse_a1(a1)
+        self.set_cell(sheet, row, column, value)
+
+    def set_cell(self, sheet, row, column, value):
+        rows = self.sheets[sheet]
+        while len(rows) <= row:
+            rows.append([])
+        rows[row] += [''] * (column + 1 - len(rows[row]))
+        rows[row][column] = value
+
+    def read(self, a1):
+        sheet, r1, r2, c1, c2 = parse_a1(a1)
+        rows = []
+        for row in self.sheets[sheet][r1:None if r2 is None else r2 + 1]:
+            values = row[c1:c2 + 1]
+            while values and values[-1] == '':
+                values.pop()
+            rows.append(values)
+        while rows and not rows[-1]:
+            rows.pop()
+        return {'range': a1, 'values': rows} if rows else {'range': a1}
+
+    def batchGet(self, spreadsheetId, ranges, majorDimension='ROWS'):
+        self.calls.append(('batchGet', list(ranges)))
+        return FakeRequest({'spreadsheetId': spreadsheetId, 'valueRanges': [self.read(a1) for a1 in ranges]})
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.calls.append(('batchUpdate', [data['range'] for data in body['data']]))
+        cells = 0
+        for data in body['data']:
+            sheet, r1, _, c1, _ = parse_a1(data['range'])
+            for i, values in enumerate(data['values']):
+                for j, value in enumerate(values):
+                    self.set_cell(sheet, r1 + i, c1 + j, value)
+                    cells += 1
+        return FakeRequest({'spreadsheetId': spreadsheetId, 'totalUpdatedCells': cells})
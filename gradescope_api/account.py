@@ -1,4 +1,7 @@
-from bs4 import BeautifulSoup
+try:
+   from scraping import parse_create_course_form
+except ModuleNotFoundError:
+   from .scraping import parse_create_course_form
 try:
    from course import GSCourse
 except ModuleNotFoundError:
@@ -27,12 +30,7 @@ class GSAccount():
     def create_course(self, name, shortname, description, term, year, school, entry_code_enabled = False):
         '''Returns course ID'''
         account_resp = self.session.get("https://www.gradescope.com/account")
-        parsed_account_resp = BeautifulSoup(account_resp.text, 'html.parser')
-
-        create_modal = parsed_account_resp.find('div', id = 'createCourseModal')
-        authenticity_token = create_modal.find('input', attrs = {'name': 'authenticity_token'}).get('value')
-        schools = create_modal.find('select', id = 'course_school_id')
-        school_id = schools.find('option', text = school).get('value') # TODO Fix this on bad params.
+        authenticity_token, school_id = parse_create_course_form(account_resp.text, school)
         course_data = {
             "utf8": "✓",
             "authenticity_token": authenticity_token,
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+A local, content-addressed store of downloaded submission archives.
+
+Archives are keyed by (course, assignment, submission id) and stored once per content hash under
+<root>/objects/<sha256[:2]>/<sha256>.zip, so identical zips are deduplicated. Downloads are streamed to
+disk in chunks, verified (length and zip integrity) and then moved into place atomically. The store is
+kept under max_bytes by evicting the least recently used archives.
+'''
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+
+ARCHIVE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'gradescope_api', 'archives')
+ARCHIVE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class ArchiveVerificationError(Exception):
+    pass
+
+
+def stored_archives_info(root = ARCHIVE_CACHE_DIR):
+    '''Returns (number of archives, total bytes) of the store at root, or None, without creating it.'''
+    try:
+        with open(os.path.join(root, 'index.json')) as f:
+            objects = json.load(f).get('objects', {})
+    except (FileNotFoundError, ValueError):
+        return None
+    return len(objects), sum(entry['size'] for entry in objects.values())
+
+
+class SubmissionArchiveCache():
+
+    def __init__(self, root = ARCHIVE_CACHE_DIR, max_bytes = ARCHIVE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, 'index.json')
+        self.lock = threading.RLock()
+        os.makedirs(os.path.join(root, 'objects'), exist_ok = True)
+        self.index = self._load_index()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~LOOKUPS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    @staticmethod
+    def key(cid, aid, subid):
+        return f'{cid}/{aid}/{subid}'
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest + '.zip')
+
+    def get(self, cid, aid, subid):
+        '''Returns the path of the cached archive of a submission, or None if it is not (or no longer) cached.'''
+        with self.lock:
+            digest = self.index['keys'].get(self.key(cid, aid, subid))
+            if digest is None:
+                return None
+            entry = self.index['objects'].get(digest)
+            path = self.object_path(digest)
+            if entry is None or not os.path.isfile(path) or os.path.getsize(path) != entry['size']:
+                # the object was removed or damaged behind our back
+                self._forget(digest)
+                self._save_index()
+                return None
+            entry['last_access'] = time.time()
+            self._save_index()
+            return path
+
+    def fetch(self, session, url, cid, aid, subid):
+        '''
+        Returns the path of the archive of a submission, downloading it from url with session
+        (a requests.Session) unless it is already cached.
+        '''
+        path = self.get(cid, aid, subid)
+        if path is not None:
+            return path
+
+        temp_path = None
+        try:
+            # the temp file is removed below whatever happens, even if the download breaks off midway
+            fd, temp_path = tempfile.mkstemp(dir = self.root, suffix = '.part')
+            with os.fdopen(fd, 'wb') as temp_file, session.get(url, stream = True) as zip_resp:
+                zip_resp.raise_for_status()
+                # iter_content decodes gzip/deflate bodies, while Content-Length is the size of the encoded body
+                expected_size = zip_resp.headers.get('Content-Length') \
+                    if zip_resp.headers.get('Content-Encoding', 'identity') == 'identity' else None
+                digest, size = self._download(zip_resp, temp_file)
+            if expected_size is not None and int(expected_size) != size:
+                raise ArchiveVerificationError(f"Truncated download of {url}: got {size} of {expected_size} bytes")
+            if not zipfile.is_zipfile(temp_path):
+                raise ArchiveVerificationError(f"The download of {url} is not a zip file")
+            return self._store(temp_path, digest, size, self.key(cid, aid, subid))
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def open(self, session, url, cid, aid, subid):
+        '''Like fetch, but returns the archive opened for binary reading.'''
+        return open(self.fetch(session, url, cid, aid, subid), 'rb')
+
+    def total_size(self):
+        return sum(entry['size'] for entry in self.index['objects'].values())
+
+    # ~~~~~~~~~~~~~~~~~~~~~~HOUSEKEEPING~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _download(self, zip_resp, temp_file):
+        '''Stream a response to a temporary file next to the objects, hashing it on the way. Returns (digest, size).'''
+        sha = hashlib.sha256()
+        size = 0
+        for chunk in zip_resp.iter_content(chunk_size = DOWNLOAD_CHUNK_SIZE):
+            sha.update(chunk)
+            size += len(chunk)
+            temp_file.write(chunk)
+        return sha.hexdigest(), size
+
+    def _store(self, temp_path, digest, size, key):
+        with self.lock:
+            path = self.object_path(digest)
+            if not os.path.isfile(path):
+                os.makedirs(os.path.dirname(path), exist_ok = True)
+                os.replace(temp_path, path)
+            # else: same content already stored under another key, the temp file is dropped by the caller
+            self.index['keys'][key] = digest
+            self.index['objects'][digest] = {'size': size, 'last_access': time.time()}
+            self._evict(keep = digest)
+            self._save_index()
+            return path
+
+    def _evict(self, keep = None):
+        '''Drop least recently used archives until the store fits in max_bytes (never the one just stored).'''
+        total = self.total_size()
+        for digest, entry in sorted(self.index['objects'].items(), key = lambda item: item[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            total -= entry['size']
+            self._forget(digest)
+
+    def _forget(self, digest):
+        self.index['objects'].pop(digest, None)
+        self.index['keys'] = {key: d for key, d in self.index['keys'].items() if d != digest}
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'keys': {}, 'objects': {}}
+
+    def _save_index(self):
+        fd, temp_path = tempfile.mkstemp(dir = self.root, suffix = '.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temp_path, self.index_path)
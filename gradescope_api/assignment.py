@@ -1,19 +1,84 @@
-import requests
-from bs4 import BeautifulSoup
 try:
-   from question import GSQuestion
+   from scraping import parse_review_grades, parse_outline
+except ModuleNotFoundError:
+   from .scraping import parse_review_grades, parse_outline
+try:
+   from throttle import RateLimiter
+except ModuleNotFoundError:
+   from .throttle import RateLimiter
+try:
+   from grading_waiter import wait_for_grading, GRADING_TIMEOUT
+except ModuleNotFoundError:
+   from .grading_waiter import wait_for_grading, GRADING_TIMEOUT
+try:
+   from uploads import (PAST_SUBMISSIONS_QUERY, SUBMISSION_DETAILS_QUERY, UPLOAD_HEADERS, upload_params,
+                        uploaded_submission_url, highest_score_submission, past_submission_fields,
+                        graded_submission_fields)
+except ModuleNotFoundError:
+   from .uploads import (PAST_SUBMISSIONS_QUERY, SUBMISSION_DETAILS_QUERY, UPLOAD_HEADERS, upload_params,
+                         uploaded_submission_url, highest_score_submission, past_submission_fields,
+                         graded_submission_fields)
+try:
+   from question import GSQuestion, GSOutlineEdit
    from submission import GSSubmission
 except ModuleNotFoundError:
-   from .question import GSQuestion
+   from .question import GSQuestion, GSOutlineEdit
    from .submission import GSSubmission
+try:
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None # uploads are then built in memory by requests
+import io
 import json
 import os
 import zipfile
 import tempfile
-from datetime import datetime
-from time import sleep
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
 
 SUBMISSIONS_PATH = 'submissions'
+SUBMISSION_FETCH_WORKERS = 8 # default number of concurrent past_submissions requests in get_submissions
+REVIEW_GRADES_TTL = 300 # seconds before the cached review_grades index is considered stale
+SPOOL_THRESHOLD = 16 * 1024 * 1024 # downloaded zips bigger than this are spooled to an (anonymous) temp file
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def as_zip_source(source):
+    '''Accept a path, a binary file object or bytes as the source of a zip file.'''
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+class ZipMemberReader():
+    '''
+    A read-only stream over a zip member that knows how many (uncompressed) bytes are left to read,
+    as streaming multipart encoders need it.
+    '''
+
+    def __init__(self, thezip, info):
+        self.member = thezip.open(info)
+        self.size = info.file_size
+        self.position = 0
+
+    def __len__(self):
+        return self.size - self.position
+
+    def read(self, size=-1):
+        data = self.member.read(size)
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self.member.close()
+
+def zip_members(thezip):
+    '''Yields (relative path, reader) for every file in the zip, including the ones in sub-directories.'''
+    for info in thezip.infolist():
+        if info.is_dir() or info.filename.startswith('__MACOSX/'):
+            continue
+        yield info.filename, ZipMemberReader(thezip, info)
 
 class GSAssignment():
 
@@ -29,84 +94,88 @@ class GSAssignment():
         self.due_date = due_date
         self.questions = []
         self.submissions = []
+        self.review_grades_ttl = REVIEW_GRADES_TTL
+        self._review_grades = None # email -> row entry, see _lazy_load_review_grades
+        self._review_grades_loaded_at = None
+        self._review_grades_lock = threading.Lock() # the workers of get_submissions and of the batch mode share it
+        self.last_grading_result = None
 
-
-    def post_submission(self, fname, student_id):
+    def post_submission(self, fname, student_id, timeout=GRADING_TIMEOUT):
         '''
-        Upload Code files for a submission.
-        fname: The name of the zip file which contains the files to upload
+        Upload Code files for a submission, and wait for it to be graded.
+        fname: The zip which contains the files to upload: a path, a binary file object or bytes.
+               Files in sub-directories are uploaded with their relative path.
+        timeout: seconds to wait for the grading to finish.
+        Returns the graded submission, or False. The outcome of the wait is kept in self.last_grading_result.
         '''
+        # The zip members are streamed straight into the multipart body, nothing is extracted to disk
+        with zipfile.ZipFile(as_zip_source(fname), 'r') as thezip:
+            def build(token):
+                # called again (with fresh member streams) if the token is rejected
+                token_params = upload_params(student_id, token)
+                submission_files = [('submission[files][]', (name, member, 'application/octet-stream'))
+                                    for name, member in zip_members(thezip)]
+                if MultipartEncoder is not None:
+                    body = MultipartEncoder(fields = list(token_params.items()) + submission_files)
+                    return {'data': body, 'headers': dict(UPLOAD_HEADERS, **{'Content-Type': body.content_type})}
+                return {'data': token_params, 'files': submission_files, 'headers': UPLOAD_HEADERS}
+
+            submission_resp = self.course._csrf_request('post', 'https://www.gradescope.com/courses/'+self.course.cid+
+                                                        '/assignments/'+self.aid+'/submissions', build,
+                                                        token_url = 'https://www.gradescope.com/courses/'+self.course.cid+
+                                                        '/assignments/'+self.aid+'/submissions/new?owner_id='+student_id)
+
+        submission_path = uploaded_submission_url(submission_resp.status_code, json.loads(submission_resp.text))
+        if submission_path is None:
+            return False
 
-        # First, get the authenticity_token
-        submission_resp = self.course.session.get('https://www.gradescope.com/courses/'+self.course.cid+
-                                                    '/assignments/'+self.aid+'/submissions/new?owner_id='+student_id)
-        parsed_assignment_resp = BeautifulSoup(submission_resp.text, 'html.parser')
-        authenticity_token = parsed_assignment_resp.find('meta', attrs = {'name': 'csrf-token'} ).get('content')
-
-        # Now, post the submission
-        params = {
-            "submission[owner_id]": student_id,
-            "utf8": "✓",
-            "authenticity_token": authenticity_token,
-            "submission[method]": "upload",
-            "null": "",
-            "submission[leaderboard_name]": ""
-        }
-
-        headers = {
-            'Accept': 'application/json',
-            'X-Requested-With': 'XMLHttpRequest',
-        }
-
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Extract the zip file
-            with zipfile.ZipFile(fname, 'r') as thezip:
-                thezip.extractall(temp_dir)
-
-            submission_files = []
-            for filename in os.listdir(temp_dir):
-                file_path = os.path.join(temp_dir, filename)
-                # skip sub-directories. Only upload files
-                if not os.path.isfile(file_path):
-                    continue
-                submission_files.append(('submission[files][]', (filename, open(file_path, 'rb'), 'application/octet-stream')))
+        # The roster of submissions just changed, so the cached review_grades index is stale
+        self.invalidate_review_grades()
 
+        # Else: wait for the submission to be graded and return it
+        submission_url = 'https://www.gradescope.com'+submission_path
+        self.last_grading_result = wait_for_grading(self.course.session, submission_url, timeout)
+        if not self.last_grading_result:
+            print(f"Submission {submission_url} was not graded: {self.last_grading_result}")
+            return False
 
-            submission_resp = self.course.session.post('https://www.gradescope.com/courses/'+self.course.cid+
-                                                        '/assignments/'+self.aid+'/submissions',
-                                                        data = params,
-                                                        files = submission_files,
-                                                        headers=headers)
+        # status.json does not carry the submission details, fetch them once now that it is graded
+        submission_json = json.loads(self.course.session.get(submission_url+'.json'+SUBMISSION_DETAILS_QUERY).text)
+        fields = graded_submission_fields(submission_json, self.last_grading_result)
 
-        # parse submission response json
-        #  '{"success":true,"url":"/courses/569119/assignments/3394470/submissions/215229408"}'
-        submission_json = json.loads(submission_resp.text)
-        if submission_resp.status_code != requests.codes.ok or not submission_json['success']:
-            return False
+        print(f"Submission successfully posted for {fields['name']} with score {fields['score']}")
+        return GSSubmission(student_id=student_id, assignment=self, **fields)
 
-        # Else: proceed to check the status of the submission and return the submission when it's graded
-        submission_url = 'https://www.gradescope.com'+submission_json['url']+'.json?content=react'
-        while True:
-            try:
-                submission_resp = self.course.session.get(submission_url)
-                submission_json = json.loads(submission_resp.text)
-                #  import ipdb; ipdb.set_trace()
-                score = submission_json['assignment_submission']['score']
-                time = datetime.fromisoformat(submission_json['assignment_submission']['created_at'])
-                submission_id = submission_json['assignment_submission']['id']
-                name = submission_json['course_members'][0]['name']
-                email = submission_json['course_members'][0]['email']
-                if score:
-                    break
-            except:
-                print("Waiting for the submission to be graded...")
-                sleep(5) # wait 5 seconds before trying again
-
-        print(f"Submission successfully posted for {name} with score {score}")
-        return GSSubmission(subid=submission_id, name=name, email=email, score=score,
-                            time=time, student_id=student_id, assignment=self)
 
 
+    def download_submission_zip(self, subid):
+        '''
+        Stream the zip of a submission into a spooled buffer: it stays in memory up to SPOOL_THRESHOLD bytes and
+        moves to an anonymous temporary file beyond that, so there is nothing to clean up.
+        Returns the buffer (a binary file object positioned at 0); it can be passed to post_submission.
+        '''
+        zip_resp = self.course.session.get('https://www.gradescope.com/courses/'+self.course.cid+
+                                           '/assignments/'+self.aid+'/submissions/'+str(subid)+'.zip', stream=True)
+        zip_resp.raise_for_status()
+        buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
+        with zip_resp:
+            for chunk in zip_resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                buffer.write(chunk)
+        buffer.seek(0)
+        return buffer
+
+    def get_submission_archive(self, subid, cache=None):
+        '''
+        Returns the zip of a submission opened for binary reading.
+        cache (optional): a SubmissionArchiveCache. If given, the archive is served from (and stored in) the
+        local archive store instead of being downloaded every time.
+        '''
+        if cache is None:
+            return self.download_submission_zip(subid)
+        return cache.open(self.course.session,
+                          'https://www.gradescope.com/courses/'+self.course.cid+
+                          '/assignments/'+self.aid+'/submissions/'+str(subid)+'.zip',
+                          self.course.cid, self.aid, subid)
 
     def get_submission(self, email, maxdate=None):
         '''
@@ -114,83 +183,82 @@ class GSAssignment():
         maxdate (optional): datetime object. If provided, only submissions on or before this date will be considered.
         Returns a submission object for the given email.
         '''
-        submission_resp = self.course.session.get('https://www.gradescope.com/courses/'+self.course.cid+
-                                                  '/assignments/'+self.aid+'/review_grades')
-        parsed_submission_resp = BeautifulSoup(submission_resp.text, 'html.parser')
-
-        table = parsed_submission_resp.find('table', attrs={'class':'table js-reviewGradesTable'})
-        tbody = table.find('tbody')
-        for row in tbody.find_all('tr'):
-            name = row.find_all('td')[0].text
-            if not row.find_all('td')[0].find_all('a'):
-                # if there is no link, there is no submission
-                continue
-            if email == row.find_all('td')[2].text:
-                submission_id = row.find_all('td')[0].find_all('a')[0].get('href').split('/')[-1]
-                submission = self.get_highest_score_submission(submission_id, maxdate)
-                if not submission:
-                    return None
-                score = submission['score']
-                time = datetime.fromisoformat(submission['created_at'])
-                submission_id = submission['id']
-                student_id = submission['owners'][0]['id']
-                return GSSubmission(subid=submission_id, name=name, email=email, score=score,
-                                    time=time, student_id=student_id, assignment=self)
-
-        return None
-
-
-    def get_submissions(self, download=False):
+        entry = self.get_review_grades_entry(email)
+        if not entry or not entry['subid']:
+            # either not on the roster, or there is no submission
+            return None
+        submission = self.get_highest_score_submission(entry['subid'], maxdate)
+        if not submission:
+            return None
+        return GSSubmission(name=entry['name'], email=email, assignment=self, **past_submission_fields(submission))
+
+
+    def get_submissions(self, download=False, max_workers=SUBMISSION_FETCH_WORKERS, rate_limit=None):
         '''
         Get the list of submissions for this assignment.
+        The submission histories are fetched concurrently over the course session.
+        max_workers: number of histories fetched in parallel (1 fetches them one after another).
+        rate_limit (optional): maximum number of history requests per second.
+        Submissions are appended to self.submissions in roster order. Returns a dict of email -> exception
+        for the students whose submission could not be fetched.
         '''
-        #  submission_resp = self.course.session.get('https://www.gradescope.com/courses/'+self.course.cid+
-                                                  #  '/assignments/'+self.aid+'/submissions')
-        #  parsed_submission_resp = BeautifulSoup(submission_resp.text, 'html.parser')
-        #  with open('submissions.html', 'w') as f:
-            #  f.write(str(parsed_submission_resp))
+        limiter = RateLimiter(rate_limit, burst = max_workers) if rate_limit else None
 
-        submission_resp = self.course.session.get('https://www.gradescope.com/courses/'+self.course.cid+
-                                                  '/assignments/'+self.aid+'/review_grades')
-        parsed_submission_resp = BeautifulSoup(submission_resp.text, 'html.parser')
-        with open('review_grades.html', 'w') as f:
-            f.write(str(parsed_submission_resp))
-
-
-        table = parsed_submission_resp.find('table', attrs={'class':'table js-reviewGradesTable'})
-        tbody = table.find('tbody')
-        for row in tbody.find_all('tr'):
-            name = row.find_all('td')[0].text
-            if not row.find_all('td')[0].find_all('a'):
-                # if there is no link, there is no submission
-                print(f"No submission for {name}")
+        entries = []
+        for email, entry in self._lazy_load_review_grades().items():
+            if not entry['subid']:
+                print(f"No submission for {entry['name']}")
                 continue
-            submission_id = row.find_all('td')[0].find_all('a')[0].get('href').split('/')[-1]
-            email = row.find_all('td')[2].text
+            entries.append(entry)
+
+        def fetch(entry):
+            if limiter:
+                limiter.acquire()
+            return self._fetch_highest_score_submission(entry, download)
+
+        failures = {}
+        with ThreadPoolExecutor(max_workers = max(1, max_workers)) as executor:
+            futures = [executor.submit(fetch, entry) for entry in entries]
+            for entry, future in zip(entries, futures):
+                try:
+                    submission = future.result()
+                except Exception as e:
+                    print(f"Failed to fetch the submission of {entry['name']} ({entry['email']}): {e}")
+                    failures[entry['email']] = e
+                    continue
+                print(f"Adding submission {submission.subid} for {submission.name} with score {submission.score} at {submission.time}")
+                self.submissions.append(submission)
 
-            submission = self.get_highest_score_submission(submission_id)
+        return failures
 
-            score = submission['score']
-            time = datetime.fromisoformat(submission['created_at'])
-            submission_id = submission['id']
-            student_id = submission['owners'][0]['id']
-            print(f"Adding submission {submission_id} for {name} with score {score} at {time}")
+    def _fetch_highest_score_submission(self, entry, download=False):
+        '''Build the submission object of a review_grades entry (and optionally download its zip).'''
+        fields = past_submission_fields(self.get_highest_score_submission(entry['subid']))
+        submission_id = str(fields['subid'])
 
-            #  (subid, name, email, score, time, student_id, assignment):
-            self.submissions.append(GSSubmission(subid=submission_id, name=name, email=email, score=score,
-                                                 time=time, student_id=student_id, assignment=self))
+        if download:
+            submission_zip_resp = self.course.session.get('https://www.gradescope.com/courses/'+self.course.cid+
+                                                            '/assignments/'+self.aid+'/submissions/'+submission_id+'.zip')
+            # if submissions path does not exist, create it
+            os.makedirs(SUBMISSIONS_PATH, exist_ok=True)
+            with open(os.path.join(SUBMISSIONS_PATH, f'{submission_id}.zip'), 'wb') as f:
+                f.write(submission_zip_resp.content)
 
+        return GSSubmission(name=entry['name'], email=entry['email'], assignment=self, **fields)
 
-            if download:
-                submission_zip_resp = self.course.session.get('https://www.gradescope.com/courses/'+self.course.cid+
-                                                                '/assignments/'+self.aid+'/submissions/'+submission_id+'.zip')
-                # if submissions path does not exist, create it
-                if not os.path.exists(SUBMISSIONS_PATH):
-                    os.makedirs(SUBMISSIONS_PATH)
-                with open(f'SUBMISSIONS_PATH/{submission_id}.zip', 'wb') as f:
-                    f.write(submission_zip_resp.content)
 
+    def get_review_grades_entry(self, email):
+        '''
+        O(1) lookup of a student's row on the review_grades page.
+        Returns a dict with keys name, email, subid (None if there is no submission) and cells, or None.
+        '''
+        return self._lazy_load_review_grades().get(email)
 
+    def invalidate_review_grades(self):
+        '''Drop the cached review_grades index so that the next lookup refetches it.'''
+        with self._review_grades_lock:
+            self._review_grades = None
+            self._review_grades_loaded_at = None
 
     def get_highest_score_submission(self, sid, maxdate=None) -> dict:
         '''
@@ -198,123 +266,59 @@ class GSAssignment():
         Goes through the whole history of submissions.
         maxdate (optional): datetime object. If provided, only submissions on or before this date will be considered.
         '''
-        #  https://www.gradescope.com/courses/569119/assignments/3394470/submissions/202602875.json?content=react&only_keys[]=past_submissions
         submission_resp = self.course.session.get('https://www.gradescope.com/courses/'+self.course.cid+
-                                                    '/assignments/'+self.aid+'/submissions/'+sid+'.json?content=react&only_keys[]=past_submissions')
-
-        # now process this json
-        submission_json = json.loads(submission_resp.text)
-
-        # loop through all submissions and return the submission with the highest score
-        highest_score = 0
-        highest_score_submission = None
-        for submission in submission_json['past_submissions']:
-            date = datetime.fromisoformat(submission['created_at'])
-            if maxdate and date > maxdate:
-                continue
-            if float(submission['score']) >= highest_score:
-                highest_score = float(submission['score'])
-                highest_score_submission = submission
+                                                    '/assignments/'+self.aid+'/submissions/'+sid+'.json'+PAST_SUBMISSIONS_QUERY)
+        return highest_score_submission(json.loads(submission_resp.text)['past_submissions'], maxdate)
 
-        return highest_score_submission
 
 
 
+    def edit_outline(self):
+        '''
+        Start a transaction over the question outline: edits are queued and sent in a single PATCH
+        when the returned GSOutlineEdit is committed (or its with block ends).
+        '''
+        if not self.questions:
+            self._lazy_load_questions()
+        return GSOutlineEdit(self)
 
     def add_question(self, title, weight, crop = None, content = [], parent_id = None):
-        new_q_data = [q.to_patch() for q in self.questions]
-        new_crop = crop if crop else [{'x1': 10, 'x2': 91, 'y1': 73, 'y2': 93, 'page_number': 1}]
-        new_q = {'title': title, 'weight': weight, 'crop_rect_list': new_crop}
-        if parent_id:
-            # TODO: This should throw a custom exception if a parent is not found
-            parent = [parent for parent in new_q_data if parent['id'] == parent_id][0]
-            if parent['children']:
-                parent['children'].append(new_q)
-            else:
-                parent['children'] = [new_q]
-        else:
-            new_q_data.append(new_q)
-
-        # TODO add id region support
-        new_patch = {'assignment': {'identification_regions': {'name': None, 'sid': None}},
-                     'question_data': new_q_data}
-
-        outline_resp = self.course.session.get('https://www.gradescope.com/courses/' + self.course.cid +
-                                               '/assignments/' + self.aid + '/outline/edit')
-        parsed_outline_resp = BeautifulSoup(outline_resp.text, 'html.parser')
-        authenticity_token = parsed_outline_resp.find('meta', attrs = {'name': 'csrf-token'} ).get('content')
-
-        patch_resp = self.course.session.patch('https://www.gradescope.com/courses/' + self.course.cid +
-                                               '/assignments/' + self.aid + '/outline/',
-                                               headers = {'x-csrf-token': authenticity_token,
-                                                          'Content-Type': 'application/json'},
-                                               data = json.dumps(new_patch,separators=(',',':')))
-
-        if patch_resp.status_code != requests.codes.ok:
-            patch_resp.raise_for_status()
-
-        # TODO this should be done smarter :(
-        self.questions = []
-        self._lazy_load_questions()
+        with self.edit_outline() as outline:
+            outline.add_question(title, weight, crop = crop, parent_id = parent_id)
 
     # TODO allow this to be a predicate remove
     def remove_question(self, title=None, qid=None):
         if not title and not qid:
             return
-        new_q_data = [q.to_patch() for q in self.questions]
-
-        # TODO Yes this is slow and ugly, should be improved
-        if title: 
-            new_q_data = [q for q in new_q_data if q['title'] != title]
-            for q in new_q_data:
-                if q.get('children'):
-                    q['children'] = [sq for sq in q['children'] if sq['title'] != title]
-        else:
-            new_q_data = [q for q in new_q_data if q['id'] != qid]
-            for q in new_q_data:
-                if q.get('children'):
-                    q['children'] = [sq for sq in q['children'] if sq['id'] != qid]
-
-        new_patch = {'assignment': {'identification_regions': {'name': None, 'sid': None}},
-                     'question_data': new_q_data}
+        with self.edit_outline() as outline:
+            outline.remove_question(title = title, qid = qid)
+
+    def _patch_outline(self, new_patch):
+        '''PATCH the outline with the cached csrf token of the course.'''
+        return self.course._csrf_request('patch', 'https://www.gradescope.com/courses/' + self.course.cid +
+                                         '/assignments/' + self.aid + '/outline/',
+                                         lambda token: {'headers': {'x-csrf-token': token,
+                                                                    'Content-Type': 'application/json'},
+                                                        'data': json.dumps(new_patch,separators=(',',':'))},
+                                         token_url = 'https://www.gradescope.com/courses/' + self.course.cid +
+                                         '/assignments/' + self.aid + '/outline/edit')
 
-        outline_resp = self.course.session.get('https://www.gradescope.com/courses/' + self.course.cid +
-                                               '/assignments/' + self.aid + '/outline/edit')
-        parsed_outline_resp = BeautifulSoup(outline_resp.text, 'html.parser')
-        authenticity_token = parsed_outline_resp.find('meta', attrs = {'name': 'csrf-token'} ).get('content')
-
-        patch_resp = self.course.session.patch('https://www.gradescope.com/courses/' + self.course.cid +
-                                               '/assignments/' + self.aid + '/outline/',
-                                               headers = {'x-csrf-token': authenticity_token,
-                                                          'Content-Type': 'application/json'},
-                                               data = json.dumps(new_patch,separators=(',',':')))
-
-        if patch_resp.status_code != requests.codes.ok:
-            patch_resp.raise_for_status()
-
-        # TODO this should be done smarter :(
-        self.questions = []
-        self._lazy_load_questions()
-        
     # TODO INCOMPLETE
     def add_instructor_submission(self, fname):
         '''
         Upload a PDF submission.
+        fname: the path of the PDF
         '''
-        submission_resp = self.session.get('https://www.gradescope.com/courses/'+self.course.cid+
-                                           '/assignments/'+self.aid+'/submission_batches')
-        parsed_assignment_resp = BeautifulSoup(submission_resp.text, 'html.parser')
-        authenticity_token = parsed_assignment_resp.find('meta', attrs = {'name': 'csrf-token'} ).get('content')
-
-        submission_files = {
-            "file" : open(template_file, 'rb')
-        }
-
-        submission_resp = self.session.post('https://www.gradescope.com/courses/'+self.course.cid+
-                                            '/assignments/'+self.aid+'/submission_batches',
-                                            files = assignment_files,
-                                            headers = {'x-csrf-token': authenticity_token})
-        
+        batches_url = 'https://www.gradescope.com/courses/'+self.course.cid+'/assignments/'+self.aid+'/submission_batches'
+        with open(fname, 'rb') as pdf:
+            def build(token):
+                # called again if the token is rejected, so the file is read from the start each time
+                pdf.seek(0)
+                return {'files': {'file': (os.path.basename(fname), pdf, 'application/pdf')},
+                        'headers': {'x-csrf-token': token}}
+
+            return self.course._csrf_request('post', batches_url, build, token_url = batches_url)
+
     # TODO
     def publish_grades(self):
         pass
@@ -326,31 +330,25 @@ class GSAssignment():
     def _lazy_load_questions(self):        
         outline_resp = self.course.session.get('https://www.gradescope.com/courses/' + self.course.cid +
                                                '/assignments/' + self.aid + '/outline/edit')
-        parsed_outline_resp = BeautifulSoup(outline_resp.text, 'html.parser')
-
-        props = parsed_outline_resp.find('div',
-                                         attrs={'data-react-class':'AssignmentOutline'}).get('data-react-props')
-        json_props = json.loads(props)
-        outline = json_props['outline']
+        outline = parse_outline(outline_resp.text)
 
         for question in outline:
-            qid = question['id']
-            title = question['title']
-            parent_id = question['parent_id']
-            weight = question['weight']
-            content = question['content']
-            crop = question['crop_rect_list']
-            children = []
-            qchildren = question.get('children', [])
-            
-            for subquestion in qchildren:
-                c_qid = subquestion['id']
-                c_title = subquestion['title']
-                c_parent_id = subquestion['parent_id']
-                c_weight = subquestion['weight']
-                c_content = subquestion['content']
-                c_crop = subquestion['crop_rect_list']
-                children.append(GSQuestion(c_qid, c_title, c_weight, [], c_parent_id, c_content, c_crop))
-            self.questions.append(GSQuestion(qid, title, weight, children, parent_id, content, crop))
-            
-        
+            self.questions.append(GSQuestion.from_outline(question))
+
+    def _lazy_load_review_grades(self):
+        '''
+        Build (or reuse) the email -> row index of the review_grades page. The page is fetched and parsed
+        once, and the index is reused until it is older than review_grades_ttl or explicitly invalidated.
+        Concurrent callers share a single fetch.
+        '''
+        with self._review_grades_lock:
+            index, loaded_at = self._review_grades, self._review_grades_loaded_at
+            if index is not None and monotonic() - loaded_at < self.review_grades_ttl:
+                return index
+
+            submission_resp = self.course.session.get('https://www.gradescope.com/courses/'+self.course.cid+
+                                                      '/assignments/'+self.aid+'/review_grades')
+            index = parse_review_grades(submission_resp.text)
+            self._review_grades = index
+            self._review_grades_loaded_at = monotonic()
+            return index
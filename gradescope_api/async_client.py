@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+An asyncio-native Gradescope client.
+
+These classes mirror GSConnection, GSCourse and GSAssignment, but every network operation is a coroutine,
+so independent page loads can be overlapped with asyncio.gather:
+
+    async with AsyncGSConnection() as conn:
+        await conn.login(email, password)
+        await conn.get_account()
+        course = conn.account.instructor_courses[cid]
+        await asyncio.gather(course.load_assignments(), course.load_roster())
+
+All the parsing is shared with the blocking classes (see scraping.py), which remain the default
+interface of the package. The requests get the same resilience as those of GSConnection: timeouts, retries
+and an optional rate limit (async_transport.py), the csrf token cache and its replays for the uploads
+(csrf.AsyncCSRFTokenCache), and per-endpoint metrics (conn.metrics). Needs httpx; HTTP/2 is used when the
+h2 package is installed.
+'''
+import asyncio
+import zipfile
+from time import monotonic
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+   from scraping import (parse_login_token, parse_account_courses, parse_assignments_table, parse_roster,
+                         parse_review_grades, parse_outline)
+except ModuleNotFoundError:
+   from .scraping import (parse_login_token, parse_account_courses, parse_assignments_table, parse_roster,
+                          parse_review_grades, parse_outline)
+try:
+   from pyscope import ConnState
+   from csrf import async_csrf_cache
+   from http_metrics import HTTPMetrics
+   from http_transport import CONNECT_TIMEOUT, READ_TIMEOUT, UPLOAD_TIMEOUT, MAX_RETRIES, BACKOFF_FACTOR
+   from course import assignment_fields, LoadedCapabilities
+   from assignment import REVIEW_GRADES_TTL, SUBMISSION_FETCH_WORKERS, as_zip_source, zip_members
+   from person import GSPerson
+   from question import GSQuestion
+   from submission import GSSubmission
+   from grading_waiter import async_wait_for_grading, GRADING_TIMEOUT
+   from uploads import (PAST_SUBMISSIONS_QUERY, SUBMISSION_DETAILS_QUERY, UPLOAD_HEADERS, upload_params,
+                        uploaded_submission_url, highest_score_submission, past_submission_fields,
+                        graded_submission_fields)
+except ModuleNotFoundError:
+   from .pyscope import ConnState
+   from .csrf import async_csrf_cache
+   from .http_metrics import HTTPMetrics
+   from .http_transport import CONNECT_TIMEOUT, READ_TIMEOUT, UPLOAD_TIMEOUT, MAX_RETRIES, BACKOFF_FACTOR
+   from .course import assignment_fields, LoadedCapabilities
+   from .assignment import REVIEW_GRADES_TTL, SUBMISSION_FETCH_WORKERS, as_zip_source, zip_members
+   from .person import GSPerson
+   from .question import GSQuestion
+   from .submission import GSSubmission
+   from .grading_waiter import async_wait_for_grading, GRADING_TIMEOUT
+   from .uploads import (PAST_SUBMISSIONS_QUERY, SUBMISSION_DETAILS_QUERY, UPLOAD_HEADERS, upload_params,
+                         uploaded_submission_url, highest_score_submission, past_submission_fields,
+                         graded_submission_fields)
+
+GRADESCOPE_URL = 'https://www.gradescope.com'
+MAX_CONNECTIONS = 20
+
+try:
+    import h2
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+
+class AsyncGSConnection():
+    '''The asyncio counterpart of GSConnection. Use it as an async context manager, or call close().'''
+
+    def __init__(self, http2 = True, max_connections = MAX_CONNECTIONS, transport = None, retries = MAX_RETRIES,
+                 backoff_factor = BACKOFF_FACTOR, rate_limit = None, timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)):
+        '''
+        Initialize the (keep-alive, HTTP/2 when possible) client for the connection.
+        transport (optional): the httpx transport to send the requests with (http2 and max_connections are then
+                              up to the transport), e.g. the one of benchmarks/gradescope_emulator.py
+        retries, backoff_factor, rate_limit: see async_transport.AsyncResilientTransport
+        timeout: the default (connect, read) timeout of the requests; the uploads get UPLOAD_TIMEOUT to read
+        '''
+        if httpx is None:
+            raise ImportError("AsyncGSConnection needs httpx: pip install 'httpx[http2]'")
+        try:
+           from async_transport import AsyncResilientTransport
+        except ModuleNotFoundError:
+           from .async_transport import AsyncResilientTransport
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(http2 = http2 and HAS_HTTP2,
+                                                 limits = httpx.Limits(max_connections = max_connections,
+                                                                       max_keepalive_connections = max_connections))
+        connect, read = timeout
+        self.client = httpx.AsyncClient(base_url = GRADESCOPE_URL,
+                                        follow_redirects = True,
+                                        timeout = httpx.Timeout(read, connect = connect),
+                                        transport = AsyncResilientTransport(transport, retries, backoff_factor,
+                                                                            rate_limit, burst = max_connections))
+        self.metrics = HTTPMetrics().attach_async(self.client) # every request of the client, per endpoint
+        self.state = ConnState.INIT
+        self.account = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def login(self, email, pswd):
+        '''
+        Login to gradescope using email and password.
+        Note that the future commands depend on account privilages.
+        '''
+        init_resp = await self.client.get("/")
+        auth_token = parse_login_token(init_resp.text)
+
+        login_data = {
+            "utf8": "✓",
+            "session[email]": email,
+            "session[password]": pswd,
+            "session[remember_me]": 0,
+            "commit": "Log In",
+            "session[remember_me_sso]": 0,
+            "authenticity_token": auth_token,
+        }
+        login_resp = await self.client.post("/login", params=login_data)
+        if login_resp.history and login_resp.history[0].status_code == httpx.codes.FOUND:
+            self.state = ConnState.LOGGED_IN
+            self.account = AsyncGSAccount(email, self.client)
+            return True
+        return False
+
+    async def get_account(self):
+        '''
+        Gets and parses account data after login. Returns False if we are not in a logged in state.
+        '''
+        if self.state != ConnState.LOGGED_IN:
+            return False
+        account_resp = await self.client.get("/account")
+        for cid, name, shortname, year in parse_account_courses(account_resp.text):
+            if year is None:
+                return False
+            self.account.add_class(cid, name, shortname, year, instructor = True)
+        return True
+
+
+class AsyncGSAccount():
+    '''Tracks the courses of the account of an AsyncGSConnection.'''
+
+    def __init__(self, email, client):
+        self.email = email
+        self.client = client
+        self.instructor_courses = {}
+        self.student_courses = {}
+
+    def add_class(self, cid, name, shortname, year, instructor = False):
+        courses = self.instructor_courses if instructor else self.student_courses
+        courses[cid] = AsyncGSCourse(cid, name, shortname, year, self.client)
+
+
+class AsyncGSCourse():
+
+    def __init__(self, cid, name, shortname, year, client):
+        '''Create a course object whose assignments and roster are loaded on demand.'''
+        self.cid = cid
+        self.name = name
+        self.shortname = shortname
+        self.year = year
+        self.client = client
+        self.assignments = {}
+        self.roster = {}
+        self.state = set()
+
+    @property
+    def csrf_scope(self):
+        return 'course/' + self.cid
+
+    async def _csrf_request(self, method, url, build, token_url = None):
+        '''Send a mutating request with the cached csrf token of this course, see GSCourse._csrf_request.'''
+        if token_url is None:
+            token_url = '/courses/' + self.cid
+        return await async_csrf_cache(self.client).request(method, url, self.csrf_scope, token_url, build)
+
+    async def load_assignments(self):
+        '''Load (or reload) the assignment dictionary.'''
+        assignment_resp = await self.client.get('/courses/'+self.cid+'/assignments')
+        assignments = {}
+        for row in parse_assignments_table(assignment_resp.text):
+            fields = assignment_fields(row)
+            assignments[fields['name']] = AsyncGSAssignment(course=self, **fields)
+        self.assignments = assignments
+        self.state.add(LoadedCapabilities.ASSIGNMENTS)
+        return self.assignments
+
+    async def load_roster(self):
+        '''Load (or reload) the roster.'''
+        membership_resp = await self.client.get('/courses/' + self.cid + '/memberships')
+        self.roster = {name: GSPerson(name, data_id, email, role, submissions, linked)
+                       for name, data_id, email, role, submissions, linked in parse_roster(membership_resp.text)}
+        self.state.add(LoadedCapabilities.ROSTER)
+        return self.roster
+
+
+class AsyncGSAssignment():
+
+    def __init__(self, name, aid, points, percent_graded, complete, regrades_on, course, due_date):
+        '''Create a assignment object'''
+        self.name = name
+        self.aid = aid
+        self.points = points
+        self.percent_graded = percent_graded
+        self.complete = complete
+        self.regrades_on = regrades_on
+        self.course = course
+        self.due_date = due_date
+        self.questions = []
+        self.submissions = []
+        self.review_grades_ttl = REVIEW_GRADES_TTL
+        self._review_grades = None
+        self._review_grades_loaded_at = None
+        self._review_grades_lock = asyncio.Lock()
+        self.last_grading_result = None
+
+    @property
+    def path(self):
+        return '/courses/'+self.course.cid+'/assignments/'+self.aid
+
+    async def load_review_grades(self):
+        '''
+        Build (or reuse) the email -> row index of the review_grades page, see GSAssignment.
+        Concurrent callers share a single fetch.
+        '''
+        async with self._review_grades_lock:
+            if self._review_grades is None or monotonic() - self._review_grades_loaded_at >= self.review_grades_ttl:
+                submission_resp = await self.course.client.get(self.path+'/review_grades')
+                self._review_grades = parse_review_grades(submission_resp.text)
+                self._review_grades_loaded_at = monotonic()
+        return self._review_grades
+
+    def invalidate_review_grades(self):
+        self._review_grades = None
+        self._review_grades_loaded_at = None
+
+    async def get_highest_score_submission(self, sid, maxdate=None) -> dict:
+        '''
+        Get the highest score submission for a student, see GSAssignment.get_highest_score_submission.
+        '''
+        submission_resp = await self.course.client.get(self.path+'/submissions/'+sid+'.json'+PAST_SUBMISSIONS_QUERY)
+        return highest_score_submission(submission_resp.json()['past_submissions'], maxdate)
+
+    async def get_submission(self, email, maxdate=None):
+        '''
+        email: The email of the student whose submission we want to get.
+        maxdate (optional): datetime object. If provided, only submissions on or before this date will be considered.
+        Returns a submission object for the given email, or None.
+        '''
+        entry = (await self.load_review_grades()).get(email)
+        if not entry or not entry['subid']:
+            return None
+        submission = await self.get_highest_score_submission(entry['subid'], maxdate)
+        if not submission:
+            return None
+        return AsyncGSSubmission(name=entry['name'], email=email, assignment=self, **past_submission_fields(submission))
+
+    async def get_submissions(self, max_workers=SUBMISSION_FETCH_WORKERS):
+        '''
+        Get the list of submissions for this assignment, fetching at most max_workers histories at a time.
+        Returns a dict of email -> exception for the students whose submission could not be fetched.
+        '''
+        semaphore = asyncio.Semaphore(max_workers)
+        entries = [entry for entry in (await self.load_review_grades()).values() if entry['subid']]
+
+        async def fetch(entry):
+            async with semaphore:
+                return await self.get_submission(entry['email'])
+
+        results = await asyncio.gather(*(fetch(entry) for entry in entries), return_exceptions=True)
+        failures = {}
+        for entry, result in zip(entries, results):
+            if isinstance(result, Exception):
+                failures[entry['email']] = result
+            elif result is not None:
+                self.submissions.append(result)
+        return failures
+
+    async def post_submission(self, fname, student_id, timeout=GRADING_TIMEOUT):
+        '''
+        Upload Code files for a submission and wait until it is graded, see GSAssignment.post_submission.
+        fname: The zip which contains the files to upload: a path, a binary file object or bytes.
+        '''
+        with zipfile.ZipFile(as_zip_source(fname), 'r') as thezip:
+            def build(token):
+                # called again (with fresh member streams) if the token is rejected or the upload turned away
+                submission_files = [('submission[files][]', (name, member, 'application/octet-stream'))
+                                    for name, member in zip_members(thezip)]
+                return {'data': upload_params(student_id, token), 'files': submission_files,
+                        'headers': UPLOAD_HEADERS, 'timeout': httpx.Timeout(UPLOAD_TIMEOUT, connect = CONNECT_TIMEOUT)}
+
+            submission_resp = await self.course._csrf_request('POST', self.path+'/submissions', build,
+                                                              token_url = self.path+'/submissions/new?owner_id='+
+                                                              str(student_id))
+        submission_path = uploaded_submission_url(submission_resp.status_code, submission_resp.json())
+        if submission_path is None:
+            return False
+        self.invalidate_review_grades()
+
+        self.last_grading_result = await async_wait_for_grading(self.course.client, submission_path, timeout)
+        if not self.last_grading_result:
+            return False
+
+        submission_json = (await self.course.client.get(submission_path+'.json'+SUBMISSION_DETAILS_QUERY)).json()
+        return AsyncGSSubmission(student_id=student_id, assignment=self,
+                                 **graded_submission_fields(submission_json, self.last_grading_result))
+
+    async def load_questions(self):
+        '''Load (or reload) the question outline.'''
+        outline_resp = await self.course.client.get(self.path+'/outline/edit')
+        self.questions = [GSQuestion.from_outline(question) for question in parse_outline(outline_resp.text)]
+        return self.questions
+
+
+class AsyncGSSubmission(GSSubmission):
+    '''A submission of an AsyncGSAssignment.'''
+
+    async def download(self):
+        '''Returns the content of the submission zip.'''
+        zip_resp = await self.course.client.get(self.url.replace(GRADESCOPE_URL, '') + '.zip')
+        zip_resp.raise_for_status()
+        return zip_resp.content
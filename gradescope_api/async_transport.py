@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The transport of the asyncio client: the httpx counterpart of http_transport.ResilientAdapter.
+
+AsyncResilientTransport wraps the transport of an httpx.AsyncClient (see AsyncGSConnection):
+  - idempotent requests are retried on connection and read errors and on 429/5xx responses, with the
+    exponential backoff and jitter of the blocking transport, or after the Retry-After delay (capped).
+  - mutating requests are only retried when the connection could not be made; the 429/503 answers to them
+    are replayed by csrf.AsyncCSRFTokenCache, which rebuilds their body.
+  - an optional token bucket keeps the requests under rate_limit per second, across all the coroutines.
+The number of retries of a request is left in the extensions of its response ('retries'), for HTTPMetrics.
+Needs httpx.
+'''
+import asyncio
+import random
+import httpx
+try:
+   from throttle import RateLimiter
+   from http_transport import (MAX_RETRIES, BACKOFF_FACTOR, BACKOFF_JITTER, BACKOFF_MAX, POOL_SIZE, RETRY_STATUSES,
+                               IDEMPOTENT_METHODS, replay_delay)
+except ModuleNotFoundError:
+   from .throttle import RateLimiter
+   from .http_transport import (MAX_RETRIES, BACKOFF_FACTOR, BACKOFF_JITTER, BACKOFF_MAX, POOL_SIZE, RETRY_STATUSES,
+                                IDEMPOTENT_METHODS, replay_delay)
+
+# nothing was sent when these are raised, so every method can be retried
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def retry_delay(retries, backoff_factor = BACKOFF_FACTOR):
+    '''The backoff before retry number retries + 1: 0, then backoff_factor * 2, 4, 8... plus a jitter'''
+    if retries == 0:
+        return 0
+    return min(BACKOFF_MAX, backoff_factor * 2 ** retries) + random.uniform(0, BACKOFF_JITTER)
+
+
+class AsyncRateLimiter():
+    '''A RateLimiter whose callers wait with asyncio.sleep instead of blocking the event loop'''
+
+    def __init__(self, rate, burst = 1):
+        self.limiter = RateLimiter(rate, burst)
+
+    async def acquire(self):
+        while True:
+            wait = self.limiter.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, transport, retries = MAX_RETRIES, backoff_factor = BACKOFF_FACTOR, rate_limit = None,
+                 burst = POOL_SIZE):
+        '''
+        transport: the httpx transport that sends the requests
+        retries: the number of retries of a request, backoff_factor: the base of their exponential backoff
+        rate_limit: the maximum number of requests per second (None: no limit), in bursts of up to burst
+        '''
+        self.transport = transport
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.limiter = AsyncRateLimiter(rate_limit, burst) if rate_limit else None
+
+    async def handle_async_request(self, request):
+        idempotent = request.method in IDEMPOTENT_METHODS
+        retries = 0
+        while True:
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except CONNECT_ERRORS:
+                if retries >= self.retries:
+                    raise
+                delay = retry_delay(retries, self.backoff_factor)
+            except httpx.TransportError:
+                if retries >= self.retries or not idempotent:
+                    raise
+                delay = retry_delay(retries, self.backoff_factor)
+            else:
+                if not idempotent or response.status_code not in RETRY_STATUSES or retries >= self.retries:
+                    response.extensions['retries'] = retries
+                    return response
+                delay = replay_delay(response, retries, self.backoff_factor) if response.headers.get('Retry-After') \
+                    else retry_delay(retries, self.backoff_factor)
+                await response.aclose()
+            await asyncio.sleep(delay)
+            retries += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
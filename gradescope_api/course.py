@@ -1,5 +1,16 @@
 from enum import Enum
-from bs4 import BeautifulSoup
+try:
+   from scraping import parse_assignments_table, parse_roster
+except ModuleNotFoundError:
+   from .scraping import parse_assignments_table, parse_roster
+try:
+   from csrf import csrf_cache
+except ModuleNotFoundError:
+   from .csrf import csrf_cache
+try:
+   from http_cache import http_cache
+except ModuleNotFoundError:
+   from .http_cache import http_cache
 try:
    from person import GSPerson
    from person import GSRole
@@ -11,12 +22,33 @@ try:
 except ModuleNotFoundError:
    from .assignment import GSAssignment
 
-import json
 from datetime import datetime
 import pytz
 
 TIMEZONE = 'America/Chicago'
 
+def assignment_fields(row):
+    '''
+    Convert a row of the assignments table into the keyword arguments of an assignment object
+    (everything but the course).
+    '''
+    due_date = row['submission_window']['due_date']
+    if due_date:
+        due_date = datetime.strptime(due_date, "%Y-%m-%dT%H:%M")
+        due_date = pytz.timezone(TIMEZONE).localize(due_date)
+    else:
+        due_date = None
+    # TODO: (released,due) = parse(row[2])
+    return {
+        'name': row['title'],
+        'aid': row['id'].split('_')[1],
+        'points': row['total_points'],
+        'percent_graded': row['grading_progress'],
+        'complete': row['grading_progress'] == 100,
+        'regrades_on': row['regrade_requests_open'] != False,
+        'due_date': due_date,
+    }
+
 class LoadedCapabilities(Enum):
     ASSIGNMENTS = 0
     ROSTER = 1
@@ -38,11 +70,52 @@ class GSCourse():
 
     def add_person(self, name, email, role, sid = None, notify = False):
         self._check_capabilities({LoadedCapabilities.ROSTER})
-        
-        membership_resp = self.session.get('https://www.gradescope.com/courses/' + self.cid + '/memberships')
-        parsed_membership_resp = BeautifulSoup(membership_resp.text, 'html.parser')
+        ok = self._add_person(name, email, role, sid, notify)
+        self._reconcile_roster()
+        return ok
 
-        authenticity_token = parsed_membership_resp.find('meta', attrs = {'name': 'csrf-token'} ).get('content')
+    def remove_person(self, name):
+        self._check_capabilities({LoadedCapabilities.ROSTER})
+        self._reconcile_roster({name})
+        return self._remove_person(name)
+
+    def change_person_role(self, name, role):
+        self._check_capabilities({LoadedCapabilities.ROSTER})
+        self._reconcile_roster({name})
+        return self._change_person_role(name, role)
+
+    def add_people(self, people, notify = False):
+        '''
+        Add many people with one token fetch and at most one roster reload.
+        people: iterable of (name, email, role) or (name, email, role, sid)
+        Returns a dict of email -> failed response for the people who could not be added.
+        '''
+        self._check_capabilities({LoadedCapabilities.ROSTER})
+        failures = {}
+        for person in people:
+            name, email, role = person[:3]
+            sid = person[3] if len(person) > 3 else None
+            resp = self._add_person(name, email, role, sid, notify)
+            if not resp:
+                failures[email] = resp
+        self._reconcile_roster()
+        return failures
+
+    def remove_people(self, names):
+        '''Remove many people. Returns a dict of name -> failed response.'''
+        self._check_capabilities({LoadedCapabilities.ROSTER})
+        names = list(names)
+        self._reconcile_roster(set(names))
+        return {name: resp for name, resp in ((name, self._remove_person(name)) for name in names) if not resp}
+
+    def change_roles(self, roles):
+        '''Change the role of many people. roles: dict of name -> GSRole. Returns a dict of name -> failed response.'''
+        self._check_capabilities({LoadedCapabilities.ROSTER})
+        self._reconcile_roster(set(roles))
+        return {name: resp for name, resp in ((name, self._change_person_role(name, role)) for name, role in roles.items())
+                if not resp}
+
+    def _add_person(self, name, email, role, sid, notify):
         person_params = {
             "utf8": "✓",
             "user[name]" : name,
@@ -54,52 +127,68 @@ class GSCourse():
         if notify:
             person_params['notify_by_email'] = 1
         # Seriously. Why is this website so inconsistent as to where the csrf token goes?????????
-        add_resp = self.session.post('https://www.gradescope.com/courses/' + self.cid + '/memberships',
-                                     data = person_params,
-                                     headers = {'x-csrf-token': authenticity_token})
-
-        # TODO this is highly wasteful, need to likely improve this. 
-        self.roster = {}
-        self._lazy_load_roster()
-
-    def remove_person(self, name):
-        self._check_capabilities({LoadedCapabilities.ROSTER})
-        
-        membership_resp = self.session.get('https://www.gradescope.com/courses/' + self.cid + '/memberships')
-        parsed_membership_resp = BeautifulSoup(membership_resp.text, 'html.parser')
-
-        authenticity_token = parsed_membership_resp.find('meta', attrs = {'name': 'csrf-token'} ).get('content')
-        remove_params = {
-            "_method" : "delete",
-            "authenticity_token" : authenticity_token
-        }
-        remove_resp = self.session.post('https://www.gradescope.com/courses/'+self.cid+'/memberships/'
-                                     +self.roster[name].data_id,
-                                     data = remove_params,
-                                     headers = {'x-csrf-token': authenticity_token})
-
-        # TODO this is highly wasteful, need to likely improve this. 
-        self.roster = {}
-        self._lazy_load_roster()
-
-    def change_person_role(self, name, role):
-        self._check_capabilities({LoadedCapabilities.ROSTER})
-        
-        membership_resp = self.session.get('https://www.gradescope.com/courses/' + self.cid + '/memberships')
-        parsed_membership_resp = BeautifulSoup(membership_resp.text, 'html.parser')
-
-        authenticity_token = parsed_membership_resp.find('meta', attrs = {'name': 'csrf-token'} ).get('content')
+        add_resp = self._csrf_request('post', 'https://www.gradescope.com/courses/' + self.cid + '/memberships',
+                                      lambda token: {'data': person_params,
+                                                     'headers': {'x-csrf-token': token}})
+        if not add_resp.ok:
+            return add_resp
+        self._drop_cached_roster()
+
+        # The response is usually the memberships page we are redirected to, which already has the new roster.
+        # Otherwise keep a placeholder, its data_id is filled in by the next reconcile.
+        if not self._update_roster_from(add_resp):
+            self.roster[name] = GSPerson(name, None, email, role, 0, False)
+        return add_resp
+
+    def _remove_person(self, name):
+        remove_resp = self._csrf_request('post', 'https://www.gradescope.com/courses/'+self.cid+'/memberships/'
+                                         +self.roster[name].data_id,
+                                         lambda token: {'data': {"_method" : "delete",
+                                                                 "authenticity_token" : token},
+                                                        'headers': {'x-csrf-token': token}})
+        if remove_resp.ok:
+            self._drop_cached_roster()
+        if remove_resp.ok and not self._update_roster_from(remove_resp):
+            del self.roster[name]
+        return remove_resp
+
+    def _change_person_role(self, name, role):
         role_params = {
             "course_membership[role]" : role.value,
         }
-        role_resp = self.session.patch('https://www.gradescope.com/courses/'+self.cid+'/memberships/'
-                                     +self.roster[name].data_id+'/update_role' ,
-                                     data = role_params,
-                                     headers = {'x-csrf-token': authenticity_token})
-
-        # TODO this is highly wasteful, need to likely improve this. 
+        role_resp = self._csrf_request('patch', 'https://www.gradescope.com/courses/'+self.cid+'/memberships/'
+                                       +self.roster[name].data_id+'/update_role',
+                                       lambda token: {'data': role_params,
+                                                      'headers': {'x-csrf-token': token}})
+        if role_resp.ok:
+            self._drop_cached_roster()
+        if role_resp.ok and not self._update_roster_from(role_resp):
+            self.roster[name].role = GSRole.from_str(role)
+        return role_resp
+
+    def _drop_cached_roster(self):
+        '''The roster changed: the memberships page must not be served from the HTTP cache any more'''
+        cache = http_cache(self.session)
+        if cache is not None:
+            cache.drop('https://www.gradescope.com/courses/' + self.cid + '/memberships')
+
+    def _update_roster_from(self, resp):
+        '''Replace the roster with the one on a memberships page response. Returns False if there is none.'''
+        if 'rosterRow' not in resp.text:
+            return False
         self.roster = {}
-        self._lazy_load_roster()
+        self._load_roster_from(resp.text)
+        return True
+
+    def _reconcile_roster(self, names = None):
+        '''
+        Reload the roster once if some people (of names, or anyone) were added without a known data_id.
+        '''
+        pending = [person for person in self.roster.values()
+                   if person.data_id is None and (names is None or person.name in names)]
+        if pending:
+            self.roster = {}
+            self._lazy_load_roster()
 
     # ~~~~~~~~~~~~~~~~~~~~~~ASSIGNMENTS~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -113,13 +202,8 @@ class GSCourse():
                        group_submissions = 0):
         self._check_capabilities({LoadedCapabilities.ASSIGNMENTS})
         
-        assignment_resp = self.session.get('https://www.gradescope.com/courses/'+self.cid+'/assignments')
-        parsed_assignment_resp = BeautifulSoup(assignment_resp.text, 'html.parser')
-        authenticity_token = parsed_assignment_resp.find('meta', attrs = {'name': 'csrf-token'} ).get('content')
-
         # TODO Make this less brittle and make sure to support all options properly
         assignment_params = {
-            "authenticity_token" : authenticity_token,
             "assignment[title]" : name,
             "assignment[student_submission]" : student_submissions,
             "assignment[release_date_string]" : release,
@@ -128,12 +212,13 @@ class GSCourse():
             "assignment[submission_type]" : "image", # TODO What controls this?
             "assignment[group_submission]" : group_submissions
         }
-        assignment_files = {
-            "template_pdf" : open(template_file, 'rb')
-        }
-        assignment_resp = self.session.post('https://www.gradescope.com/courses/'+self.cid+'/assignments',
-                                            files = assignment_files,
-                                            data = assignment_params)
+        with open(template_file, 'rb') as template:
+            def build(token):
+                template.seek(0) # the request is rebuilt if the token is rejected
+                return {'files': {"template_pdf" : template},
+                        'data': dict(assignment_params, authenticity_token = token)}
+            assignment_resp = self._csrf_request('post', 'https://www.gradescope.com/courses/'+self.cid+'/assignments',
+                                                 build)
 
         # TODO this is highly wasteful, need to likely improve this. 
         self.assignments = {}
@@ -142,19 +227,10 @@ class GSCourse():
     def remove_assignment(self, name):
         self._check_capabilities({LoadedCapabilities.ASSIGNMENTS})
         
-        assignment_resp = self.session.get('https://www.gradescope.com/courses/'+self.cid+'/assignments/'
-                                           +self.assignments[name].aid+'/edit')
-        parsed_assignment_resp = BeautifulSoup(assignment_resp.text, 'html.parser')
-        authenticity_token = parsed_assignment_resp.find('meta', attrs = {'name': 'csrf-token'} ).get('content')
-
-        remove_params = {
-            "_method" : "delete",
-            "authenticity_token" : authenticity_token
-        }
-
-        remove_resp = self.session.post('https://www.gradescope.com/courses/'+self.cid+'/assignments/'
-                                     +self.assignments[name].aid,
-                                     data = remove_params)
+        remove_resp = self._csrf_request('post', 'https://www.gradescope.com/courses/'+self.cid+'/assignments/'
+                                         +self.assignments[name].aid,
+                                         lambda token: {'data': {"_method" : "delete",
+                                                                 "authenticity_token" : token}})
 
         # TODO this is highly wasteful, need to likely improve this. 
         self.assignments = {}
@@ -169,49 +245,18 @@ class GSCourse():
         '''
         #  import ipdb; ipdb.set_trace()
         assignment_resp = self.session.get('https://www.gradescope.com/courses/'+self.cid+'/assignments')
-        parsed_assignment_resp = BeautifulSoup(assignment_resp.text, 'html.parser')
-
-
-        # find an element having a property called 'data-react-class' with value 'AssignmentsTable'
-        assignment_table = parsed_assignment_resp.find('div', attrs = {'data-react-class':'AssignmentsTable'}).get('data-react-props')
-
-        # assignment_table is a json string, so we need to parse it
-        assignment_table = json.loads(assignment_table)['table_data']
-
-
-        # filter the table_data to only get assignments having classname 'js-assignmentTableAssignmentRow' in them
-        assignment_table = [assignment for assignment in assignment_table if 'js-assignmentTableAssignmentRow' in assignment['className']]
-
-        #  assignment_table = []
-        #  for assignment_row in parsed_assignment_resp.findAll('tr', class_ = 'js-assignmentTableAssignmentRow'):
-            #  row = []
-            #  for td in assignment_row.findAll('td'):
-                #  row.append(td)
-            #  assignment_table.append(row)
-        
-        for row in assignment_table:
-            name = row['title']
-            aid = row['id'].split('_')[1]
-            points = row['total_points']
-            # TODO: (released,due) = parse(row[2])
-            submissions = row['num_active_submissions']
-            percent_graded = row['grading_progress']
-            complete = True if row['grading_progress'] == 100 else False
-            regrades_on  = False if row['regrade_requests_open'] == False else True
-            due_date = row['submission_window']['due_date']
-            if due_date:
-                due_date = datetime.strptime(due_date, "%Y-%m-%dT%H:%M")
-                due_date = pytz.timezone(TIMEZONE).localize(due_date)
-            else:
-                due_date = None
-            # TODO make these types reasonable
-            # (name, aid, points, percent_graded, complete, regrades_on, course, due_date)
-            self.assignments[name] = GSAssignment(name=name, aid=aid, points=points, 
-                                                  percent_graded=percent_graded, complete=complete,
-                                                  regrades_on=regrades_on, course=self, due_date=due_date)
+        assignment_table = parse_assignments_table(assignment_resp.text)
+        # TODO make these types reasonable
+        self._load_assignments_from([assignment_fields(row) for row in assignment_table])
 
+    def _load_assignments_from(self, assignments):
+        '''
+        assignments: the keyword arguments of each assignment (see assignment_fields), e.g. from a local
+                     cache, so that the assignments page does not have to be loaded again.
+        '''
+        for fields in assignments:
+            self.assignments[fields['name']] = GSAssignment(course=self, **fields)
         self.state.add(LoadedCapabilities.ASSIGNMENTS)
-        pass
 
     def _lazy_load_roster(self):
         '''
@@ -219,28 +264,10 @@ class GSCourse():
         all the rosters for all classes. Also makes us less vulnerable to blocking.
         '''
         membership_resp = self.session.get('https://www.gradescope.com/courses/' + self.cid + '/memberships')
-        parsed_membership_resp = BeautifulSoup(membership_resp.text, 'html.parser')
-
-        roster_table = []
-        for student_row in parsed_membership_resp.find_all('tr', class_ = 'rosterRow'):
-            row = []
-            for td in student_row('td'):
-                row.append(td)
-            roster_table.append(row)
-        
-        for row in roster_table:
-            name = row[0].text.rsplit(' ', 1)[0]
-            data_id = row[0].find('button', class_ = 'rosterCell--editIcon').get('data-id')
-            if len(row) == 6:
-                email = row[1].text
-                role = row[2].find('option', selected="selected").text
-                submissions = int(row[3].text)
-                linked = True if 'statusIcon-active' in row[4].find('i').get('class') else False
-            else:
-                email = row[2].text
-                role = row[3].find('option', selected="selected").text
-                submissions = int(row[4].text)
-                linked = True if 'statusIcon-active' in row[5].find('i').get('class') else False
+        self._load_roster_from(membership_resp.text)
+
+    def _load_roster_from(self, text):
+        for name, data_id, email, role, submissions, linked in parse_roster(text):
             # TODO Make types reasonable.
             self.roster[name] = GSPerson(name, data_id, email, role, submissions, linked)
         self.state.add(LoadedCapabilities.ROSTER)
@@ -256,24 +283,26 @@ class GSCourse():
             self._lazy_load_roster()
 
     def delete(self):
-        course_edit_resp = self.session.get('https://www.gradescope.com/courses/'+self.cid+'/edit')
-        parsed_course_edit_resp = BeautifulSoup(course_edit_resp.text, 'html.parser')
-
-        authenticity_token = parsed_course_edit_resp.find('meta', attrs = {'name': 'csrf-token'} ).get('content')
-
-        print(authenticity_token)
-
-        delete_params = {
-            "_method": "delete",
-            "authenticity_token": authenticity_token
-        }
-        print(delete_params)
-
-        delete_resp = self.session.post('https://www.gradescope.com/courses/'+self.cid,
-                                        data = delete_params,
-                                        headers={
-                                            'referer': 'https://www.gradescope.com/courses/'+self.cid+'/edit',
-                                            'origin': 'https://www.gradescope.com'
-                                        })
-        
-        # TODO make this less brittle 
+        delete_resp = self._csrf_request('post', 'https://www.gradescope.com/courses/'+self.cid,
+                                         lambda token: {'data': {"_method": "delete",
+                                                                 "authenticity_token": token},
+                                                        'headers': {
+                                                            'referer': 'https://www.gradescope.com/courses/'+self.cid+'/edit',
+                                                            'origin': 'https://www.gradescope.com'
+                                                        }})
+        csrf_cache(self.session).invalidate(self.csrf_scope)
+
+        # TODO make this less brittle
+
+    @property
+    def csrf_scope(self):
+        return 'course/' + self.cid
+
+    def _csrf_request(self, method, url, build, token_url = None):
+        '''
+        Send a mutating request with the cached csrf token of this course (see csrf.py).
+        When we do not have a token yet it is read from token_url (by default the course page).
+        '''
+        if token_url is None:
+            token_url = 'https://www.gradescope.com/courses/' + self.cid
+        return csrf_cache(self.session).request(method, url, self.csrf_scope, token_url, build)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Session-level cache of Gradescope CSRF tokens.
+
+Rails hands out one CSRF token per session, so instead of loading (and parsing) a page before every
+mutating request we keep the token of each scope (we use one scope per course) and only fetch a new one
+when there is none yet, or when the server rejects the cached one.
+'''
+import asyncio
+import threading
+from time import sleep
+import requests
+try:
+   from scraping import get_csrf_token
+except ModuleNotFoundError:
+   from .scraping import get_csrf_token
+try:
+   from http_transport import REJECTED_STATUSES, replay_delay
+except ModuleNotFoundError:
+   from .http_transport import REJECTED_STATUSES, replay_delay
+
+MAX_REPLAYS = 3 # replays of a request the server rejected with a 429/503
+
+
+def is_token_rejected(resp):
+    '''Rails answers 422 (ActionController::InvalidAuthenticityToken) to a stale or invalid token.'''
+    return resp.status_code == requests.codes.unprocessable_entity or \
+        (resp.status_code >= 400 and 'InvalidAuthenticityToken' in resp.text)
+
+
+class CSRFTokenCache():
+
+    def __init__(self, session):
+        self.session = session
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def get(self, scope, token_url):
+        '''Returns the token of scope, fetching it from the page at token_url if we do not have one.'''
+        with self.lock:
+            token = self.tokens.get(scope)
+        if token is None:
+            token = get_csrf_token(self.session.get(token_url).text)
+            with self.lock:
+                self.tokens[scope] = token
+        return token
+
+    def invalidate(self, scope = None):
+        '''Forget the token of scope (or all of them).'''
+        with self.lock:
+            if scope is None:
+                self.tokens.clear()
+            else:
+                self.tokens.pop(scope, None)
+
+    def request(self, method, url, scope, token_url, build):
+        '''
+        Send a mutating request with the cached token of scope.
+        build: a function that takes the token and returns the keyword arguments of session.request
+               (headers, data, files...). It is called again to rebuild the request (streams included)
+               if the server rejects the token, in which case a fresh token is fetched and the request is
+               retried once, and if the server turns it away (429/503, it was not processed), in which case
+               it is replayed up to MAX_REPLAYS times after the Retry-After delay (or a backoff).
+        '''
+        token_retried = False
+        replays = 0
+        while True:
+            token = self.get(scope, token_url)
+            resp = self.session.request(method, url, **build(token))
+            if is_token_rejected(resp) and not token_retried:
+                token_retried = True
+                self.invalidate(scope)
+            elif resp.status_code in REJECTED_STATUSES and replays < MAX_REPLAYS:
+                sleep(replay_delay(resp, replays))
+                replays += 1
+            else:
+                return resp
+
+def csrf_cache(session):
+    '''Returns the token cache of a session, creating it on first use.'''
+    cache = getattr(session, 'csrf_cache', None)
+    if cache is None:
+        cache = session.csrf_cache = CSRFTokenCache(session)
+    return cache
+
+
+class AsyncCSRFTokenCache():
+    '''The asyncio counterpart of CSRFTokenCache, for an httpx.AsyncClient'''
+
+    def __init__(self, client):
+        self.client = client
+        self.tokens = {}
+        self.lock = asyncio.Lock()
+
+    async def get(self, scope, token_url):
+        '''Returns the token of scope, fetching it from the page at token_url if we do not have one (once).'''
+        async with self.lock:
+            token = self.tokens.get(scope)
+            if token is None:
+                token = self.tokens[scope] = get_csrf_token((await self.client.get(token_url)).text)
+        return token
+
+    def invalidate(self, scope = None):
+        '''Forget the token of scope (or all of them).'''
+        if scope is None:
+            self.tokens.clear()
+        else:
+            self.tokens.pop(scope, None)
+
+    async def request(self, method, url, scope, token_url, build):
+        '''
+        Send a mutating request with the cached token of scope, see CSRFTokenCache.request.
+        build: a function that takes the token and returns the keyword arguments of client.request.
+        '''
+        token_retried = False
+        replays = 0
+        while True:
+            token = await self.get(scope, token_url)
+            resp = await self.client.request(method, url, **build(token))
+            if is_token_rejected(resp) and not token_retried:
+                token_retried = True
+                self.invalidate(scope)
+            elif resp.status_code in REJECTED_STATUSES and replays < MAX_REPLAYS:
+                await asyncio.sleep(replay_delay(resp, replays))
+                replays += 1
+            else:
+                return resp
+
+def async_csrf_cache(client):
+    '''Returns the token cache of an httpx.AsyncClient, creating it on first use.'''
+    cache = getattr(client, 'csrf_cache', None)
+    if cache is None:
+        cache = client.csrf_cache = AsyncCSRFTokenCache(client)
+    return cache
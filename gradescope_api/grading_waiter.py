@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Waiting for an uploaded submission to be graded.
+
+Polls the lightweight submission_status_path (status.json) of a submission, backing off exponentially
+with jitter, until the submission is graded (a score of 0 counts), the autograder fails, or the deadline
+passes. The schema of status.json is not documented: when it cannot be fetched or its state is not one we
+know, the state is reported and read from the submission itself (submissions/{subid}.json?content=react, its
+assignment_submission status and score) instead; a missing status.json is not polled again.
+'''
+import asyncio
+import random
+from enum import Enum
+from time import monotonic, sleep
+try:
+   from uploads import SUBMISSION_DETAILS_QUERY
+except ModuleNotFoundError:
+   from .uploads import SUBMISSION_DETAILS_QUERY
+
+GRADING_TIMEOUT = 600 # seconds
+INITIAL_DELAY = 1
+MAX_DELAY = 15
+BACKOFF_FACTOR = 2
+
+# status values reported by status.json and by the submission (lowercased)
+GRADED_STATUSES = {'processed', 'graded', 'complete', 'completed', 'finished'}
+FAILED_STATUSES = {'failed', 'error', 'errored', 'autograder_failed', 'autograder_error', 'timed_out', 'timeout'}
+PENDING_STATUSES = {'unprocessed', 'processing', 'queued', 'pending', 'running', 'in_progress', 'uploaded'}
+
+
+class GradingState(Enum):
+    PENDING = 0
+    GRADED = 1
+    FAILED = 2
+    TIMED_OUT = 3
+    UNKNOWN = 4 # a payload we cannot read
+
+
+class GradingResult():
+    '''The outcome of waiting for a submission to be graded.'''
+
+    def __init__(self, state, score, status, polls, elapsed):
+        self.state = state
+        self.score = score
+        self.status = status # the last status.json payload (None if none could be fetched)
+        self.polls = polls
+        self.elapsed = elapsed
+
+    def __bool__(self):
+        return self.state == GradingState.GRADED
+
+    def __repr__(self):
+        return f"GradingResult({self.state.name}, score={self.score}, polls={self.polls}, elapsed={self.elapsed:.1f}s)"
+
+
+def interpret_status(status):
+    '''
+    Returns (GradingState, score) for a status.json payload. A score of 0 is a valid grade. The state is
+    UNKNOWN for the status values we do not know, and for payloads with neither a status nor a score.
+    '''
+    if not isinstance(status, dict):
+        return GradingState.UNKNOWN, None
+    state = str(status.get('status') or status.get('autograder_status') or '').lower()
+    score = status.get('score')
+    if state in FAILED_STATUSES or status.get('error'):
+        return GradingState.FAILED, None
+    if state in GRADED_STATUSES or (not state and score is not None):
+        return GradingState.GRADED, None if score is None else float(score)
+    if state in PENDING_STATUSES or (not state and 'score' in status):
+        return GradingState.PENDING, None
+    return GradingState.UNKNOWN, None
+
+def interpret_submission(submission_json):
+    '''
+    Returns (GradingState, score) for the details of a submission (submissions/{subid}.json?content=react):
+    its assignment_submission is read like status.json, and a score is taken as graded when the status is unknown.
+    '''
+    submission = submission_json.get('assignment_submission') if isinstance(submission_json, dict) else None
+    state, score = interpret_status(submission)
+    if state == GradingState.UNKNOWN and submission and submission.get('score') is not None:
+        return GradingState.GRADED, float(submission['score'])
+    return state, score
+
+def describe_status(status):
+    '''What we could not read in a status payload, for the logs'''
+    if not isinstance(status, dict):
+        return repr(status)[:80]
+    state = status.get('status') or status.get('autograder_status')
+    return f"status {state!r}" if state else f"no status in the keys {sorted(status)}"
+
+def backoff_delays(initial = INITIAL_DELAY, maximum = MAX_DELAY, factor = BACKOFF_FACTOR):
+    '''Exponentially growing delays (capped at maximum) with "equal jitter".'''
+    delay = initial
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(maximum, delay * factor)
+
+def status_url(submission_url):
+    '''The submission_status_path of a submission url (as returned by the upload).'''
+    return submission_url.split('?')[0].rstrip('/') + '/status.json'
+
+def details_url(submission_url):
+    '''The url of the details of a submission, the fallback of status.json'''
+    return submission_url.split('?')[0].rstrip('/') + '.json' + SUBMISSION_DETAILS_QUERY
+
+
+class StatusPoller():
+    '''
+    The state of the polls of one submission, shared by the blocking and the async waits: whether status.json
+    exists, and the unreadable states already reported (each is printed once).
+    '''
+
+    def __init__(self, submission_url):
+        self.submission_url = submission_url
+        self.use_status = True
+        self.reported = set()
+
+    def read_status(self, status_resp):
+        '''Returns (GradingState, score, payload) for an answer of status.json (UNKNOWN if it is unusable)'''
+        if status_resp.status_code == 404:
+            self.report("there is no status.json")
+            self.use_status = False
+            return GradingState.UNKNOWN, None, None
+        status_resp.raise_for_status()
+        status = status_resp.json()
+        state, score = interpret_status(status)
+        if state == GradingState.UNKNOWN:
+            self.report(f"unknown grading state in status.json ({describe_status(status)})")
+        return state, score, status
+
+    def read_details(self, details_resp):
+        '''Returns (GradingState, score, payload) for the details of the submission'''
+        details_resp.raise_for_status()
+        details = details_resp.json()
+        state, score = interpret_submission(details)
+        if state == GradingState.UNKNOWN:
+            self.report(f"unknown grading state of the submission "
+                        f"({describe_status(details.get('assignment_submission') if isinstance(details, dict) else details)})")
+        return state, score, details
+
+    def report(self, problem):
+        if problem not in self.reported:
+            self.reported.add(problem)
+            print(f"Grading of {self.submission_url}: {problem}, reading the state from the submission instead")
+
+
+def wait_for_grading(session, submission_url, timeout = GRADING_TIMEOUT):
+    '''
+    Block until the submission at submission_url is graded, fails, or timeout seconds have passed.
+    session: a requests.Session
+    Returns a GradingResult.
+    '''
+    start = monotonic()
+    poller = StatusPoller(submission_url)
+    polls = 0
+    status = None
+    for delay in backoff_delays():
+        polls += 1
+        state = GradingState.UNKNOWN
+        if poller.use_status:
+            try:
+                state, score, status = poller.read_status(session.get(status_url(submission_url)))
+            except Exception as e: # transient errors just mean "not yet"
+                print(f"Could not get the grading status ({e}), retrying")
+        if state == GradingState.UNKNOWN:
+            try:
+                state, score, status = poller.read_details(session.get(details_url(submission_url)))
+            except Exception as e:
+                print(f"Could not get the submission ({e}), retrying")
+        if state in (GradingState.GRADED, GradingState.FAILED):
+            return GradingResult(state, score, status, polls, monotonic() - start)
+
+        remaining = timeout - (monotonic() - start)
+        if remaining <= 0:
+            return GradingResult(GradingState.TIMED_OUT, None, status, polls, monotonic() - start)
+        print("Waiting for the submission to be graded...")
+        sleep(min(delay, remaining))
+
+async def async_wait_for_grading(client, submission_url, timeout = GRADING_TIMEOUT):
+    '''The coroutine version of wait_for_grading, for an httpx.AsyncClient.'''
+    start = monotonic()
+    poller = StatusPoller(submission_url)
+    polls = 0
+    status = None
+    for delay in backoff_delays():
+        polls += 1
+        state = GradingState.UNKNOWN
+        if poller.use_status:
+            try:
+                state, score, status = poller.read_status(await client.get(status_url(submission_url)))
+            except Exception:
+                pass
+        if state == GradingState.UNKNOWN:
+            try:
+                state, score, status = poller.read_details(await client.get(details_url(submission_url)))
+            except Exception:
+                pass
+        if state in (GradingState.GRADED, GradingState.FAILED):
+            return GradingResult(state, score, status, polls, monotonic() - start)
+
+        remaining = timeout - (monotonic() - start)
+        if remaining <= 0:
+            return GradingResult(GradingState.TIMED_OUT, None, status, polls, monotonic() - start)
+        await asyncio.sleep(min(delay, remaining))
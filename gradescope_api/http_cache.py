@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+An optional on-disk HTTP cache of the Gradescope pages, with conditional requests.
+
+The 200 answers to GET requests that carry a validator (ETag or Last-Modified) are stored in a SQLite file.
+The next GET of the same url is sent with If-None-Match/If-Modified-Since: a 304 answer is served from the
+cache (only the headers went over the wire), anything else replaces the entry. Every page is revalidated
+each time unless the caller opts in to freshness policies ({endpoint template: seconds}, see
+http_metrics.endpoint_template), which serve a page without any request for a while after it was last validated.
+
+Only GETs are cached. A successful mutating request (an upload...) drops the cached pages of its parent path,
+e.g. a POST to /courses/1/assignments/2/submissions drops everything under /courses/1/assignments/2 (a
+POST to /login only drops /login). The pages a mutation changes elsewhere must be dropped by its caller with
+drop(), e.g. the roster edits of GSCourse drop /courses/{cid}/memberships.
+Responses marked no-store, streamed requests (the submission zips) and the bodies bigger than
+MAX_ENTRY_BYTES are never stored. The entries are partitioned by account (see partition), and the least
+recently used ones are evicted past max_bytes.
+
+The cache is plugged into the transport: GSConnection(cache=HTTPCache()).
+'''
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit, urlunsplit
+from urllib3 import HTTPResponse
+try:
+   from http_metrics import endpoint_template
+except ModuleNotFoundError:
+   from .http_metrics import endpoint_template
+
+HTTP_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'gradescope_api', 'http_cache.sqlite3')
+HTTP_CACHE_MAX_BYTES = 256 * 1024 ** 2
+MAX_ENTRY_BYTES = 16 * 1024 ** 2
+SCHEMA_VERSION = 1
+# seconds during which a validated page is served without asking the server again: none by default, the callers
+# opt in (never for the pages the csrf tokens are read from: the course page, outline/edit, submissions/new)
+FRESHNESS = {}
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'TRACE'}) # the others change something on the server
+# headers that describe the transfer rather than the stored (decoded) body, or belong to the session
+UNSTORED_HEADERS = frozenset({'content-encoding', 'content-length', 'transfer-encoding', 'connection',
+                              'keep-alive', 'set-cookie'})
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY, partition TEXT, url TEXT, endpoint TEXT, status INTEGER, headers TEXT, body BLOB,
+    etag TEXT, last_modified TEXT, size INTEGER, stored_at REAL, validated_at REAL, last_access REAL);
+CREATE INDEX IF NOT EXISTS entries_url ON entries (partition, url);
+'''
+ENTRY_COLUMNS = ['key', 'partition', 'url', 'endpoint', 'status', 'headers', 'body', 'etag', 'last_modified', 'size',
+                 'stored_at', 'validated_at', 'last_access']
+
+
+class HTTPCache():
+
+    def __init__(self, path = HTTP_CACHE_PATH, freshness = None, max_bytes = HTTP_CACHE_MAX_BYTES):
+        '''freshness: {endpoint template: seconds}, on top of FRESHNESS'''
+        self.path = path
+        self.freshness = {**FRESHNESS, **(freshness or {})}
+        self.max_bytes = max_bytes
+        self.partition = '' # the account whose pages are cached, set by GSConnection when it logs in
+        self.stats = Counter() # fresh hits, revalidated (304), misses, stored, invalidated
+        self.lock = threading.RLock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+        self.db = sqlite3.connect(path, check_same_thread = False)
+        self._migrate()
+
+    def _migrate(self):
+        '''This is a cache: when the schema version changes, the old entries are simply dropped.'''
+        try:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        with self.db:
+            if row is None or int(row[0]) != SCHEMA_VERSION:
+                self.db.execute('DROP TABLE IF EXISTS entries')
+            self.db.executescript(SCHEMA)
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~LOOKUPS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def key(self, request):
+        '''Requests for the same url with different Accept headers get different answers (HTML or JSON)'''
+        return hashlib.sha256('\0'.join([self.partition, request.method, request.url,
+                                         request.headers.get('Accept', '')]).encode()).hexdigest()
+
+    def lookup(self, request):
+        '''Returns the entry (a dict) of a GET request, or None'''
+        if request.method != 'GET' or 'no-store' in request.headers.get('Cache-Control', ''):
+            return None
+        with self.lock:
+            row = self.db.execute(f"SELECT {', '.join(ENTRY_COLUMNS)} FROM entries WHERE key = ?",
+                                  (self.key(request),)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+        return dict(zip(ENTRY_COLUMNS, row))
+
+    def is_fresh(self, entry):
+        return time.time() - entry['validated_at'] < self.freshness.get(entry['endpoint'], 0)
+
+    @staticmethod
+    def conditional_headers(entry):
+        '''The validators to send with the request for a cached page'''
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def response(self, entry, revalidated = False):
+        '''A urllib3 response with the cached page, for HTTPAdapter.build_response'''
+        with self.lock:
+            self.stats['revalidated' if revalidated else 'hits'] += 1
+            with self.db:
+                self.db.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), entry['key']))
+        return HTTPResponse(body = io.BytesIO(entry['body']), headers = json.loads(entry['headers']),
+                            status = entry['status'], reason = 'OK', preload_content = False, decode_content = False)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~UPDATES~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def store(self, request, resp):
+        '''Store the answer resp (a requests.Response, read here) to request if it can be cached'''
+        if request.method != 'GET' or resp.status_code != 200 or \
+                'no-store' in resp.headers.get('Cache-Control', '') + request.headers.get('Cache-Control', ''):
+            return
+        etag, last_modified = resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+        endpoint = endpoint_template(request.url)
+        if not (etag or last_modified or self.freshness.get(endpoint)):
+            return
+        body = resp.content
+        if len(body) > MAX_ENTRY_BYTES:
+            return
+        headers = {name: value for name, value in resp.headers.items() if name.lower() not in UNSTORED_HEADERS}
+        headers['Content-Length'] = str(len(body))
+        now = time.time()
+        with self.lock:
+            with self.db:
+                self.db.execute(f"INSERT OR REPLACE INTO entries ({', '.join(ENTRY_COLUMNS)}) VALUES "
+                                f"({', '.join('?' * len(ENTRY_COLUMNS))})",
+                                (self.key(request), self.partition, request.url, endpoint, resp.status_code,
+                                 json.dumps(headers), body, etag, last_modified, len(body), now, now, now))
+            self.stats['stored'] += 1
+            self._evict()
+
+    def revalidated(self, entry, headers):
+        '''The server answered 304 to the conditional request of entry: it is fresh again. Returns the entry.'''
+        stored = json.loads(entry['headers'])
+        for name in ('ETag', 'Last-Modified', 'Cache-Control', 'Expires', 'Date'):
+            if name in headers:
+                stored[name] = headers[name]
+        entry = dict(entry, headers = json.dumps(stored), etag = headers.get('ETag', entry['etag']),
+                     last_modified = headers.get('Last-Modified', entry['last_modified']), validated_at = time.time())
+        with self.lock:
+            with self.db:
+                self.db.execute('UPDATE entries SET headers = ?, etag = ?, last_modified = ?, validated_at = ? '
+                                'WHERE key = ?', (entry['headers'], entry['etag'], entry['last_modified'],
+                                                  entry['validated_at'], entry['key']))
+        return entry
+
+    def invalidate(self, url):
+        '''
+        A mutating request to url succeeded: drop the cached pages of url and of everything under its parent
+        path (the query is ignored). The parent of a top level path is the whole site, so only url is dropped
+        for those (e.g. /login).
+        '''
+        parts = urlsplit(url)
+        path = parts.path.rstrip('/')
+        parent = path.rsplit('/', 1)[0]
+        self.drop(urlunsplit((parts.scheme, parts.netloc, parent if parent else path, '', '')))
+
+    def drop(self, url):
+        '''Drop the cached pages of url and of everything under it (the query is ignored)'''
+        parts = urlsplit(url)
+        scope = urlunsplit((parts.scheme, parts.netloc, parts.path.rstrip('/'), '', ''))
+        escaped = scope.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') # for LIKE
+        with self.lock:
+            with self.db:
+                dropped = self.db.execute("DELETE FROM entries WHERE partition = ? AND (url = ? OR "
+                                          "url LIKE ? ESCAPE '\\' OR url LIKE ? ESCAPE '\\')",
+                                          (self.partition, scope, escaped + '/%', escaped + '?%')).rowcount
+            self.stats['invalidated'] += dropped
+
+    def clear(self):
+        with self.lock:
+            with self.db:
+                self.db.execute('DELETE FROM entries')
+
+    def total_size(self):
+        with self.lock:
+            return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def summary(self):
+        '''Returns (entries, bytes) of the cache'''
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+
+    def _evict(self):
+        '''Drop the least recently used entries until the cache fits in max_bytes.'''
+        total = self.total_size()
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall():
+            if total <= self.max_bytes:
+                break
+            with self.db:
+                self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+
+
+def is_mutation(method):
+    return method.upper() not in SAFE_METHODS
+
+def http_cache(session):
+    '''Returns the HTTP cache of a session (see http_transport.mount_transport), or None.'''
+    return getattr(session, 'http_cache', None)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Per-endpoint metrics of the HTTP requests of a session.
+
+HTTPMetrics hooks into the responses of a requests.Session (attach) or an httpx.AsyncClient (attach_async),
+so every request made through it (by the connection, its courses and assignments, the csrf token cache...)
+is recorded with its endpoint template (/courses/{cid}/assignments/{aid}/review_grades), method, status,
+latency, bytes sent and received, the number of retries made by the transport and whether the HTTP cache
+answered it (see http_cache.py).
+summary() aggregates them per endpoint, format_summary() prints them as a table (the endpoints taking the
+most time first) and dump() saves everything as JSON.
+'''
+import json
+import threading
+from time import perf_counter, time
+from urllib.parse import urlsplit
+
+GRADESCOPE_HOST = 'www.gradescope.com'
+# the names of the ids that follow these path segments
+ID_SEGMENTS = {'courses': '{cid}', 'assignments': '{aid}', 'submissions': '{subid}', 'memberships': '{membership_id}',
+               'questions': '{qid}', 'submission_batches': '{batch_id}'}
+
+
+def endpoint_template(url):
+    '''https://www.gradescope.com/courses/1/assignments/2/submissions/3.json?x=y -> /courses/{cid}/assignments/{aid}/submissions/{subid}.json'''
+    parts = urlsplit(url)
+    segments = parts.path.split('/')
+    for i, segment in enumerate(segments):
+        stem, dot, extension = segment.partition('.')
+        if stem.isdigit():
+            segments[i] = ID_SEGMENTS.get(segments[i - 1], '{id}') + dot + extension
+    path = '/'.join(segments) or '/'
+    return path if parts.netloc in (GRADESCOPE_HOST, '') else parts.netloc + path
+
+def body_size(request):
+    '''The size of the body of a prepared request (0 when it is unknown, e.g. a generator)'''
+    length = request.headers.get('Content-Length')
+    if length is not None:
+        return int(length)
+    body = request.body
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+def percentile(values, fraction):
+    '''Nearest-rank percentile of a sorted list'''
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+
+class HTTPMetrics():
+
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+    def attach(self, session):
+        '''Record every response of session (a requests.Session) from now on.'''
+        session.hooks['response'].append(self.record_response)
+        session.http_metrics = self
+        return self
+
+    def attach_async(self, client):
+        '''Record every response of client (an httpx.AsyncClient) from now on.'''
+        client.event_hooks['response'].append(self.record_async_response)
+        client.http_metrics = self
+        return self
+
+    async def record_async_response(self, resp):
+        '''The response hook of httpx. The body is read here, so that it is timed, as with requests.'''
+        await resp.aread()
+        self.record(resp.request.method, str(resp.request.url), resp.status_code, resp.elapsed.total_seconds(),
+                    len(resp.content), int(resp.request.headers.get('Content-Length') or 0),
+                    resp.extensions.get('retries', 0))
+
+    def record_response(self, resp, *args, **kwargs):
+        '''The response hook. The body of non-streamed responses is read here, to time it.'''
+        latency = resp.elapsed.total_seconds()
+        cache = getattr(resp, 'from_cache', None) # 'fresh' or 'revalidated' (by a 304) if the cache answered
+        if cache is not None:
+            resp.content
+            bytes_in = 0 # the body did not go over the wire
+        elif kwargs.get('stream'):
+            # reading a streamed body would consume it, so rely on the announced size
+            bytes_in = int(resp.headers.get('Content-Length') or 0)
+        else:
+            start = perf_counter()
+            bytes_in = len(resp.content)
+            latency += perf_counter() - start
+        retries = getattr(resp.raw, 'retries', None)
+        self.record(resp.request.method, resp.request.url, resp.status_code, latency, bytes_in,
+                    body_size(resp.request), len(retries.history) if retries is not None else 0, cache)
+
+    def record(self, method, url, status, latency, bytes_in, bytes_out, retries = 0, cache = None):
+        with self.lock:
+            self.records.append({'time': time(), 'method': method, 'endpoint': endpoint_template(url), 'status': status,
+                                 'latency': latency, 'bytes_in': bytes_in, 'bytes_out': bytes_out, 'retries': retries,
+                                 'cache': cache})
+
+    def reset(self):
+        with self.lock:
+            self.records = []
+
+    # ~~~~~~~~~~~~~~~~~~~~~~REPORTS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def summary(self):
+        '''
+        Returns a list of dicts, one per (method, endpoint), with the number of requests, errors (status >= 400),
+        retries, answers from the HTTP cache, the total/p50/p95/max latency in seconds and the bytes in and out; the most time consuming first.
+        '''
+        with self.lock:
+            records = list(self.records)
+        groups = {}
+        for record in records:
+            groups.setdefault((record['method'], record['endpoint']), []).append(record)
+        summary = []
+        for (method, endpoint), group in groups.items():
+            latencies = sorted(record['latency'] for record in group)
+            summary.append({'method': method, 'endpoint': endpoint, 'requests': len(group),
+                            'errors': sum(1 for record in group if record['status'] >= 400),
+                            'retries': sum(record['retries'] for record in group),
+                            'cached': sum(1 for record in group if record.get('cache')),
+                            'total_latency': sum(latencies), 'p50_latency': percentile(latencies, 0.5),
+                            'p95_latency': percentile(latencies, 0.95), 'max_latency': latencies[-1],
+                            'bytes_in': sum(record['bytes_in'] for record in group),
+                            'bytes_out': sum(record['bytes_out'] for record in group)})
+        return sorted(summary, key=lambda row: row['total_latency'], reverse=True)
+
+    def format_summary(self):
+        '''The summary as a table, with a total line'''
+        summary = self.summary()
+        width = max([len(row['method']) + 1 + len(row['endpoint']) for row in summary] + [8])
+        lines = [f"{'endpoint':<{width}} {'reqs':>6} {'errors':>6} {'retries':>7} {'cached':>6} {'total s':>8} "
+                 f"{'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'KB in':>9} {'KB out':>8}"]
+        for row in summary:
+            lines.append(f"{row['method'] + ' ' + row['endpoint']:<{width}} {row['requests']:>6} {row['errors']:>6} "
+                         f"{row['retries']:>7} {row['cached']:>6} {row['total_latency']:>8.2f} "
+                         f"{row['p50_latency'] * 1000:>8.1f} {row['p95_latency'] * 1000:>8.1f} {row['max_latency'] * 1000:>8.1f} "
+                         f"{row['bytes_in'] / 1024:>9.1f} {row['bytes_out'] / 1024:>8.1f}")
+        if summary:
+            total = {key: sum(row[key] for row in summary)
+                     for key in ('requests', 'errors', 'retries', 'cached', 'total_latency', 'bytes_in', 'bytes_out')}
+            lines.append(f"{'total':<{width}} {total['requests']:>6} {total['errors']:>6} {total['retries']:>7} "
+                         f"{total['cached']:>6} {total['total_latency']:>8.2f} {'':>8} {'':>8} "
+                         f"{max(row['max_latency'] for row in summary) * 1000:>8.1f} "
+                         f"{total['bytes_in'] / 1024:>9.1f} {total['bytes_out'] / 1024:>8.1f}")
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        with self.lock:
+            records = list(self.records)
+        return {'summary': self.summary(), 'requests': records}
+
+    def dump(self, path):
+        '''Save the summary and every request as JSON.'''
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def http_metrics(session):
+    '''Returns the metrics attached to a session, or None.'''
+    return getattr(session, 'http_metrics', None)
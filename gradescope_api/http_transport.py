@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The transport of the Gradescope session: timeouts, retries, rate limiting and connection pooling.
+
+ResilientAdapter is mounted on the www.gradescope.com urls of a requests.Session (see mount_transport):
+  - every request gets a (connect, read) timeout unless it sets one; uploads get a longer read timeout,
+    as the server only answers once it has processed the files.
+  - idempotent requests (GET, HEAD...) are retried on connection and read errors and on 429/5xx responses,
+    with exponential backoff and jitter, or after the Retry-After delay of the response (capped).
+  - mutating requests (the uploads, the login...) are only retried by the transport when the connection could
+    not be made, as nothing was sent then. A 429/503 means the server did not process them, but their body
+    (a multipart stream) cannot be sent twice, so they are replayed by CSRFTokenCache.request, which rebuilds
+    them (see replay_delay).
+  - an optional token bucket (throttle.RateLimiter) keeps the requests under rate_limit per second.
+  - the pool keeps up to pool_size connections open: it should match the number of threads using the session,
+    past it connections are opened and dropped for each request.
+  - an optional HTTPCache (http_cache.py) answers the GETs it can, revalidating them with conditional requests.
+'''
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+   from throttle import RateLimiter
+except ModuleNotFoundError:
+   from .throttle import RateLimiter
+try:
+   from http_cache import is_mutation
+except ModuleNotFoundError:
+   from .http_cache import is_mutation
+
+GRADESCOPE_URL = 'https://www.gradescope.com'
+CONNECT_TIMEOUT = 10 # seconds
+READ_TIMEOUT = 60
+UPLOAD_TIMEOUT = 300 # read timeout of the mutating requests
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5 # the retries of a request wait 0, 1, 2, 4... seconds (plus up to BACKOFF_JITTER)
+BACKOFF_JITTER = 0.5
+BACKOFF_MAX = 30
+RETRY_AFTER_MAX = 120 # longer Retry-After delays are cut to this
+POOL_SIZE = 10
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+REJECTED_STATUSES = frozenset({429, 503}) # the server did not process the request: mutations can be replayed
+IDEMPOTENT_METHODS = Retry.DEFAULT_ALLOWED_METHODS
+
+
+class GradescopeRetry(Retry):
+    '''A urllib3 Retry that caps the Retry-After delays at RETRY_AFTER_MAX'''
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, RETRY_AFTER_MAX)
+
+
+def retry_policy(retries = MAX_RETRIES, backoff_factor = BACKOFF_FACTOR):
+    '''
+    The retries of the transport: the idempotent methods on errors and RETRY_STATUSES, every method when the
+    connection fails. The last response is returned when the retries run out, so the callers see its status.
+    '''
+    return GradescopeRetry(total=retries, connect=retries, read=retries, status=retries, other=0,
+                           allowed_methods=IDEMPOTENT_METHODS, status_forcelist=RETRY_STATUSES,
+                           backoff_factor=backoff_factor, backoff_jitter=BACKOFF_JITTER, backoff_max=BACKOFF_MAX,
+                           respect_retry_after_header=True, raise_on_status=False)
+
+def replay_delay(resp, replays, backoff_factor = BACKOFF_FACTOR):
+    '''
+    Seconds to wait before replaying a request rejected with resp (a 429/503), after replays earlier replays:
+    its Retry-After if it has one, an exponential backoff otherwise.
+    '''
+    retry_after = GradescopeRetry().parse_retry_after(resp.headers['Retry-After']) \
+        if resp.headers.get('Retry-After') else None
+    if retry_after is not None:
+        return min(retry_after, RETRY_AFTER_MAX)
+    return min(BACKOFF_MAX, backoff_factor * 2 ** (replays + 1))
+
+
+class ResilientAdapter(HTTPAdapter):
+
+    def __init__(self, timeout = (CONNECT_TIMEOUT, READ_TIMEOUT), upload_timeout = (CONNECT_TIMEOUT, UPLOAD_TIMEOUT),
+                 retries = MAX_RETRIES, backoff_factor = BACKOFF_FACTOR, rate_limit = None, pool_size = POOL_SIZE,
+                 cache = None):
+        '''
+        timeout, upload_timeout: the default (connect, read) timeouts of the idempotent and the mutating requests
+        retries: the number of retries of a request, backoff_factor: the base of their exponential backoff
+        rate_limit: the maximum number of requests per second (None: no limit), in bursts of up to pool_size
+        pool_size: the number of connections kept open, i.e. the number of threads using the session
+        cache: an http_cache.HTTPCache, or None
+        '''
+        # kept to build adapters with the same settings (the emulator of the benchmarks does)
+        self.options = {'timeout': timeout, 'upload_timeout': upload_timeout, 'retries': retries,
+                        'backoff_factor': backoff_factor, 'rate_limit': rate_limit, 'pool_size': pool_size,
+                        'cache': cache}
+        self.timeout = timeout
+        self.upload_timeout = upload_timeout
+        self.limiter = RateLimiter(rate_limit, burst = pool_size) if rate_limit else None
+        self.cache = cache
+        super().__init__(pool_connections=1, pool_maxsize=pool_size,
+                         max_retries=retry_policy(retries, backoff_factor))
+
+    def send(self, request, stream = False, timeout = None, verify = True, cert = None, proxies = None):
+        if timeout is None:
+            timeout = self.timeout if request.method in IDEMPOTENT_METHODS else self.upload_timeout
+        kwargs = {'stream': stream, 'timeout': timeout, 'verify': verify, 'cert': cert, 'proxies': proxies}
+        if self.cache is None:
+            return self.transmit(request, **kwargs)
+        if is_mutation(request.method):
+            resp = self.transmit(request, **kwargs)
+            if resp.status_code < 400:
+                self.cache.invalidate(request.url)
+            return resp
+
+        # the zips are streamed to disk (and cached by archive_cache.py), the other GETs go through the cache
+        entry = None if stream else self.cache.lookup(request)
+        if entry is not None and self.cache.is_fresh(entry):
+            return self.cached_response(request, entry)
+        if entry is not None:
+            request = request.copy()
+            request.headers.update(self.cache.conditional_headers(entry))
+        resp = self.transmit(request, **kwargs)
+        if entry is not None and resp.status_code == 304:
+            resp.content # release the connection
+            return self.cached_response(request, self.cache.revalidated(entry, resp.headers), revalidated = True)
+        if not stream:
+            self.cache.store(request, resp)
+        return resp
+
+    def transmit(self, request, **kwargs):
+        '''Send request to the server (after a token of the rate limiter)'''
+        if self.limiter is not None:
+            self.limiter.acquire()
+        return super().send(request, **kwargs)
+
+    def cached_response(self, request, entry, revalidated = False):
+        '''A requests.Response with the page of entry, from_cache: 'fresh' or 'revalidated' '''
+        resp = self.build_response(request, self.cache.response(entry, revalidated))
+        resp.from_cache = 'revalidated' if revalidated else 'fresh'
+        return resp
+
+
+def mount_transport(session, **options):
+    '''Mount a ResilientAdapter (with options, see its __init__) on the Gradescope urls of session. Returns it.'''
+    adapter = ResilientAdapter(**options)
+    session.mount(GRADESCOPE_URL, adapter)
+    session.http_cache = adapter.cache # for the callers that know which cached pages their requests change
+    return adapter
+
+def transport_options(session):
+    '''The options of the ResilientAdapter of session, or {} if it has none'''
+    adapter = session.get_adapter(GRADESCOPE_URL)
+    return dict(adapter.options) if isinstance(adapter, ResilientAdapter) else {}
@@ -1,6 +1,25 @@
 import requests
-from bs4 import BeautifulSoup
 from enum import Enum
+try:
+   from scraping import parse_login_token, parse_account_courses
+except ModuleNotFoundError:
+   from .scraping import parse_login_token, parse_account_courses
+try:
+   from session_store import save_session, load_session, clear_session, cookies_from_list, SESSION_STORE_PATH, SESSION_MAX_AGE
+except ModuleNotFoundError:
+   from .session_store import save_session, load_session, clear_session, cookies_from_list, SESSION_STORE_PATH, SESSION_MAX_AGE
+try:
+   from csrf import CSRFTokenCache
+except ModuleNotFoundError:
+   from .csrf import CSRFTokenCache
+try:
+   from http_metrics import HTTPMetrics
+except ModuleNotFoundError:
+   from .http_metrics import HTTPMetrics
+try:
+   from http_transport import mount_transport
+except ModuleNotFoundError:
+   from .http_transport import mount_transport
 try:
    from account import GSAccount
 except ModuleNotFoundError:
@@ -45,9 +64,16 @@ class ConnState(Enum):
 class GSConnection():
     '''The main connection class that keeps state about the current connection.'''
         
-    def __init__(self):
-        '''Initialize the session for the connection.'''
+    def __init__(self, **transport):
+        '''
+        Initialize the session for the connection.
+        transport: the timeouts, retries, rate_limit, pool_size and (HTTP) cache of its requests (see http_transport.py)
+        '''
         self.session = requests.Session()
+        self.adapter = mount_transport(self.session, **transport)
+        self.cache = transport.get('cache')
+        self.session.csrf_cache = CSRFTokenCache(self.session) # shared by every course and assignment
+        self.metrics = HTTPMetrics().attach(self.session) # every request of the session, per endpoint
         self.state = ConnState.INIT
         self.account = None
 
@@ -56,13 +82,9 @@ class GSConnection():
         Login to gradescope using email and password.
         Note that the future commands depend on account privilages.
         '''
+        self._use_cache_of(email)
         init_resp = self.session.get("https://www.gradescope.com/")
-        parsed_init_resp = BeautifulSoup(init_resp.text, 'html.parser')
-        for form in parsed_init_resp.find_all('form'):
-            if form.get("action") == "/login":
-                for inp in form.find_all('input'):
-                    if inp.get('name') == "authenticity_token":
-                        auth_token = inp.get('value')
+        auth_token = parse_login_token(init_resp.text)
 
         login_data = {
             "utf8": "✓",
@@ -89,28 +111,16 @@ class GSConnection():
         '''
         if self.state != ConnState.LOGGED_IN:
             return False # Should raise exception
-        # Get account page and parse it using bs4
+        # Get account page and parse the instructor course list out of it
         account_resp = self.session.get("https://www.gradescope.com/account")
-        parsed_account_resp = BeautifulSoup(account_resp.text, 'html.parser')
-
-        # Get instructor course data
-        # choose next_sibling with class = 'courseList'
-        instructor_courses = [sibling for sibling in parsed_account_resp.find('h1', class_ ='pageHeading').next_siblings if 'courseList' in sibling.get("class")][0]
-        #  import ipdb; ipdb.set_trace()
-        for course in instructor_courses.find_all('a', class_ = 'courseBox'):
-            shortname = course.find('h3', class_ = 'courseBox--shortname').text
-            name = course.find('div', class_ = 'courseBox--name').text
-            cid = course.get("href").split("/")[-1]
-            year = None
+        for cid, name, shortname, year in parse_account_courses(account_resp.text):
             print(cid, name, shortname)
-            for tag in course.parent.previous_siblings:
-                if 'courseList--term' in tag.get("class"):
-                    year = tag.string
-                    break
             if year is None:
                 return False # Should probably raise an exception.
             self.account.add_class(cid, name, shortname, year, instructor = True)
 
+        return True
+
         # NOTE: Uncommented the following block because many TAs may NOT have the student courses 
         #  student_courses = [sibling for sibling in parsed_account_resp.find('h1', class_ ='pageHeading', string = "Student Courses").next_siblings if 'courseList' in sibling.get("class")][0]
         #  for course in student_courses.find_all('a', class_ = 'courseBox'):
@@ -127,6 +137,58 @@ class GSConnection():
         #          return False # Should probably raise an exception.
         #      self.account.add_class(cid, name, shortname, year)
 
+    # ~~~~~~~~~~~~~~~~~~~~~~SESSION REUSE~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def resume(self, email, pswd, path = SESSION_STORE_PATH, max_age = SESSION_MAX_AGE):
+        '''
+        Reuse the session stored at path if it is still alive (one request), otherwise login, load the
+        account and store the new session. Returns True when logged in.
+        '''
+        if self.load_session(email, path, max_age) and self.session_alive():
+            return True
+        self.session.cookies.clear()
+        self.session.csrf_cache.invalidate() # tokens are bound to the session
+        self.state = ConnState.INIT
+        self.account = None
+        if not self.login(email, pswd) or self.get_account() is False:
+            clear_session(path)
+            return False
+        self.save_session(path)
+        return True
+
+    def session_alive(self):
+        '''Cheap probe of the session: the account page answers 200 when logged in and redirects otherwise.'''
+        probe = self.session.get("https://www.gradescope.com/account", allow_redirects=False, stream=True)
+        probe.close() # we only need the status, not the page
+        return probe.status_code == requests.codes.ok
+
+    def save_session(self, path = SESSION_STORE_PATH):
+        '''Store the cookies and the course list of the account at path.'''
+        courses = [(c.cid, c.name, c.shortname, c.year, True) for c in self.account.instructor_courses.values()]
+        courses += [(c.cid, c.name, c.shortname, c.year, False) for c in self.account.student_courses.values()]
+        save_session(path, self.account.email, self.session.cookies, courses)
+
+    def load_session(self, email, path = SESSION_STORE_PATH, max_age = SESSION_MAX_AGE):
+        '''
+        Restore the session and the account stored at path, without checking it against the server.
+        Returns False if there is no usable stored session.
+        '''
+        data = load_session(path, email, max_age)
+        if data is None:
+            return False
+        cookies_from_list(self.session.cookies, data['cookies'])
+        self._use_cache_of(email)
+        self.account = GSAccount(email, self.session)
+        for cid, name, shortname, year, instructor in data['courses']:
+            self.account.add_class(cid, name, shortname, year, instructor = instructor)
+        self.state = ConnState.LOGGED_IN
+        return True
+
+    def _use_cache_of(self, email):
+        '''The cached pages are those of the account: they are never served to another one'''
+        if self.cache is not None:
+            self.cache.partition = email.strip().lower()
+
 
 # THIS IS STRICTLY FOR DEVELOPMENT TESTING :( Sorry for leaving it in.
 if __name__=="__main__":
@@ -1,5 +1,3 @@
-from bs4 import BeautifulSoup
-
 class GSQuestion():
 
     def __init__(self, qid, title, weight, children, parent_id, content, crop):
@@ -12,10 +10,147 @@ class GSQuestion():
         self.content = content
         self.crop = crop
         
+    @staticmethod
+    def from_outline(question):
+        '''Build a question (and its subquestions) from an entry of the outline react props.'''
+        children = [GSQuestion.from_outline(subquestion) for subquestion in question.get('children', [])]
+        return GSQuestion(question['id'], question['title'], question['weight'], children,
+                          question['parent_id'], question['content'], question['crop_rect_list'])
+
     def to_patch(self):
         children = [child.to_patch() for child in self.children]
         output = {'id': self.qid, 'title': self.title, 'weight': self.weight, 'crop_rect_list': self.crop}
-        print('length of children:', len(self.children))
         if len(children) != 0:
             output['children'] = children
         return output
+
+
+DEFAULT_CROP = [{'x1': 10, 'x2': 91, 'y1': 73, 'y2': 93, 'page_number': 1}]
+
+class GSOutlineEditException(Exception):
+    pass
+
+class GSOutlineEdit():
+    '''
+    A transaction over the question outline of an assignment: adds, removes and reweights are queued
+    against a working copy of the question tree (indexed by id and title) and sent in a single PATCH
+    by commit(). Use it through GSAssignment.edit_outline():
+
+        with assignment.edit_outline() as outline:
+            outline.add_question('Q1', 10)
+            outline.add_question('Q1.a', 5, parent_title='Q1')
+            outline.reweight(20, title='Q2')
+    '''
+
+    def __init__(self, assignment):
+        self.assignment = assignment
+        self.data = [q.to_patch() for q in assignment.questions]
+        self.originals = {}
+        self._remember(assignment.questions)
+        self.changed = False
+        self._by_id = None
+        self._by_title = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~EDITS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def add_question(self, title, weight, crop = None, parent_id = None, parent_title = None):
+        '''Queue a new question, at the top level or under the parent given by id or title.'''
+        new_q = {'title': title, 'weight': weight, 'crop_rect_list': crop if crop else DEFAULT_CROP}
+        if parent_id or parent_title:
+            parent = self.find(title = parent_title, qid = parent_id)
+            if parent is None:
+                raise GSOutlineEditException(f"No parent question {parent_title or parent_id}")
+            parent.setdefault('children', []).append(new_q)
+        else:
+            self.data.append(new_q)
+        self._touch()
+
+    def remove_question(self, title = None, qid = None):
+        '''Queue the removal of the questions (and subquestions) with the given title, or the given id.'''
+        if not title and not qid:
+            return
+        matches = (lambda q: q.get('title') == title) if title else (lambda q: q.get('id') == qid)
+        def prune(questions):
+            kept = [q for q in questions if not matches(q)]
+            for q in kept:
+                if q.get('children'):
+                    q['children'] = prune(q['children'])
+            return kept
+        self.data = prune(self.data)
+        self._touch()
+
+    def reweight(self, weight, title = None, qid = None):
+        '''Queue a new weight for the question with the given title or id.'''
+        question = self.find(title = title, qid = qid)
+        if question is None:
+            raise GSOutlineEditException(f"No question {title or qid}")
+        question['weight'] = weight
+        self._touch()
+
+    def find(self, title = None, qid = None):
+        '''Returns the working copy (patch dict) of a question by id or title, or None.'''
+        if self._by_id is None:
+            self._by_id, self._by_title = {}, {}
+            stack = list(self.data)
+            while stack:
+                q = stack.pop()
+                if q.get('id') is not None:
+                    self._by_id[q['id']] = q
+                self._by_title.setdefault(q['title'], q)
+                stack.extend(q.get('children', []))
+        return self._by_id.get(qid) if qid else self._by_title.get(title)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~COMMIT~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def commit(self):
+        '''Send all the queued edits in one PATCH and update the questions of the assignment.'''
+        if not self.changed:
+            return
+        # TODO add id region support
+        new_patch = {'assignment': {'identification_regions': {'name': None, 'sid': None}},
+                     'question_data': self.data}
+        patch_resp = self.assignment._patch_outline(new_patch)
+        patch_resp.raise_for_status()
+
+        try:
+            outline = patch_resp.json().get('outline')
+        except ValueError:
+            outline = None
+        if outline:
+            self.assignment.questions = [GSQuestion.from_outline(question) for question in outline]
+        elif self._has_new_questions(self.data):
+            # the response does not give the ids of the new questions: drop the outline so that the next
+            # edit_outline reloads it, instead of sending them again with no id
+            self.assignment.questions = []
+        else:
+            # the response does not describe the outline, so apply the edits locally
+            self.assignment.questions = self._to_questions(self.data, None)
+        self.changed = False
+
+    def _has_new_questions(self, data):
+        return any(q.get('id') is None or self._has_new_questions(q.get('children', [])) for q in data)
+
+    def _to_questions(self, data, parent_id):
+        questions = []
+        for q in data:
+            original = self.originals.get(q.get('id'))
+            questions.append(GSQuestion(q.get('id'), q['title'], q['weight'],
+                                        self._to_questions(q.get('children', []), q.get('id')),
+                                        parent_id, original.content if original else [], q['crop_rect_list']))
+        return questions
+
+    def _remember(self, questions):
+        for question in questions:
+            self.originals[question.qid] = question
+            self._remember(question.children)
+
+    def _touch(self):
+        self.changed = True
+        self._by_id = self._by_title = None
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+On-disk store of a logged in Gradescope session (cookie jar plus the account's course list), so that a
+new run can skip the login and account page scrape while the stored session is still alive.
+'''
+import json
+import os
+import tempfile
+import time
+from http.cookiejar import Cookie
+
+SESSION_STORE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'gradescope_api', 'session.json')
+SESSION_MAX_AGE = 7 * 24 * 3600 # seconds
+
+
+def cookies_to_list(jar):
+    return [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path,
+             'expires': c.expires, 'secure': c.secure, 'rest': c._rest}
+            for c in jar]
+
+def cookies_from_list(jar, cookies):
+    for c in cookies:
+        jar.set_cookie(Cookie(version=0, name=c['name'], value=c['value'], port=None, port_specified=False,
+                              domain=c['domain'], domain_specified=c['domain'].startswith('.'),
+                              domain_initial_dot=c['domain'].startswith('.'),
+                              path=c['path'], path_specified=True, secure=c['secure'], expires=c['expires'],
+                              discard=False, comment=None, comment_url=None, rest=c.get('rest') or {}))
+
+def save_session(path, email, jar, courses):
+    '''
+    Write a session to path (readable by the owner only).
+    courses: list of (cid, name, shortname, year, instructor)
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    data = {'email': email, 'saved_at': time.time(), 'cookies': cookies_to_list(jar), 'courses': courses}
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.chmod(temp_path, 0o600)
+    os.replace(temp_path, path)
+
+def load_session(path, email, max_age = SESSION_MAX_AGE):
+    '''Returns the stored session of email, or None if there is none or it is older than max_age seconds.'''
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if data.get('email') != email or time.time() - data.get('saved_at', 0) > max_age:
+        return None
+    return data
+
+def stored_session_info(path = SESSION_STORE_PATH):
+    '''Returns (email, saved_at) of the stored session, or None, without checking it.'''
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return data.get('email'), data.get('saved_at', 0)
+
+def clear_session(path):
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,38 @@
+import threading
+from time import monotonic, sleep
+
+
+class RateLimiter():
+    '''
+    A thread-safe token bucket. Callers block in acquire() until a token is available, which keeps
+    the request rate at or below `rate` per second while still allowing bursts of up to `burst`.
+    '''
+
+    def __init__(self, rate, burst = 1):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        '''Take a token if one is available. Returns how long to wait otherwise (0 on success).'''
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        '''Block until a token is available.'''
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            sleep(wait)
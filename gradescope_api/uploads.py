@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The parts of the submission uploads and lookups that do not depend on the HTTP client.
+
+GSAssignment (requests) and AsyncGSAssignment (httpx) only differ in how they send the requests: the
+form of an upload, the reading of its answer, the choice of the best past submission and the fields of the
+resulting submission objects all live here.
+'''
+from datetime import datetime
+
+# the query of the submission history (submissions/{subid}.json)
+#  https://www.gradescope.com/courses/569119/assignments/3394470/submissions/202602875.json?content=react&only_keys[]=past_submissions
+PAST_SUBMISSIONS_QUERY = '?content=react&only_keys[]=past_submissions'
+SUBMISSION_DETAILS_QUERY = '?content=react'
+UPLOAD_HEADERS = {
+    'Accept': 'application/json',
+    'X-Requested-With': 'XMLHttpRequest',
+}
+
+
+def upload_params(student_id, token = None):
+    '''The form fields of an upload for student_id, with the csrf token if given'''
+    params = {
+        "submission[owner_id]": student_id,
+        "utf8": "✓",
+        "submission[method]": "upload",
+        "null": "",
+        "submission[leaderboard_name]": ""
+    }
+    if token is not None:
+        params['authenticity_token'] = token
+    return params
+
+def uploaded_submission_url(status_code, submission_json):
+    '''
+    The path of the uploaded submission, from the answer to an upload, or None if it was refused:
+     {"success":true,"url":"/courses/569119/assignments/3394470/submissions/215229408"}
+    '''
+    if status_code != 200 or not submission_json.get('success'):
+        return None
+    return submission_json['url']
+
+def highest_score_submission(past_submissions, maxdate = None):
+    '''
+    The highest score submission of a history (the latest one among equals), or None.
+    maxdate (optional): datetime object. If provided, only submissions on or before this date will be considered.
+    '''
+    highest_score = 0
+    highest_score_submission = None
+    for submission in past_submissions:
+        date = datetime.fromisoformat(submission['created_at'])
+        if maxdate and date > maxdate:
+            continue
+        if float(submission['score']) >= highest_score:
+            highest_score = float(submission['score'])
+            highest_score_submission = submission
+    return highest_score_submission
+
+def past_submission_fields(submission):
+    '''The subid, score, time and student_id of an entry of past_submissions, for GSSubmission'''
+    return {'subid': submission['id'], 'score': submission['score'],
+            'time': datetime.fromisoformat(submission['created_at']),
+            'student_id': submission['owners'][0]['id']}
+
+def graded_submission_fields(submission_json, grading_result):
+    '''
+    The subid, name, email, score and time of a graded upload, for GSSubmission, from its details
+    (submissions/{subid}.json?content=react). The score of the grading result is used when it has one.
+    '''
+    score = grading_result.score
+    if score is None:
+        score = submission_json['assignment_submission']['score']
+    return {'subid': submission_json['assignment_submission']['id'],
+            'name': submission_json['course_members'][0]['name'],
+            'email': submission_json['course_members'][0]['email'],
+            'score': score,
+            'time': datetime.fromisoformat(submission_json['assignment_submission']['created_at'])}
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The late days used by each student, as recorded by the Canvas late-tracker assignment.
+
+Updates are staged during a run and posted with Canvas' bulk update_grades endpoint, one asynchronous
+progress job per BULK_UPDATE_SIZE students, instead of one submission edit per student.
+'''
+import random
+import threading
+from time import monotonic, sleep
+from canvasapi.exceptions import CanvasException
+
+BULK_UPDATE_SIZE = 100 # students per progress job
+BULK_UPDATE_ATTEMPTS = 2
+PROGRESS_TIMEOUT = 300 # seconds
+PROGRESS_INITIAL_DELAY = 1
+PROGRESS_MAX_DELAY = 10
+
+
+def progress_delays(initial=PROGRESS_INITIAL_DELAY, maximum=PROGRESS_MAX_DELAY):
+    '''Doubling delays (capped at maximum) with "equal jitter", between the polls of a progress job'''
+    delay = initial
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(maximum, delay * 2)
+
+
+def uin_key(uin):
+    '''UINs come as str, int or float (from the csv); normalize them to the same string'''
+    if uin is None:
+        return None
+    uin = str(uin).strip()
+    if uin.endswith('.0'):
+        uin = uin[:-2]
+    return uin or None
+
+
+def email_key(email):
+    if not email:
+        return None
+    return email.strip().lower()
+
+
+class LateDayLedger():
+    '''
+    Indexes the submissions of the Canvas late-tracker assignment by Canvas user id, email and UIN, so a
+    student's late day record is a dict lookup instead of a scan of the whole course.
+    '''
+
+    def __init__(self, submissions, userdb, assignment=None):
+        '''
+        submissions: the canvasapi submissions of the late-tracker assignment
+        userdb: {id: {'name': name, 'email': email, 'uin': uin}}, see canvas_load_userdb
+        assignment: the canvasapi late-tracker assignment, needed to flush staged updates
+        '''
+        self.assignment = assignment
+        self.pending = {} # user id -> staged update
+        self.unconfirmed = {} # sheet row -> reason, for the updates of the last flush whose job timed out
+        self.lock = threading.Lock()
+        self.by_user_id = {}
+        self.by_email = {}
+        self.by_uin = {}
+        for sub in submissions:
+            self.by_user_id[sub.user_id] = sub
+            user = userdb.get(sub.user_id)
+            if not user:
+                continue
+            email = email_key(user.get('email'))
+            if email:
+                self.by_email[email] = sub
+            uin = uin_key(user.get('uin'))
+            if uin:
+                self.by_uin[uin] = sub
+
+    def __len__(self):
+        return len(self.by_user_id)
+
+    def find(self, email=None, uin=None, user_id=None):
+        '''Returns the late-tracker submission of a student (by user id, then email, then UIN), or None.'''
+        if user_id is not None and user_id in self.by_user_id:
+            return self.by_user_id[user_id]
+        sub = self.by_email.get(email_key(email))
+        if sub is None:
+            sub = self.by_uin.get(uin_key(uin))
+        return sub
+
+    @staticmethod
+    def used(sub):
+        '''The number of late days already used according to a late-tracker submission'''
+        if not sub.score:
+            return 0
+        return int(sub.score)
+
+    def stage(self, sub, total, comment, row=None):
+        '''
+        Stage setting the late days used of a student to total, with a comment, for the next flush.
+        The entry is updated locally right away, so later lookups (e.g. another homework of the same
+        student) see it; it is rolled back if Canvas does not take the update.
+        row: the sheet row the update comes from, to report failures
+        '''
+        with self.lock:
+            update = self.pending.get(sub.user_id)
+            if update is None:
+                update = self.pending[sub.user_id] = {'previous': sub.score, 'comments': [], 'rows': []}
+            update['total'] = total
+            update['comments'].append(comment)
+            update['rows'].append(row)
+            sub.score = total
+
+    def flush(self, timeout=PROGRESS_TIMEOUT):
+        '''
+        Post every staged update with bulk update_grades jobs and wait for them to finish, then check the
+        grades Canvas reports.
+        Returns a dict of sheet row -> reason for the updates that did not go through; they are rolled back.
+        The updates of a job that timed out may still be applied by Canvas: those whose grade is not there
+        yet are neither failed nor rolled back, but listed in self.unconfirmed (sheet row -> reason) for a
+        human to check, as posting them again could count the late days twice.
+        '''
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        self.unconfirmed = {}
+        if not pending:
+            return {}
+        failed = {} # user id -> reason
+        timed_out = {} # user id -> reason
+        user_ids = list(pending.keys())
+        for start in range(0, len(user_ids), BULK_UPDATE_SIZE):
+            chunk = {user_id: pending[user_id] for user_id in user_ids[start:start + BULK_UPDATE_SIZE]}
+            state, reason = self._post(chunk, timeout)
+            if state == 'timed_out':
+                timed_out.update({user_id: reason for user_id in chunk})
+            elif state != 'completed':
+                failed.update({user_id: reason for user_id in chunk})
+
+        # the progress job only tells us whether it ran; compare the grades to find what did not stick
+        posted = {user_id for user_id in pending if user_id not in failed}
+        unconfirmed = {}
+        if posted:
+            for sub in self.assignment.get_submissions():
+                if sub.user_id not in posted:
+                    continue
+                if sub.score is not None and float(sub.score) == float(pending[sub.user_id]['total']):
+                    continue
+                if sub.user_id in timed_out:
+                    unconfirmed[sub.user_id] = f"{timed_out[sub.user_id]}; Canvas has {sub.score} late days " \
+                                               f"for now, the update may still be applied"
+                else:
+                    failed[sub.user_id] = f"Canvas has {sub.score} late days instead of {pending[sub.user_id]['total']}"
+
+        failures = {}
+        for user_id, reason in failed.items():
+            self.by_user_id[user_id].score = pending[user_id]['previous']
+            for row in pending[user_id]['rows']:
+                failures[row] = reason
+        for user_id, reason in unconfirmed.items():
+            for row in pending[user_id]['rows']:
+                self.unconfirmed[row] = reason
+        return failures
+
+    def _post(self, chunk, timeout):
+        '''Run one update_grades job. Returns its final workflow state ('completed', 'failed' or 'timed_out') and reason.'''
+        grade_data = {user_id: {'posted_grade': update['total'], 'text_comment': '\n'.join(update['comments'])}
+                      for user_id, update in chunk.items()}
+        reason = None
+        for attempt in range(BULK_UPDATE_ATTEMPTS):
+            try:
+                progress = self.assignment.submissions_bulk_update(grade_data=grade_data)
+                state, message = wait_for_progress(progress, timeout)
+            except CanvasException as err:
+                state, message = 'failed', str(err)
+            if state == 'completed':
+                return state, None
+            reason = f"Canvas bulk update {state}" + (f": {message}" if message else '')
+            if state == 'timed_out':
+                break # the job may still run; posting it again would duplicate the comments
+        return state, reason
+
+
+def wait_for_progress(progress, timeout=PROGRESS_TIMEOUT):
+    '''
+    Poll a canvasapi Progress until its job completes, fails, or timeout seconds have passed.
+    Returns (workflow_state, message); workflow_state is 'timed_out' on timeout.
+    '''
+    start = monotonic()
+    for delay in progress_delays():
+        if progress.workflow_state in ('completed', 'failed'):
+            return progress.workflow_state, getattr(progress, 'message', None)
+        if monotonic() - start + delay > timeout:
+            return 'timed_out', None
+        sleep(delay)
+        progress = progress.query()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Fuzzy matching of (student-written) names against a fixed set of assignment names.
+
+NameMatcher lowercases the candidates once, scores a name against all of them in one call of rapidfuzz's
+process.cdist (falling back to thefuzz one candidate at a time when rapidfuzz is not installed), and
+remembers the result of every name it has matched.
+'''
+try:
+    import numpy as np
+    from rapidfuzz import fuzz, process
+    HAS_RAPIDFUZZ = True
+except ImportError:
+    from thefuzz import fuzz
+    HAS_RAPIDFUZZ = False
+
+
+class NameMatcher():
+
+    def __init__(self, candidates):
+        '''candidates: the names to match against (their order breaks ties)'''
+        self.candidates = list(candidates)
+        self.lowered = [candidate.lower() for candidate in self.candidates]
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def match(self, variant) -> (str, int):
+        '''
+        Returns the best candidate for variant and its score (0 to 100), or (None, 0) if nothing is similar.
+        A candidate contained in variant (case-insensitively) wins with a score of 100; otherwise the
+        candidate with the highest fuzz.ratio (rounded, the first one on ties) wins.
+        '''
+        if variant not in self.cache:
+            self.cache[variant] = self._match(variant)
+        return self.cache[variant]
+
+    def _match(self, variant):
+        lowered = variant.lower()
+        for candidate, lowered_candidate in zip(self.candidates, self.lowered):
+            if lowered_candidate in lowered:
+                return candidate, 100
+        if not self.candidates:
+            return None, 0
+        if HAS_RAPIDFUZZ:
+            scores = np.round(process.cdist([variant], self.candidates, scorer=fuzz.ratio)[0])
+            best = int(np.argmax(scores))
+            best_match, highest_score = self.candidates[best], int(scores[best])
+        else:
+            best_match, highest_score = None, 0
+            for candidate in self.candidates:
+                score = fuzz.ratio(candidate, variant)
+                if score > highest_score:
+                    best_match, highest_score = candidate, score
+        if highest_score == 0:
+            return None, 0
+        return best_match, highest_score
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+A small, schema-versioned SQLite cache of the metadata absence_processing.py needs at startup:
+Gradescope courses and assignments, the actual -> redemption assignment mapping, and the Canvas course
+and its userdb. It replaces the old data.pkl: only plain data is stored (never live sessions), every
+entity has its own timestamp and TTL, and each part can be refreshed on its own.
+'''
+import sqlite3
+import time
+from datetime import datetime
+
+METADATA_DB = 'metadata.sqlite3'
+SCHEMA_VERSION = 2
+
+# Freshness of each kind of entity, in seconds
+GS_ASSIGNMENTS_TTL = 24 * 3600
+ASSIGNMENT_MAPPING_TTL = 24 * 3600
+CANVAS_USERS_TTL = 24 * 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS gs_courses (
+    cid TEXT PRIMARY KEY, name TEXT, shortname TEXT, year TEXT, fetched_at REAL);
+CREATE TABLE IF NOT EXISTS gs_assignments (
+    cid TEXT, aid TEXT, name TEXT, points REAL, percent_graded REAL, complete INTEGER, regrades_on INTEGER,
+    due_date TEXT, fetched_at REAL, PRIMARY KEY (cid, aid));
+CREATE TABLE IF NOT EXISTS assignment_mappings (
+    cid TEXT, actual_name TEXT, redemption_name TEXT, fetched_at REAL, PRIMARY KEY (cid, actual_name));
+CREATE TABLE IF NOT EXISTS canvas_courses (course_id INTEGER PRIMARY KEY, name TEXT, fetched_at REAL);
+CREATE TABLE IF NOT EXISTS canvas_users (
+    course_id INTEGER, user_id INTEGER, name TEXT, email TEXT, uin TEXT, fetched_at REAL, PRIMARY KEY (course_id, user_id));
+'''
+TABLES = ['meta', 'gs_courses', 'gs_assignments', 'assignment_mappings', 'canvas_courses', 'canvas_users']
+
+
+class MetadataStore():
+
+    def __init__(self, path=METADATA_DB):
+        self.db = sqlite3.connect(path)
+        self._migrate()
+
+    def _migrate(self):
+        '''This is a cache: when the schema version changes, the old tables are simply dropped.'''
+        try:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is None or int(row[0]) != SCHEMA_VERSION:
+            with self.db:
+                for table in TABLES:
+                    self.db.execute(f'DROP TABLE IF EXISTS {table}')
+        with self.db:
+            self.db.executescript(SCHEMA)
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def _fresh(fetched_at, ttl):
+        return fetched_at is not None and time.time() - fetched_at < ttl
+
+    def summary(self):
+        '''Returns {table: (rows, oldest fetched_at or None)} for the cached entities'''
+        return {table: self.db.execute(f'SELECT COUNT(*), MIN(fetched_at) FROM {table}').fetchone()
+                for table in TABLES if table != 'meta'}
+
+    # ~~~~~~~~~~~~~~~~~~~~~~SETTINGS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def get_setting(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, key, value):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    # ~~~~~~~~~~~~~~~~~~~~~~GRADESCOPE~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def save_gs_course(self, course):
+        '''Store a GSCourse and its (loaded) assignments.'''
+        now = time.time()
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO gs_courses VALUES (?, ?, ?, ?, ?)",
+                            (course.cid, course.name, course.shortname, course.year, now))
+            self.db.execute("DELETE FROM gs_assignments WHERE cid = ?", (course.cid,))
+            self.db.executemany("INSERT INTO gs_assignments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                [(course.cid, a.aid, a.name, a.points, a.percent_graded, int(a.complete),
+                                  int(a.regrades_on), a.due_date.isoformat() if a.due_date else None, now)
+                                 for a in course.assignments.values()])
+
+    def get_gs_course(self, cid):
+        '''Returns (cid, name, shortname, year) of a stored course, or None.'''
+        return self.db.execute("SELECT cid, name, shortname, year FROM gs_courses WHERE cid = ?", (cid,)).fetchone()
+
+    def get_gs_assignments(self, cid, ttl=GS_ASSIGNMENTS_TTL):
+        '''
+        Returns the stored assignments of a course as a list of assignment keyword arguments (see
+        course.assignment_fields), or None if they are missing or older than ttl.
+        '''
+        rows = self.db.execute("SELECT aid, name, points, percent_graded, complete, regrades_on, due_date, fetched_at "
+                               "FROM gs_assignments WHERE cid = ?", (cid,)).fetchall()
+        if not rows or not all(self._fresh(row[7], ttl) for row in rows):
+            return None
+        return [{'aid': aid, 'name': name, 'points': points, 'percent_graded': percent_graded,
+                 'complete': bool(complete), 'regrades_on': bool(regrades_on),
+                 'due_date': datetime.fromisoformat(due_date) if due_date else None}
+                for aid, name, points, percent_graded, complete, regrades_on, due_date, _ in rows]
+
+    def save_assignment_mapping(self, cid, mapping):
+        '''mapping: dict of actual assignment name -> redemption assignment name'''
+        now = time.time()
+        with self.db:
+            self.db.execute("DELETE FROM assignment_mappings WHERE cid = ?", (cid,))
+            self.db.executemany("INSERT INTO assignment_mappings VALUES (?, ?, ?, ?)",
+                                [(cid, actual, redemption, now) for actual, redemption in mapping.items()])
+
+    def get_assignment_mapping(self, cid, ttl=ASSIGNMENT_MAPPING_TTL):
+        rows = self.db.execute("SELECT actual_name, redemption_name, fetched_at FROM assignment_mappings WHERE cid = ?",
+                               (cid,)).fetchall()
+        if not rows or not all(self._fresh(row[2], ttl) for row in rows):
+            return None
+        return {actual: redemption for actual, redemption, _ in rows}
+
+    # ~~~~~~~~~~~~~~~~~~~~~~CANVAS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def save_canvas_course(self, course_id, name, userdb):
+        now = time.time()
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO canvas_courses VALUES (?, ?, ?)", (course_id, name, now))
+            self.db.execute("DELETE FROM canvas_users WHERE course_id = ?", (course_id,))
+            self.db.executemany("INSERT INTO canvas_users VALUES (?, ?, ?, ?, ?, ?)",
+                                [(course_id, user_id, user['name'], user['email'], user.get('uin'), now)
+                                 for user_id, user in userdb.items()])
+
+    def get_canvas_course(self, course_id):
+        '''Returns (course_id, name) of a stored Canvas course, or None.'''
+        return self.db.execute("SELECT course_id, name FROM canvas_courses WHERE course_id = ?", (course_id,)).fetchone()
+
+    def get_canvas_userdb(self, course_id, ttl=CANVAS_USERS_TTL):
+        '''Returns the stored userdb ({id: {'name': name, 'email': email, 'uin': uin}}), or None if missing or stale.'''
+        rows = self.db.execute("SELECT user_id, name, email, uin, fetched_at FROM canvas_users WHERE course_id = ?",
+                               (course_id,)).fetchall()
+        if not rows or not all(self._fresh(row[4], ttl) for row in rows):
+            return None
+        return {user_id: {'name': name, 'email': email, 'uin': uin} for user_id, name, email, uin, _ in rows}
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Clean-up of the absence request responses (a DataFrame of the Google Sheet, indexed by sheet row number).
+
+Everything is done column-wise: each homework name token is resolved to its Gradescope assignment once,
+homework names are normalized with one str.contains pass per token, and the requests already processed
+in another row are found with a hash join on (email, homework) instead of a scan per row.
+numpy and pandas are imported in the functions, so the constants can be used without loading them.
+'''
+
+# These intermediary names help in mapping HW names in Google Sheet to HW names in Gradescope
+# If the mapping fails, then it won't process that HW
+# NOTE: How these tokens work is that each token name is a unique substring of the actual HW name.
+#       This helps in mapping the HW names in Google Sheet (in which students may have used partial HW names)
+# TODO: Make this data cleaning more robust
+HOMEWORK_NAME_TOKENS = [ "Scaling", "Stitching", "String", "Grade", "Dungeon", "Crawler",
+                         "CPPeers", "CPPers", "Rover", "Temperature", "Paris", "Debugging", "Mountain", "Valley" ]
+PROCESSED_STATUSES = ["Yes", "Pending", "No"]
+REQUEST_KEY = ["Email Address", "Homework Name"]
+STATUS_COLUMN = "Request Processed"
+ALREADY_PROCESSED = "Already Processed" # column added to the rows to process
+
+
+def normalize_homework_names(names, resolve, tokens=HOMEWORK_NAME_TOKENS):
+    '''
+    Replace the homework names that contain a token (case-insensitively) by the assignment the token
+    resolves to; the first token that matches wins. The other names are left as they are.
+    names: a Series of str
+    resolve: function of a token -> the assignment name
+    '''
+    import pandas as pd
+    lowered = names.str.lower()
+    normalized = pd.Series(None, index=names.index, dtype=object)
+    for token in tokens:
+        hit = normalized.isna() & lowered.str.contains(token.lower(), regex=False)
+        if hit.any():
+            normalized[hit] = resolve(token)
+    return normalized.fillna(names).astype(names.dtype)
+
+
+def select_rows(df, row_ranges):
+    '''The rows of df within row_ranges (inclusive [first, last] pairs), each once, in sheet order'''
+    import numpy as np
+    rows = np.unique(np.concatenate([np.arange(first, last + 1) for first, last in row_ranges]))
+    return df[df.index.isin(rows)]
+
+
+def clean_responses(df, resolve, row_ranges, tokens=HOMEWORK_NAME_TOKENS, keys=None):
+    '''
+    df: the responses
+    resolve: function of a homework name token -> the assignment name (see normalize_homework_names)
+    row_ranges: the rows to process
+    keys: the email, homework name and status of every row of the sheet (see sheets.KEY_COLUMNS), when df
+          holds only some of the rows; the processed requests are looked up in all of them
+    Returns the Homework Late Day Pool requests of row_ranges that are still to be processed (with an
+    ALREADY_PROCESSED column, true when the same student and homework was processed in another row), and the
+    processed requests.
+    '''
+    import pandas as pd
+    df = df.copy()
+    df["Homework Name"] = normalize_homework_names(df["Homework Name"].astype(str), resolve, tokens)
+    processed = df
+    if keys is not None:
+        # the statuses of the rows of df may be newer (written back during this run) than the keys
+        keys = keys[~keys.index.isin(df.index)]
+        keys = keys.assign(**{"Homework Name": normalize_homework_names(keys["Homework Name"].astype(str),
+                                                                        resolve, tokens)})
+        processed = pd.concat([keys[REQUEST_KEY + [STATUS_COLUMN]], df[REQUEST_KEY + [STATUS_COLUMN]]])
+
+    # getting the rows which are to be processed
+    newdf = select_rows(df, row_ranges)
+    newdf = newdf[(newdf["Type of request"] == "Homework Late Day Pool") &
+                  ~newdf[STATUS_COLUMN].isin(PROCESSED_STATUSES)].copy()
+
+    # getting the rows which are already processed, in the whole sheet
+    donedf = processed[processed[STATUS_COLUMN].isin(PROCESSED_STATUSES)]
+
+    # anti-join of the requests against the processed ones, on (email, homework)
+    newdf[ALREADY_PROCESSED] = pd.MultiIndex.from_frame(newdf[REQUEST_KEY]).isin(
+        pd.MultiIndex.from_frame(donedf[REQUEST_KEY]))
+    return newdf, donedf
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Loading the absence requests from the Google Sheet of form responses.
+
+Only the rows that are going to be processed are downloaded (with one values.batchGet call), and they
+are cached in absence.csv along with their sheet row numbers. On later runs only the rows that are not
+cached yet (newly appended responses) are downloaded in full; for the cached ones only the status
+columns, which TAs edit, are refreshed. The last cached row is compared with the sheet to detect
+responses that were deleted (which shifts the rows), in which case the cache is rebuilt. Edits to the
+other columns of the cached rows are not seen: load(full=True) (--full) downloads every row again.
+The key columns (KEY_COLUMNS) of every row of the sheet are downloaded by the same call and kept in
+absence_keys.csv: the requests already processed in rows outside of our row ranges (by another TA) are
+found from them.
+
+StatusWriter writes the outcome of the processed requests back to the status columns, with one
+values.batchUpdate call per flush, skipping the cells that someone changed since we read them.
+'''
+import os
+import re
+import threading
+# pandas and the Google client libraries are imported where they are used, so importing this module is cheap
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+WRITE_SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+CREDENTIALS_PATH = 'google_credentials.json'
+TOKEN_PATH = 'google_token.json'
+WRITE_TOKEN_PATH = 'google_write_token.json' # kept apart, so the read-only token keeps working
+RESPONSES_CSV = 'absence.csv'
+ROW_COLUMN = 'Row' # the sheet row numbers, in the csv
+STATUS_COLUMNS = ['Request Processed', 'Post Request Details']
+KEYS_CSV = 'absence_keys.csv'
+KEY_COLUMNS = ['Email Address', 'Homework Name', 'Request Processed'] # of every row, see clean_responses
+
+
+def sheets_service(scopes=SCOPES, token_path=TOKEN_PATH):
+    '''
+    Returns a Google Sheets service, running the authorization flow if there is no valid token
+    '''
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+
+    creds = None
+    # The token file stores the user's access and refresh tokens, and is
+    # created automatically when the authorization flow completes for the first time
+    if os.path.exists(token_path):
+        creds = Credentials.from_authorized_user_file(token_path, scopes)
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, scopes)
+            creds = flow.run_local_server(port=0)
+        # Save the credentials for the next run
+        with open(token_path, 'w') as token:
+            token.write(creds.to_json())
+    return build('sheets', 'v4', credentials=creds)
+
+
+def column_letter(index):
+    '''0 -> A, 25 -> Z, 26 -> AA'''
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def column_index(letters):
+    '''A -> 0, Z -> 25, AA -> 26'''
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+def split_range(sheet_range):
+    '''"Form Responses 1!A:T" -> ("Form Responses 1", "A", "T")'''
+    sheet, columns = sheet_range.rsplit('!', 1)
+    first, last = re.fullmatch(r'([A-Za-z]+)\d*:([A-Za-z]+)\d*', columns).groups()
+    return sheet.strip("'"), first.upper(), last.upper()
+
+def normalize_header(header, width):
+    '''Name the unnamed columns the way pandas.read_csv does'''
+    header = list(header) + [''] * (width - len(header))
+    return [name if name else f'Unnamed: {i}' for i, name in enumerate(header)]
+
+def row_segments(rows, cached):
+    '''Split a sorted list of row numbers into runs of consecutive rows that are all (not) in cached'''
+    segments = []
+    for row in rows:
+        is_cached = row in cached
+        if segments and segments[-1][1] == row - 1 and segments[-1][2] == is_cached:
+            segments[-1][1] = row
+        else:
+            segments.append([row, row, is_cached])
+    return segments
+
+
+def read_cached_responses(csv_path=RESPONSES_CSV):
+    '''Returns the cached rows (as strings, indexed by sheet row number), or None'''
+    import pandas as pd
+    if not os.path.exists(csv_path):
+        return None
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    if ROW_COLUMN not in df.columns:
+        return None # a full download from before the rows were tracked
+    return df.set_index(ROW_COLUMN).rename(index=int)
+
+def read_response_keys(keys_path=KEYS_CSV):
+    '''Returns the KEY_COLUMNS of every row of the sheet (indexed by sheet row number), or None'''
+    return read_cached_responses(keys_path)
+
+
+class ResponsesSheet():
+
+    def __init__(self, service, sheet_id, sheet_range, csv_path=RESPONSES_CSV, keys_path=KEYS_CSV):
+        '''
+        service: a Google Sheets service (see sheets_service)
+        sheet_range: the columns of the responses, e.g. "Form Responses 1!A:T"; row 1 is the header
+        '''
+        self.service = service
+        self.sheet_id = sheet_id
+        self.sheet, self.first_column, self.last_column = split_range(sheet_range)
+        self.width = column_index(self.last_column) - column_index(self.first_column) + 1
+        self.csv_path = csv_path
+        self.keys_path = keys_path
+
+    def a1(self, first_row, last_row, first_column=None, last_column=None):
+        return f"'{self.sheet}'!{first_column or self.first_column}{first_row}:{last_column or self.last_column}{last_row}"
+
+    def key_ranges(self, header):
+        '''
+        The (open-ended) ranges of the KEY_COLUMNS of every row, given the header of the sheet; none if the
+        sheet does not have them all
+        '''
+        if not all(name in header for name in KEY_COLUMNS):
+            return []
+        letters = [column_letter(column_index(self.first_column) + header.index(name)) for name in KEY_COLUMNS]
+        return [self.a1(2, '', letter, letter) for letter in letters]
+
+    def _save_keys(self, value_ranges):
+        '''Save the values of the key_ranges (one list of rows per column) to the keys csv'''
+        import pandas as pd
+        length = max([len(values) for values in value_ranges] + [0])
+        columns = {name: [(row[0] if row else '') for row in values] + [''] * (length - len(values))
+                   for name, values in zip(KEY_COLUMNS, value_ranges)}
+        keys = pd.DataFrame(columns, index=pd.RangeIndex(2, length + 2, name=ROW_COLUMN))
+        keys.to_csv(self.keys_path)
+
+    def load(self, row_ranges, full=False):
+        '''
+        Bring the cached rows of row_ranges (inclusive [first, last] pairs of sheet row numbers) up to date
+        and save them to the csv. Returns the number of rows downloaded in full.
+        full: ignore the cache and download every row again
+        '''
+        cache = None if full else read_cached_responses(self.csv_path)
+        new_rows = self._refresh(cache, row_ranges)
+        if new_rows is None:
+            print("The Google Sheet has changed since the last download. Downloading the rows again...")
+            new_rows = self._refresh(None, row_ranges)
+        return new_rows
+
+    def _refresh(self, cache, row_ranges):
+        '''Returns the number of rows downloaded in full, or None if the cache no longer matches the sheet'''
+        import pandas as pd
+        rows = sorted({row for first, last in row_ranges for row in range(max(first, 2), last + 1)})
+        cached = set(cache.index) if cache is not None else set()
+        status, status_columns = [], None
+        ranges = [self.a1(1, 1)]
+        if cached:
+            last_seen = max(cached)
+            ranges.append(self.a1(last_seen, last_seen, last_column=self.first_column))
+            status = [cache.columns.get_loc(name) for name in STATUS_COLUMNS if name in cache.columns]
+            status_columns = (column_letter(column_index(self.first_column) + min(status)),
+                              column_letter(column_index(self.first_column) + max(status))) if status else None
+        segments = row_segments(rows, cached)
+        for first, last, is_cached in segments:
+            if not is_cached:
+                ranges.append(self.a1(first, last))
+            elif status_columns:
+                ranges.append(self.a1(first, last, *status_columns))
+        # the keys of every row come with the same call, when the header (hence their columns) is known
+        key_ranges = self.key_ranges(list(cache.columns)) if cached else []
+        ranges += key_ranges
+
+        result = self.service.spreadsheets().values().batchGet(spreadsheetId=self.sheet_id, ranges=ranges,
+                                                               majorDimension='ROWS').execute()
+        value_ranges = [value_range.get('values', []) for value_range in result.get('valueRanges', [])]
+        header = normalize_header(value_ranges[0][0] if value_ranges[0] else [], self.width)
+        values = iter(value_ranges[1:])
+
+        if cached:
+            check = next(values)
+            if list(cache.columns) != header or not check or check[0][0] != cache.loc[last_seen, header[0]]:
+                return None
+        else:
+            cache = pd.DataFrame(columns=header)
+
+        downloaded = {}
+        for first, last, is_cached in segments:
+            if is_cached and not status_columns:
+                continue
+            segment_values = next(values)
+            if not is_cached:
+                for offset, row_values in enumerate(segment_values):
+                    if any(row_values): # the sheet returns [] for empty rows; they are downloaded again next time
+                        downloaded[first + offset] = row_values + [''] * (self.width - len(row_values))
+                continue
+            # the trailing rows whose statuses were all cleared are left out of the answer: clear them too
+            first_status = column_index(status_columns[0]) - column_index(self.first_column)
+            status_width = max(status) - min(status) + 1
+            segment_values = segment_values + [[]] * (last - first + 1 - len(segment_values))
+            for offset, row_values in enumerate(segment_values):
+                row_values = row_values + [''] * (status_width - len(row_values))
+                for i, value in enumerate(row_values):
+                    cache.iat[cache.index.get_loc(first + offset), first_status + i] = value
+        if downloaded:
+            new = pd.DataFrame.from_dict(downloaded, orient='index', columns=header)
+            cache = new if cache.empty else pd.concat([cache, new])
+        cache = cache.sort_index()
+        cache.index.name = ROW_COLUMN
+        cache.to_csv(self.csv_path)
+
+        if key_ranges:
+            self._save_keys(list(values))
+        elif not cached and self.key_ranges(header): # first download: the header was not known yet
+            result = self.service.spreadsheets().values().batchGet(spreadsheetId=self.sheet_id,
+                                                                   ranges=self.key_ranges(header),
+                                                                   majorDimension='ROWS').execute()
+            self._save_keys([value_range.get('values', []) for value_range in result.get('valueRanges', [])])
+        return len(downloaded)
+
+
+class StatusWriteError(Exception):
+    pass
+
+
+class StatusWriter():
+    '''
+    Collects updates of the status columns during a run and writes them back to the sheet on flush.
+
+    Optimistic concurrency: the cells are expected to still hold what we last read (the values cached in
+    the csv). Just before writing, they are read again, and the rows where any of them changed (e.g. another
+    TA edited them) are left alone and reported as conflicts. The Sheets API has no conditional writes, so
+    this narrows the window for lost updates to the time between the two calls of a flush.
+    '''
+
+    def __init__(self, service, sheet_id, sheet_range, csv_path=RESPONSES_CSV):
+        '''
+        service: a Google Sheets service with write access (see sheets_service and WRITE_SCOPES)
+        '''
+        self.service = service
+        self.sheet_id = sheet_id
+        self.sheet, self.first_column, _ = split_range(sheet_range)
+        self.csv_path = csv_path
+        self.updates = {} # row -> {column name: value}
+        self.lock = threading.Lock()
+
+    def update(self, row, values):
+        '''Queue writing values ({column name: value}) to a row, for the next flush'''
+        with self.lock:
+            self.updates.setdefault(int(row), {}).update(values)
+
+    def flush(self):
+        '''
+        Write the queued updates with a single batchUpdate.
+        Returns the list of rows written, and a dict of row -> {column name: current value} for the rows that
+        were skipped because they changed in the sheet.
+        Raises StatusWriteError, with the updates still queued, when the rows were not downloaded by
+        ResponsesSheet (e.g. a hand-downloaded csv), as their sheet row numbers and last values are unknown.
+        '''
+        cache = read_cached_responses(self.csv_path)
+        if cache is None:
+            raise StatusWriteError(f"{self.csv_path} was not downloaded by this script, so the rows to update "
+                                   f"in the sheet are unknown. Run the script with Google Sheets access first.")
+        with self.lock:
+            updates, self.updates = self.updates, {}
+        if not updates:
+            return [], {}
+        try:
+            return self._write(updates, cache)
+        except Exception:
+            # queue them again (under the newer updates), so that a later flush can retry
+            with self.lock:
+                for row, values in updates.items():
+                    self.updates[row] = {**values, **self.updates.get(row, {})}
+            raise
+
+    def _write(self, updates, cache):
+        header = list(cache.columns)
+
+        def cell(row, column):
+            return f"'{self.sheet}'!{column_letter(column_index(self.first_column) + header.index(column))}{row}"
+
+        cells = [(row, column) for row, values in updates.items() for column in values]
+        result = self.service.spreadsheets().values().batchGet(spreadsheetId=self.sheet_id,
+                                                               ranges=[cell(row, column) for row, column in cells],
+                                                               majorDimension='ROWS').execute()
+        current = {}
+        for (row, column), value_range in zip(cells, result.get('valueRanges', [])):
+            values = value_range.get('values', [])
+            current[row, column] = values[0][0] if values and values[0] else ''
+
+        conflicts = {}
+        for row, values in updates.items():
+            changed = {column: current[row, column] for column in values
+                       if current[row, column] != (cache.at[row, column] if row in cache.index else '')}
+            if changed:
+                conflicts[row] = changed
+
+        written = sorted(row for row in updates if row not in conflicts)
+        data = [{'range': cell(row, column), 'values': [[value]]}
+                for row in written for column, value in updates[row].items()]
+        if data:
+            self.service.spreadsheets().values().batchUpdate(spreadsheetId=self.sheet_id,
+                                                             body={'valueInputOption': 'RAW', 'data': data}).execute()
+            for row in written:
+                for column, value in updates[row].items():
+                    if row in cache.index:
+                        cache.at[row, column] = value
+            cache.to_csv(self.csv_path)
+        return written, conflicts